@@ -0,0 +1,6 @@
+"""Contains benchmarks measuring the performance of the risk report.
+
+The benchmarks are executed as modules from the repository root folder, e.g.
+
+    python -m benchmarks.bench_prices
+"""
@@ -0,0 +1,105 @@
+"""Benchmark of entity construction, validated and trusted.
+
+Times the construction of prices, positions and key figure values with their
+validating constructors and with create_trusted, and measures the memory per
+object with tracemalloc. Also times the hydration of all prices of a synthetic
+database with RiskDbAccessor.get_prices, which uses create_trusted.
+
+Usage (from the repository root folder):
+
+    python -m benchmarks.bench_entities
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from typing import Any, Callable
+from modules.api.db import RiskDbAccessor
+from modules.types import *
+from .synthetic_db import create_schema, insert_prices
+
+OBJECT_COUNT: int = 200_000
+DAY_COUNT: int = 1000
+INSTRUMENT_COUNT: int = 200
+
+
+def measure(create: Callable[[int], Any], count: int) -> tuple[float, float]:
+    """Measures the construction of objects.
+
+    Args:
+        create: A function creating an object from its index.
+        count: The number of objects to create.
+
+    Returns:
+        A tuple of the time per object in microseconds and the memory per
+        object in bytes, including the list holding the objects.
+    """
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    objects: list[Any] = [create(i) for i in range(count)]
+    elapsed: float = time.perf_counter() - start
+    memory: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return elapsed / count * 1e6, memory / count
+
+
+def main() -> None:
+    instrument: Instrument = Equity(1, "Equity 1")
+    portfolio: Portfolio = Portfolio(1, "PF 1")
+    ref_type: KeyFigureRefType = KeyFigureRefType(3, "Portfolio")
+    key_figure: KeyFigure = KeyFigure(1, "Market value")
+    date_: date = date(2024, 1, 1)
+    benchmarks: dict[str, tuple[Callable[[int], Any], Callable[[int], Any]]] = {
+        "Price": (
+            lambda i: Price(i, instrument, date_, 100.0),
+            lambda i: Price.create_trusted(i, instrument, date_, 100.0),
+        ),
+        "Position": (
+            lambda i: Position.create(i, portfolio, instrument, date_, date_, 1.0),
+            lambda i: Position.create_trusted(
+                i, portfolio, instrument, date_, date_, 1.0
+            ),
+        ),
+        "KeyFigureValue": (
+            lambda i: KeyFigureValue(i, date_, 1.0, ref_type, portfolio, key_figure),
+            lambda i: KeyFigureValue.create_trusted(
+                i, date_, 1.0, ref_type, portfolio, key_figure
+            ),
+        ),
+    }
+    print(
+        f"{'entity':>16} {'validated (us)':>15} {'trusted (us)':>13} "
+        f"{'bytes/object':>13}"
+    )
+    for name, (validated, trusted) in benchmarks.items():
+        validated_time, _ = measure(validated, OBJECT_COUNT)
+        trusted_time, memory = measure(trusted, OBJECT_COUNT)
+        print(
+            f"{name:>16} {validated_time:>15.2f} {trusted_time:>13.2f} "
+            f"{memory:>13.1f}"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path: str = os.path.join(tmp_dir, "bench.db")
+        create_schema(db_path)
+        insert_prices(db_path, INSTRUMENT_COUNT, date(2020, 1, 1), DAY_COUNT)
+        db: RiskDbAccessor
+        with RiskDbAccessor(db_path) as db:
+            db.get_instruments()
+            tracemalloc.start()
+            start: float = time.perf_counter()
+            prices: list[Price] = db.get_prices()
+            elapsed: float = time.perf_counter() - start
+            memory: int = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+    print(
+        f"get_prices: {len(prices)} prices in {elapsed:.3f} s, "
+        f"{memory / len(prices):.1f} bytes/price"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark of the market value series of a portfolio over a date range.
+
+Times MarketValueEngine.market_values for a 5 year daily range of a portfolio
+holding every instrument in the database.
+
+Usage (from the repository root folder):
+
+    python -m benchmarks.bench_market_value
+"""
+
+import os
+import tempfile
+import timeit
+from datetime import date, timedelta
+from modules.api.db import RiskDbAccessor
+from modules.risk import MarketValueEngine
+from .synthetic_db import create_schema, insert_prices, insert_portfolio
+
+DATE_FROM: date = date(2019, 1, 1)
+DAY_COUNT: int = 5 * 365 + 1
+INSTRUMENT_COUNTS: list[int] = [10, 50, 200]
+REPETITIONS: int = 5
+
+
+def main() -> None:
+    date_to: date = DATE_FROM + timedelta(days=DAY_COUNT - 1)
+    print(f"{'instruments':>12} {'days':>6} {'market values (ms)':>20}")
+    for instrument_count in INSTRUMENT_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path: str = os.path.join(tmp_dir, "bench.db")
+            create_schema(db_path)
+            insert_prices(db_path, instrument_count, DATE_FROM, DAY_COUNT)
+            insert_portfolio(
+                db_path,
+                "BENCH",
+                list(range(1, instrument_count + 1)),
+                DATE_FROM,
+                date(3000, 1, 1),
+            )
+            db: RiskDbAccessor
+            with RiskDbAccessor(db_path) as db:
+                engine: MarketValueEngine = MarketValueEngine(db)
+                portfolio = db.get_portfolio_from_name("BENCH")
+                total: float = timeit.timeit(
+                    lambda: engine.market_values(portfolio, DATE_FROM, date_to),
+                    number=REPETITIONS,
+                )
+        print(
+            f"{instrument_count:>12} {DAY_COUNT:>6} "
+            f"{total / REPETITIONS * 1000:>20.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
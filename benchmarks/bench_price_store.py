@@ -0,0 +1,68 @@
+"""Benchmark of PriceStore against Price objects for growing Prices tables.
+
+Compares the time and memory it takes to load all prices as Price objects with
+RiskDbAccessor.get_prices, as a PriceStore, and as a PriceStore memory-mapped
+from a snapshot file.
+
+Usage (from the repository root folder):
+
+    python -m benchmarks.bench_price_store
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from typing import Any, Callable
+from modules.api.db import RiskDbAccessor, PriceStore
+from .synthetic_db import create_schema, insert_prices
+
+DAY_COUNT: int = 1000
+INSTRUMENT_COUNTS: list[int] = [10, 100, 1000]
+
+
+def measure(load: Callable[[], Any]) -> tuple[float, float]:
+    """Measures the time and peak memory of a load.
+
+    Returns:
+        A tuple of the time in seconds and the peak memory in MB.
+    """
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    result: Any = load()
+    elapsed: float = time.perf_counter() - start
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return elapsed, peak / 1e6
+
+
+def main() -> None:
+    print(
+        f"{'rows':>10} {'objects (s)':>12} {'objects (MB)':>13} {'store (s)':>10} "
+        f"{'store (MB)':>11} {'mmap (s)':>9} {'mmap (MB)':>10}"
+    )
+    for instrument_count in INSTRUMENT_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path: str = os.path.join(tmp_dir, "bench.db")
+            snapshot_path: str = os.path.join(tmp_dir, "prices.snapshot")
+            create_schema(db_path)
+            insert_prices(db_path, instrument_count, date(2020, 1, 1), DAY_COUNT)
+
+            db: RiskDbAccessor
+            with RiskDbAccessor(db_path) as db:
+                db.get_instruments()
+                objects = measure(db.get_prices)
+                store = measure(lambda: PriceStore.from_db(db))
+                PriceStore.from_db(db).save(snapshot_path)
+            mapped = measure(lambda: PriceStore.open(snapshot_path))
+        print(
+            f"{instrument_count * DAY_COUNT:>10} {objects[0]:>12.3f} "
+            f"{objects[1]:>13.1f} {store[0]:>10.3f} {store[1]:>11.1f} "
+            f"{mapped[0]:>9.4f} {mapped[1]:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark of RiskDbAccessor.get_prices for growing Prices tables.
+
+Times the lookup of a single price, which is the lookup performed by
+RiskFigureGenerator for every position and date, with and without the
+(instrument_id, date) index.
+
+Usage (from the repository root folder):
+
+    python -m benchmarks.bench_prices
+"""
+
+import os
+import tempfile
+import timeit
+from datetime import date, timedelta
+from modules.api.db import RiskDbAccessor
+from modules.types import Instrument
+from .synthetic_db import create_schema, insert_prices
+
+DAY_COUNT: int = 1000
+INSTRUMENT_COUNTS: list[int] = [10, 100, 1000]
+REPETITIONS: int = 20
+
+
+def time_price_lookup(db_path: str, instrument_count: int, *, indexed: bool) -> float:
+    """Times a single price lookup.
+
+    Args:
+        db_path: The path to the database.
+        instrument_count: The number of instruments in the database.
+        indexed: If False, the (instrument_id, date) index is dropped first.
+
+    Returns:
+        The average time of a lookup in seconds.
+    """
+    price_date: date = date(2020, 1, 1) + timedelta(days=DAY_COUNT // 2)
+    db: RiskDbAccessor
+    with RiskDbAccessor(db_path) as db:
+        if not indexed:
+            # Dropped after entering the runtime context, which applies migrations.
+            db._db_accessor.execute_query('drop index if exists "U_Prices";')
+        instrument: Instrument = db.get_instrument(instrument_count // 2 + 1)
+        total: float = timeit.timeit(
+            lambda: db.get_prices(
+                instrument=instrument, date_from=price_date, date_to=price_date
+            ),
+            number=REPETITIONS,
+        )
+    return total / REPETITIONS
+
+
+def main() -> None:
+    print(f"{'rows':>10} {'indexed (ms)':>14} {'full scan (ms)':>16}")
+    for instrument_count in INSTRUMENT_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path: str = os.path.join(tmp_dir, "bench.db")
+            create_schema(db_path)
+            insert_prices(db_path, instrument_count, date(2020, 1, 1), DAY_COUNT)
+            indexed: float = time_price_lookup(db_path, instrument_count, indexed=True)
+            scan: float = time_price_lookup(db_path, instrument_count, indexed=False)
+        print(
+            f"{instrument_count * DAY_COUNT:>10} {indexed * 1000:>14.3f} "
+            f"{scan * 1000:>16.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
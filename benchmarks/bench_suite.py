@@ -0,0 +1,201 @@
+"""Benchmark suite of RiskFigureGenerator and RiskReport across database scales.
+
+Generates a synthetic database for every scale, times every public method of
+RiskFigureGenerator and a full risk report against it, and writes the results
+to a JSON file. Results of two runs, e.g. of two releases, can be compared
+with --baseline, which prints the relative change of every timing.
+
+Usage (from the repository root folder):
+
+    python -m benchmarks.bench_suite [--scales small,medium] [--repetitions 5]
+        [--output benchmark_results.json] [--baseline previous_results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable
+from modules.api.db import RiskDbAccessor
+from modules.risk import RiskFigureGenerator, RiskReport, RiskReportSettings
+from modules.risk.risk_figure_generator import VOLATILITY_WINDOW_DAYS
+from .synthetic_db import SyntheticDbSpec, create_synthetic_db
+
+SCALES: dict[str, SyntheticDbSpec] = {
+    "small": SyntheticDbSpec(
+        instrument_count=10, portfolio_count=4, positions_per_portfolio=5, years=1
+    ),
+    "medium": SyntheticDbSpec(
+        instrument_count=100,
+        portfolio_count=20,
+        positions_per_portfolio=25,
+        position_changes=2,
+        years=3,
+        key_figure_value_days=365,
+    ),
+    "large": SyntheticDbSpec(
+        instrument_count=500,
+        portfolio_count=50,
+        positions_per_portfolio=100,
+        position_changes=4,
+        years=5,
+        key_figure_value_days=365,
+    ),
+}
+KEY_FIGURES: list[str] = ["Market value", "Return (1D)", "Volatility (3M, ann.)"]
+# Relative slowdown above which a timing is reported as a regression.
+REGRESSION_THRESHOLD: float = 0.1
+
+
+def time_call(function: Callable[[], Any], repetitions: int) -> dict[str, Any]:
+    """Times repeated calls of a function.
+
+    Returns:
+        The mean, minimum and maximum time of a call in seconds.
+    """
+    timings: list[float] = []
+    for _ in range(repetitions):
+        start: float = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "mean": statistics.fmean(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "repetitions": repetitions,
+    }
+
+
+def run_scale(spec: SyntheticDbSpec, repetitions: int) -> dict[str, Any]:
+    """Generates a database for a scale and times the benchmarks against it.
+
+    The report date range is the last year of prices, or as much of it as
+    leaves room for the volatility window before the first date.
+
+    Returns:
+        The spec, the time to generate the database and the timings.
+    """
+    date_to: date = spec.date_to
+    date_from: date = max(
+        date_to - timedelta(days=364),
+        spec.date_from + timedelta(days=VOLATILITY_WINDOW_DAYS + 1),
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path: str = os.path.join(tmp_dir, "bench.db")
+        start: float = time.perf_counter()
+        create_synthetic_db(db_path, spec)
+        generation_time: float = time.perf_counter() - start
+
+        rfg: RiskFigureGenerator = RiskFigureGenerator(RiskDbAccessor(db_path))
+        portfolio: str = "PF 1"
+        benchmarks: dict[str, Callable[[], Any]] = {
+            "market_value_for_portfolio_and_date": lambda: (
+                rfg.market_value_for_portfolio_and_date(portfolio, date_to)
+            ),
+            "market_value_for_portfolio_and_date_range": lambda: (
+                rfg.market_value_for_portfolio_and_date_range(
+                    portfolio, date_from, date_to
+                )
+            ),
+            "return_1D_for_portfolio_and_date": lambda: (
+                rfg.return_1D_for_portfolio_and_date(portfolio, date_to)
+            ),
+            "return_1D_for_portfolio_and_date_range": lambda: (
+                rfg.return_1D_for_portfolio_and_date_range(
+                    portfolio, date_from, date_to
+                )
+            ),
+            "volatility_3M_ann_for_portfolio_and_date": lambda: (
+                rfg.volatility_3M_ann_for_portfolio_and_date(portfolio, date_to)
+            ),
+            "volatility_3M_ann_for_portfolio_and_date_range": lambda: (
+                rfg.volatility_3M_ann_for_portfolio_and_date_range(
+                    portfolio, date_from, date_to
+                )
+            ),
+            "iter_return_1D_cumulative_series": lambda: list(
+                rfg.iter_return_1D_cumulative_series(portfolio, date_from, date_to)
+            ),
+            "return_1D_cumulative_series": lambda: (
+                rfg.return_1D_cumulative_series(portfolio, date_from, date_to)
+            ),
+            "risk_report": lambda: RiskReport(
+                RiskReportSettings(portfolio, date_from, date_to, KEY_FIGURES),
+                risk_figure_generator=rfg,
+            ).generate(),
+        }
+        timings: dict[str, dict[str, Any]] = {
+            name: time_call(function, repetitions)
+            for name, function in benchmarks.items()
+        }
+    return {
+        "spec": spec.to_dict(),
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "generation_time": generation_time,
+        "timings": timings,
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """Compares the mean timings of two runs.
+
+    Returns:
+        One line for every timing present in both runs, with the relative
+        change of the mean, flagged if it exceeds REGRESSION_THRESHOLD.
+    """
+    lines: list[str] = []
+    for scale, result in results["scales"].items():
+        if scale not in baseline["scales"]:
+            continue
+        for name, timing in result["timings"].items():
+            previous: dict[str, Any] | None = baseline["scales"][scale][
+                "timings"
+            ].get(name)
+            if previous is None:
+                continue
+            change: float = timing["mean"] / previous["mean"] - 1.0
+            flag: str = " REGRESSION" if change > REGRESSION_THRESHOLD else ""
+            lines.append(f"{scale:>8} {name:<48} {change:>+8.1%}{flag}")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="small,medium")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None)
+    args = parser.parse_args()
+
+    results: dict[str, Any] = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "scales": {},
+    }
+    for scale in args.scales.split(","):
+        results["scales"][scale] = run_scale(SCALES[scale], args.repetitions)
+        for name, timing in results["scales"][scale]["timings"].items():
+            print(f"{scale:>8} {name:<48} {timing['mean'] * 1000:>10.2f} ms")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline: dict[str, Any] = json.load(file)
+        print("\n".join(compare(results, baseline)))
+
+
+if __name__ == "__main__":
+    main()
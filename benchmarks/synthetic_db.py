@@ -0,0 +1,307 @@
+"""Contains functions for generating synthetic risk report databases.
+
+The schema of a synthetic database is copied from the risk report database
+shipped with the repository, so that benchmarks run against the same tables
+and indexes as the program itself.
+"""
+
+__all__: list[str] = [
+    "SyntheticDbSpec",
+    "create_schema",
+    "insert_prices",
+    "insert_portfolio",
+    "create_synthetic_db",
+]
+
+import sqlite3
+from contextlib import closing
+from datetime import date, timedelta
+from typing import Any
+import random
+
+SOURCE_DB_PATH: str = "./db/alecta_case_db.db"
+REFERENCE_TABLES: list[str] = ["InstrumentType", "KeyFigure", "KeyFigureRefType"]
+# Ids of the reference data rows in the source database.
+EQUITY_TYPE_ID: int = 1
+BOND_TYPE_ID: int = 2
+PORTFOLIO_REF_TYPE_ID: int = 3
+MARKET_VALUE_KEY_FIGURE_ID: int = 1
+# The date_to of open positions, as used in the source database.
+OPEN_DATE_TO: date = date(3000, 1, 1)
+
+
+class SyntheticDbSpec:
+    """Type describing the content of a synthetic database.
+
+    Attributes:
+        instrument_count: The number of instruments.
+        bond_share: The share of the instruments which are bonds, the rest are equities.
+        portfolio_count: The number of portfolios.
+        positions_per_portfolio: The number of instruments held by every portfolio.
+        position_changes: The number of times the quantity of every holding
+            changes, i.e. every holding has position_changes + 1 positions.
+        years: The number of years of daily prices.
+        key_figure_value_days: The number of days, counted back from the last
+            price date, with a stored market value for every portfolio.
+        date_from: The date of the first price.
+        seed: The seed of the random number generator.
+    """
+
+    def __init__(
+        self,
+        *,
+        instrument_count: int = 10,
+        bond_share: float = 0.2,
+        portfolio_count: int = 4,
+        positions_per_portfolio: int = 5,
+        position_changes: int = 0,
+        years: int = 1,
+        key_figure_value_days: int = 0,
+        date_from: date = date(2020, 1, 1),
+        seed: int = 0,
+    ) -> None:
+        if positions_per_portfolio > instrument_count:
+            raise ValueError("positions_per_portfolio must be <= instrument_count.")
+        self.instrument_count = instrument_count
+        self.bond_share = bond_share
+        self.portfolio_count = portfolio_count
+        self.positions_per_portfolio = positions_per_portfolio
+        self.position_changes = position_changes
+        self.years = years
+        self.key_figure_value_days = key_figure_value_days
+        self.date_from = date_from
+        self.seed = seed
+
+    @property
+    def day_count(self) -> int:
+        """The number of daily prices of every instrument."""
+        return self.years * 365
+
+    @property
+    def date_to(self) -> date:
+        """The date of the last price."""
+        return self.date_from + timedelta(days=self.day_count - 1)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Gets the spec, suitable for JSON serialization."""
+        return {
+            "instrument_count": self.instrument_count,
+            "bond_share": self.bond_share,
+            "portfolio_count": self.portfolio_count,
+            "positions_per_portfolio": self.positions_per_portfolio,
+            "position_changes": self.position_changes,
+            "years": self.years,
+            "key_figure_value_days": self.key_figure_value_days,
+            "date_from": self.date_from.isoformat(),
+            "seed": self.seed,
+        }
+
+
+def create_schema(db_path: str, source_db_path: str = SOURCE_DB_PATH) -> None:
+    """Creates an empty database with the schema of the source database.
+
+    The reference data tables (instrument types, key figures and key figure
+    ref types) are copied as well, since the program relies on their content.
+
+    Args:
+        db_path: The path of the database to create.
+        source_db_path: The path of the database to copy the schema from.
+    """
+    with closing(sqlite3.connect(source_db_path)) as source:
+        statements: list[str] = [
+            row[0]
+            for row in source.execute(
+                "select sql from sqlite_master where sql is not null "
+                "and name != 'sqlite_sequence' "
+                "order by case type when 'table' then 0 when 'index' then 1 else 2 end;"
+            )
+        ]
+        reference_data: dict[str, list[tuple]] = {
+            table: source.execute(f"select id, name from {table};").fetchall()
+            for table in REFERENCE_TABLES
+        }
+        user_version: int = source.execute("pragma user_version;").fetchone()[0]
+
+    with closing(sqlite3.connect(db_path)) as target:
+        for statement in statements:
+            target.execute(statement)
+        for table, rows in reference_data.items():
+            target.executemany(f"insert into {table} (id, name) values (?, ?);", rows)
+        target.execute(f"pragma user_version = {user_version};")
+        target.commit()
+
+
+def insert_prices(
+    db_path: str,
+    instrument_count: int,
+    date_from: date,
+    day_count: int,
+    /,
+    *,
+    seed: int = 0,
+    bond_share: float = 0.0,
+) -> None:
+    """Inserts instruments with random walk prices into a database.
+
+    Args:
+        db_path: The path of the database.
+        instrument_count: The number of instruments to create.
+        date_from: The date of the first price of every instrument.
+        day_count: The number of daily prices to create for every instrument.
+        seed: The seed of the random number generator.
+        bond_share: The share of the instruments which are bonds, the rest
+            are equities. Bond prices are quoted in percent of the notional.
+    """
+    rng = random.Random(seed)
+    bond_count: int = round(instrument_count * bond_share)
+    with closing(sqlite3.connect(db_path)) as connection:
+        for instrument_id in range(1, instrument_count + 1):
+            is_bond: bool = instrument_id > instrument_count - bond_count
+            connection.execute(
+                "insert into Instrument (id, name, instrument_type_id) values (?, ?, ?);",
+                (
+                    instrument_id,
+                    f"{'Bond' if is_bond else 'Equity'} {instrument_id}",
+                    BOND_TYPE_ID if is_bond else EQUITY_TYPE_ID,
+                ),
+            )
+            volatility: float = 0.002 if is_bond else 0.01
+            price: float = 100.0
+            rows: list[tuple[int, str, float]] = []
+            for day in range(day_count):
+                rows.append(
+                    (
+                        instrument_id,
+                        (date_from + timedelta(days=day)).isoformat(),
+                        price,
+                    )
+                )
+                price = price * (1.0 + rng.gauss(0.0, volatility))
+            connection.executemany(
+                "insert into Prices (instrument_id, date, price) values (?, ?, ?);",
+                rows,
+            )
+        connection.commit()
+
+
+def insert_portfolio(
+    db_path: str,
+    name: str,
+    instrument_ids: list[int],
+    date_from: date,
+    date_to: date,
+    /,
+    *,
+    quantity: float = 100.0,
+) -> int:
+    """Inserts a portfolio holding a position in each of the provided instruments.
+
+    Args:
+        db_path: The path of the database.
+        name: The name of the portfolio.
+        instrument_ids: The ids of the instruments to hold.
+        date_from: The first date of the positions.
+        date_to: The last date of the positions.
+        quantity: The quantity of every position.
+
+    Returns:
+        The id of the portfolio.
+    """
+    with closing(sqlite3.connect(db_path)) as connection:
+        portfolio_id: int = connection.execute(
+            "insert into Portfolio (name) values (?);", (name,)
+        ).lastrowid
+        connection.executemany(
+            "insert into Position (date_from, date_to, portfolio_id, instrument_id"
+            ", quantity) values (?, ?, ?, ?, ?);",
+            [
+                (
+                    date_from.isoformat(),
+                    date_to.isoformat(),
+                    portfolio_id,
+                    instrument_id,
+                    quantity,
+                )
+                for instrument_id in instrument_ids
+            ],
+        )
+        connection.commit()
+    return portfolio_id
+
+
+def create_synthetic_db(db_path: str, spec: SyntheticDbSpec) -> None:
+    """Creates a synthetic database with the content described by a spec.
+
+    Every portfolio holds a random sample of the instruments, from the first
+    price date onwards. The quantity of every holding changes position_changes
+    times, at random dates, and the last position of every holding is open.
+
+    Args:
+        db_path: The path of the database to create.
+        spec: The content of the database.
+    """
+    rng = random.Random(spec.seed)
+    create_schema(db_path)
+    insert_prices(
+        db_path,
+        spec.instrument_count,
+        spec.date_from,
+        spec.day_count,
+        seed=spec.seed,
+        bond_share=spec.bond_share,
+    )
+    bond_count: int = round(spec.instrument_count * spec.bond_share)
+    with closing(sqlite3.connect(db_path)) as connection:
+        for p in range(1, spec.portfolio_count + 1):
+            portfolio_id: int = connection.execute(
+                "insert into Portfolio (name) values (?);", (f"PF {p}",)
+            ).lastrowid
+            rows: list[tuple[str, str, int, int, float]] = []
+            for instrument_id in rng.sample(
+                range(1, spec.instrument_count + 1), spec.positions_per_portfolio
+            ):
+                is_bond: bool = instrument_id > spec.instrument_count - bond_count
+                change_days: list[int] = sorted(
+                    rng.sample(range(1, spec.day_count), spec.position_changes)
+                )
+                starts: list[int] = [0] + change_days
+                ends: list[int] = [d - 1 for d in change_days]
+                for start, end in zip(starts, ends + [None]):
+                    quantity: float = (
+                        rng.randrange(1, 100) * 1000.0
+                        if is_bond
+                        else float(rng.randrange(1, 1000))
+                    )
+                    rows.append(
+                        (
+                            (spec.date_from + timedelta(days=start)).isoformat(),
+                            (
+                                OPEN_DATE_TO
+                                if end is None
+                                else spec.date_from + timedelta(days=end)
+                            ).isoformat(),
+                            portfolio_id,
+                            instrument_id,
+                            quantity,
+                        )
+                    )
+            connection.executemany(
+                "insert into Position (date_from, date_to, portfolio_id, instrument_id"
+                ", quantity) values (?, ?, ?, ?, ?);",
+                rows,
+            )
+            connection.executemany(
+                "insert into KeyFigureValue (date, value, ref_type, ref_entity_id"
+                ", key_figure_id) values (?, ?, ?, ?, ?);",
+                [
+                    (
+                        (spec.date_to - timedelta(days=d)).isoformat(),
+                        rng.uniform(1e6, 1e7),
+                        PORTFOLIO_REF_TYPE_ID,
+                        portfolio_id,
+                        MARKET_VALUE_KEY_FIGURE_ID,
+                    )
+                    for d in range(spec.key_figure_value_days)
+                ],
+            )
+        connection.commit()
@@ -6,6 +6,29 @@ How to run this script:
 portfolio, date range and key figures.
 
 - Run script from command line: python main.py
+
+- To generate the reports of every portfolio in parallel instead,
+run: python main.py --batch
+
+- To load a price file, such as db/prices.csv, into the database,
+run: python main.py --load-prices ./db/prices.csv [--rebuild-index]
+
+- To add the statements issued and the time spent in every step
+to the report, run: python main.py --diagnostics
+
+- To store the key figures of a new day for every portfolio, by advancing
+their saved rolling state, run: python main.py --end-of-day 2024-05-31
+
+- To store the volatilities of every instrument and portfolio, and the
+marginal and component risk of every position, computed from the covariance
+matrix of the instruments, run: python main.py --covariance-risk 2024-05-31
+
+- To compare the holdings materialized in the table HoldingSnapshot with
+holdings rebuilt from the positions, and optionally rebuild them,
+run: python main.py --check-holdings [--rebuild]
+
+- To serve reports over HTTP from a long-running process,
+run: python main.py --serve [--port 8000]
 """
 
 from modules.types import *
@@ -16,21 +39,86 @@ from modules.helpers.dateutilities import last_business_day
 from modules.types.position import Position
 from modules.types.key_figures import KeyFigureRefType
 from modules.api.db import db_accessor_factory, DbEngine, DbAccessor, RiskDbAccessor
+from modules.api.db import PriceLoader, PriceLoadResult
 from modules.risk import RiskFigureGenerator
-from modules.risk import RiskReportSettings, RiskReport
+from modules.risk import RiskReportSettings, RiskReport, BatchRiskReport
+from modules.risk import RiskReportServer, EndOfDayUpdater, CovarianceRiskEngine
 from typing import Any
 import json
 
 
 if __name__ == "__main__":
 
-    risk_report: RiskReport = RiskReport(
-        RiskReportSettings(
-            "EQ_US",  # Allowed values: EQ_US, EQ_SWE, FI_US, FI_SWE
-            date(2024, 1, 1),  # Must be >= 2024-01-01
-            date(2024, 5, 31),  # Must be <= 2024-05-31
+    if "--batch" in argv[1:]:
+        batch: BatchRiskReport = BatchRiskReport.for_all_portfolios(
+            date(2024, 1, 1),
+            date(2024, 5, 31),
             ["Market value", "Return (1D)", "Volatility (3M, ann.)"],
         )
-    )
-    output: dict[str, Any] = risk_report.generate()
-    print(json.dumps(output, indent=4))
+        print(json.dumps(batch.generate().summary(), indent=4))
+    elif "--load-prices" in argv[1:]:
+        loader: PriceLoader = PriceLoader(RiskDbAccessor())
+        result: PriceLoadResult = loader.load(
+            argv[argv.index("--load-prices") + 1],
+            rebuild_index="--rebuild-index" in argv[1:],
+        )
+        print(json.dumps(result.summary(), indent=4))
+    elif "--end-of-day" in argv[1:]:
+        updater: EndOfDayUpdater = EndOfDayUpdater()
+        updated: dict[str, list[KeyFigureValue]] = updater.advance_all(
+            date.fromisoformat(argv[argv.index("--end-of-day") + 1])
+        )
+        print(json.dumps({name: len(values) for name, values in updated.items()}))
+    elif "--covariance-risk" in argv[1:]:
+        engine: CovarianceRiskEngine = CovarianceRiskEngine()
+        covariance_risk: dict[str, Any] = engine.compute(
+            date.fromisoformat(argv[argv.index("--covariance-risk") + 1])
+        ).summary()
+        print(json.dumps(covariance_risk, indent=4))
+    elif "--check-holdings" in argv[1:]:
+        db: RiskDbAccessor
+        with RiskDbAccessor() as db:
+            differences: list[tuple[int, int, str, float, float]] = (
+                db.check_holding_snapshot()
+            )
+            if len(differences) > 0 and "--rebuild" in argv[1:]:
+                db.rebuild_holding_snapshot()
+        print(
+            json.dumps(
+                [
+                    dict(
+                        zip(
+                            [
+                                "portfolio_id",
+                                "instrument_id",
+                                "date",
+                                "expected",
+                                "actual",
+                            ],
+                            difference,
+                        )
+                    )
+                    for difference in differences
+                ],
+                indent=4,
+            )
+        )
+    elif "--serve" in argv[1:]:
+        port: int = 8000
+        if "--port" in argv[1:]:
+            port = int(argv[argv.index("--port") + 1])
+        server: RiskReportServer = RiskReportServer(port=port, access_log=True)
+        print(f"Serving risk reports on http://{server.host}:{port}/report")
+        server.serve_forever()
+    else:
+        risk_report: RiskReport = RiskReport(
+            RiskReportSettings(
+                "EQ_US",  # Allowed values: EQ_US, EQ_SWE, FI_US, FI_SWE
+                date(2024, 1, 1),  # Must be >= 2024-01-01
+                date(2024, 5, 31),  # Must be <= 2024-05-31
+                ["Market value", "Return (1D)", "Volatility (3M, ann.)"],
+            ),
+            diagnostics="--diagnostics" in argv[1:],
+        )
+        output: dict[str, Any] = risk_report.generate()
+        print(json.dumps(output, indent=4))
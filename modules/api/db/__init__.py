@@ -1,2 +1,8 @@
 from .dbaccessor import *
 from .risk_dbaccessor import *
+from .migrations import *
+from .identity_map import *
+from .price_store import *
+from .price_loader import *
+from .async_risk_dbaccessor import *
+from .position_index import *
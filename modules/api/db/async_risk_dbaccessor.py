@@ -0,0 +1,129 @@
+"""Contains an asyncio facade of the risk report database accessor."""
+
+__all__: list[str] = ["AsyncRiskDbAccessor"]
+
+from .risk_dbaccessor import RiskDbAccessor
+from ...types import *
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Callable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class AsyncRiskDbAccessor:
+    """Type used for reading from the risk report database from asyncio code.
+
+    SQLite calls are blocking, so every call is run on a thread pool with a
+    bounded number of worker threads, instead of on the event loop. Every
+    worker thread uses its own pooled connection, see SQLiteDbAccesssor, and
+    all threads share the reference data cached by the RiskDbAccessor.
+
+    Example usage:
+        async with AsyncRiskDbAccessor() as db:
+            portfolio = await db.get_portfolio_from_name("EQ_US")
+            positions = await db.get_positions(portfolio=portfolio)
+
+    Attributes:
+        risk_db_accessor: The accessor the calls are made with.
+        max_workers: The maximum number of worker threads.
+    """
+
+    def __init__(
+        self,
+        risk_db_accessor: RiskDbAccessor | None = None,
+        *,
+        max_workers: int = 4,
+    ) -> None:
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be >= 1, argument is {max_workers}.")
+        if risk_db_accessor is None:
+            risk_db_accessor = RiskDbAccessor()
+        self.risk_db_accessor = risk_db_accessor
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="AsyncRiskDbAccessor"
+        )
+
+    async def __aenter__(self) -> "AsyncRiskDbAccessor":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Shuts down the worker threads, after the pending calls have completed."""
+        self._executor.shutdown(wait=True)
+
+    async def run(
+        self,
+        function: Callable[[RiskDbAccessor], T],
+        *,
+        risk_db_accessor: RiskDbAccessor | None = None,
+    ) -> T:
+        """Runs a function on a worker thread, within a database session.
+
+        Args:
+            function: A callable taking the open RiskDbAccessor as argument.
+            risk_db_accessor: The accessor whose session the function runs in,
+                by default the risk_db_accessor attribute.
+
+        Returns:
+            The return value of function.
+        """
+        if risk_db_accessor is None:
+            risk_db_accessor = self.risk_db_accessor
+
+        def run_in_session() -> T:
+            db: RiskDbAccessor
+            with risk_db_accessor as db:
+                return function(db)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, run_in_session
+        )
+
+    async def get_instruments(self) -> list[Instrument]:
+        """See RiskDbAccessor.get_instruments."""
+        return await self.run(lambda db: db.get_instruments())
+
+    async def get_portfolios(self) -> list[Portfolio]:
+        """See RiskDbAccessor.get_portfolios."""
+        return await self.run(lambda db: db.get_portfolios())
+
+    async def get_portfolio_from_name(self, name: str) -> Portfolio | None:
+        """See RiskDbAccessor.get_portfolio_from_name."""
+        return await self.run(lambda db: db.get_portfolio_from_name(name))
+
+    async def get_key_figures(self) -> list[KeyFigure]:
+        """See RiskDbAccessor.get_key_figures."""
+        return await self.run(lambda db: db.get_key_figures())
+
+    async def get_positions(self, **kwargs: Any) -> list[Position]:
+        """See RiskDbAccessor.get_positions."""
+        return await self.run(lambda db: db.get_positions(**kwargs))
+
+    async def get_prices(self, **kwargs: Any) -> list[Price]:
+        """See RiskDbAccessor.get_prices."""
+        return await self.run(lambda db: db.get_prices(**kwargs))
+
+    async def get_price_rows(self, **kwargs: Any) -> list[tuple[int, int, str, float]]:
+        """See RiskDbAccessor.get_price_rows."""
+        return await self.run(lambda db: db.get_price_rows(**kwargs))
+
+    async def get_key_figure_values_for_range(
+        self,
+        key_figure: KeyFigure,
+        key_figure_ref_type: KeyFigureRefType,
+        reference_entity: BaseEntity,
+        date_from: date,
+        date_to: date,
+        /,
+    ) -> list[KeyFigureValue]:
+        """See RiskDbAccessor.get_key_figure_values_for_range."""
+        return await self.run(
+            lambda db: db.get_key_figure_values_for_range(
+                key_figure, key_figure_ref_type, reference_entity, date_from, date_to
+            )
+        )
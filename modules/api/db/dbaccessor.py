@@ -4,12 +4,18 @@ __all__: list[str] = [
     "DbEngine",
     "db_accessor_factory",
     "DbAccessor",
+    "SQLiteConnectionPool",
+    "configure_connection_pool",
     "SQLiteDbAccesssor",
 ]
 
+from ...helpers.instrumentation import MetricsSink, statement_shape
+import os
 import sqlite3
-from typing import Any
-from contextlib import closing
+import threading
+import time
+from typing import Any, Iterable, Iterator
+from contextlib import closing, contextmanager
 from abc import ABC, abstractmethod
 from enum import Enum
 
@@ -25,7 +31,7 @@ class DbAccessor(ABC):
 
     @abstractmethod
     def __init__(self):
-        self._is_open = False
+        pass
 
     @abstractmethod
     def connect(self) -> None:
@@ -56,6 +62,25 @@ class DbAccessor(ABC):
 
         raise NotImplementedError
 
+    @abstractmethod
+    def iter_select_query(
+        self, query: str, parameters: tuple[Any, ...] = (), *, batch_size: int = 1000
+    ) -> Iterator[list[Any]]:
+        """Executes a query and yields the rows in batches, without loading all rows.
+
+        The accessor must remain open while iterating.
+
+        Args:
+            query: The SQL query to execute, using ? as placeholders for parameters.
+            parameters: A tuple of parameters.
+            batch_size: The maximum number of rows per batch.
+
+        Yields:
+            Lists of at most batch_size rows, where each row is a tuple.
+        """
+
+        raise NotImplementedError
+
     @abstractmethod
     def execute_query(self, query: str, parameters: tuple[Any, ...] = ()) -> int:
         """Executes a query against the database and returns the number of affected rows.
@@ -84,10 +109,203 @@ class DbAccessor(ABC):
 
         raise NotImplementedError
 
+    @abstractmethod
+    def execute_many(
+        self, query: str, parameters: Iterable[tuple[Any, ...]] = ()
+    ) -> int:
+        """Executes a query once for every tuple of parameters and returns the number of affected rows.
+
+        Args:
+            query: The SQL query to execute, using ? as placeholders for parameters.
+            parameters: An iterable of parameter tuples.
+        """
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def transaction(self) -> Iterator[None]:
+        """Context manager grouping statements into a single transaction.
+
+        Statements executed within the context are committed together when
+        the outermost transaction context exits, or rolled back if an exception
+        is raised. Transaction contexts can be nested: if an exception is raised
+        within a nested context, only the statements of the nested context are
+        rolled back, so a caller catching the exception can carry on with the
+        outer transaction.
+
+        Example usage:
+            with db_accessor.transaction():
+                db_accessor.execute_query("delete from KeyFigureValue;")
+                db_accessor.execute_many(query, rows)
+        """
+
+        raise NotImplementedError
+
+
+class SQLiteConnectionPool:
+    """Pool of SQLite connections to a database, shared by all accessors of the database.
+
+    A connection is only used by one thread at a time. A thread acquiring a
+    connection gets an idle connection if there is one, otherwise a new
+    connection is opened, unless pool_size connections are already open in
+    which case the thread waits for a connection to be released.
+
+    Connections are never shared with child processes: a pool used after a
+    fork discards the connections inherited from the parent process.
+
+    The pragmas are applied to every connection when it is opened. The journal
+    mode is stored in the database file, so it is only set for databases created
+    by the pool, which use write-ahead logging (NEW_DATABASE_PRAGMAS). This
+    lets readers and a writer work concurrently, with synchronous commits
+    relaxed accordingly. Existing databases keep their journal mode, unless
+    it is included in the pragmas. Temporary tables are stored in files by
+    default, so that large staging tables, such as the one of
+    RiskDbAccessor.create_price_staging_table, do not have to fit in memory.
+
+    Attributes:
+        db_path: The path to the SQLite database.
+        pool_size: The maximum number of open connections.
+        pragmas: The pragmas applied to every connection.
+    """
+
+    DEFAULT_PRAGMAS: dict[str, str | int] = {
+        "cache_size": -64000,  # In KiB, i.e. 64 MB.
+        "mmap_size": 268435456,  # 256 MB.
+    }
+
+    NEW_DATABASE_PRAGMAS: dict[str, str | int] = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+    }
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        pool_size: int = 8,
+        pragmas: dict[str, str | int] | None = None,
+    ) -> None:
+        if pool_size < 1:
+            raise ValueError(f"pool_size must be >= 1, argument is {pool_size}.")
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.pragmas = dict(self.DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._idle: list[sqlite3.Connection] = []
+        self._open_count: int = 0
+        self._condition = threading.Condition()
+        self._pid: int = os.getpid()
+
+    def acquire(self) -> sqlite3.Connection:
+        """Acquires a connection, which must be released after use."""
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        with self._condition:
+            while len(self._idle) == 0 and self._open_count >= self.pool_size:
+                self._condition.wait()
+            if len(self._idle) > 0:
+                return self._idle.pop()
+            self._open_count += 1
+        try:
+            return self._open()
+        except BaseException:
+            with self._condition:
+                self._open_count -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        """Returns an acquired connection to the pool."""
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        if connection.in_transaction:
+            connection.rollback()
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Closes all idle connections."""
+        with self._condition:
+            for connection in self._idle:
+                connection.close()
+            self._open_count -= len(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+
+    def _reset_after_fork(self) -> None:
+        # The inherited connections and lock belong to the parent process,
+        # so they are dropped without being used.
+        self._condition = threading.Condition()
+        self._idle = []
+        self._open_count = 0
+        self._pid = os.getpid()
+
+    def _open(self) -> sqlite3.Connection:
+        pragmas: dict[str, str | int] = self.pragmas
+        if not os.path.exists(self.db_path):
+            pragmas = {**self.NEW_DATABASE_PRAGMAS, **pragmas}
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in pragmas.items():
+            # Pragma statements do not support parameters.
+            connection.execute(f"pragma {name} = {value};").fetchall()
+        return connection
+
+
+_connection_pools: dict[str, SQLiteConnectionPool] = {}
+_connection_pools_lock = threading.Lock()
+
+
+def configure_connection_pool(
+    db_path: str,
+    *,
+    pool_size: int = 8,
+    pragmas: dict[str, str | int] | None = None,
+) -> SQLiteConnectionPool:
+    """Configures the connection pool used by accessors of an SQLite database.
+
+    Idle connections of a previously configured pool are closed. Connections
+    in use are closed by the garbage collector after being released.
+
+    Args:
+        db_path: The path to the SQLite database.
+        pool_size: The maximum number of open connections.
+        pragmas: The pragmas applied to every connection. If None,
+            SQLiteConnectionPool.DEFAULT_PRAGMAS is used.
+
+    Returns:
+        The new connection pool.
+    """
+    pool = SQLiteConnectionPool(db_path, pool_size=pool_size, pragmas=pragmas)
+    with _connection_pools_lock:
+        previous: SQLiteConnectionPool | None = _connection_pools.get(db_path)
+        _connection_pools[db_path] = pool
+    if previous is not None:
+        previous.close()
+    return pool
+
+
+def _get_connection_pool(db_path: str) -> SQLiteConnectionPool:
+    with _connection_pools_lock:
+        pool: SQLiteConnectionPool | None = _connection_pools.get(db_path)
+        if pool is None:
+            pool = SQLiteConnectionPool(db_path)
+            _connection_pools[db_path] = pool
+        return pool
+
 
 class SQLiteDbAccesssor(DbAccessor):
     """Type used for reading from and writing to an SQLite database.
 
+    Connections are acquired from the SQLiteConnectionPool of the database,
+    see configure_connection_pool. Every thread using the accessor has its
+    own connection. Calls to connect and close can be nested, and only the
+    outermost close releases the connection to the pool. A session can thus
+    span many operations, e.g. a whole report, by keeping the accessor open:
+
+        with db_accessor:  # Acquires a connection.
+            with db_accessor:  # Reuses the connection.
+                ...
+
     Example usage:
         with DbAccesssor("./db/alecta_case_db.db") as db_accessor:
             rows = db_accessor.execute_select_query(
@@ -95,27 +313,43 @@ class SQLiteDbAccesssor(DbAccessor):
             )
             print(rows)
 
+    If a metrics sink is set, the number of rows and the execution time of
+    every statement are recorded to it, per statement shape.
+
     Attributes:
         db_path: The path (relative to where the invoked Python script resides) to the SQLite database.
+        metrics: The sink statements are recorded to, None to disable instrumentation.
     """
 
     def __init__(self, db_path: str) -> None:
         super().__init__()
         self.db_path = db_path
+        self.metrics: MetricsSink | None = None
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection of the current thread."""
+        return self._local.connection
 
     def connect(self) -> None:
-        """Opens a database connection if not already open."""
-        if self._is_open:
-            return
-        self.connection = sqlite3.connect(self.db_path)
-        self._is_open = True
+        """Opens a database connection if not already open, otherwise increments its usage count."""
+        depth: int = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.pool = _get_connection_pool(self.db_path)
+            self._local.connection = self._local.pool.acquire()
+            self._local.transaction_depth = 0
+        self._local.depth = depth + 1
 
     def close(self) -> None:
-        """Closes the database connection if it is open."""
-        if not self._is_open:
+        """Decrements the usage count of the connection, releasing it to the pool when unused."""
+        depth: int = getattr(self._local, "depth", 0)
+        if depth == 0:
             return
-        self.connection.close()
-        self._is_open = False
+        self._local.depth = depth - 1
+        if depth == 1:
+            self._local.pool.release(self._local.connection)
+            self._local.connection = None
 
     def __enter__(self) -> object:
         self.connect()
@@ -126,33 +360,109 @@ class SQLiteDbAccesssor(DbAccessor):
 
     def is_open(self) -> bool:
         """Returns True if the database connection is open, otherwise False."""
-        return self._is_open
+        return getattr(self._local, "depth", 0) > 0
+
+    def _record(self, query: str, rows: int, start: float) -> None:
+        """Records a statement started at start to the metrics sink, if any."""
+        if self.metrics is not None:
+            self.metrics.record_statement(
+                statement_shape(query), rows, time.perf_counter() - start
+            )
 
     def execute_select_query(
         self, query: str, parameters: tuple[Any, ...] = ()
     ) -> list[Any]:
+        start: float = time.perf_counter()
         with closing(self.connection.cursor()) as cur:
             rows = cur.execute(query, parameters).fetchall()
+            self._record(query, len(rows), start)
             return rows
 
+    def iter_select_query(self, query, parameters=(), *, batch_size=1000):
+        # Only the time spent in SQLite is recorded, not the time of the consumer.
+        elapsed: float = 0.0
+        count: int = 0
+        with closing(self.connection.cursor()) as cur:
+            try:
+                start: float = time.perf_counter()
+                cur.execute(query, parameters)
+                while True:
+                    rows: list[Any] = cur.fetchmany(batch_size)
+                    elapsed += time.perf_counter() - start
+                    if len(rows) == 0:
+                        break
+                    count += len(rows)
+                    yield rows
+                    start = time.perf_counter()
+            finally:
+                if self.metrics is not None:
+                    self.metrics.record_statement(
+                        statement_shape(query), count, elapsed
+                    )
+
     def execute_query(self, query, parameters=()):
+        start: float = time.perf_counter()
         with closing(self.connection.cursor()) as cur:
             cur.execute(query, parameters)
             cnt = cur.rowcount
-            self.connection.commit()
+            self._commit()
+            self._record(query, max(cnt, 0), start)
             return cnt
 
+    def execute_many(self, query, parameters=()):
+        start: float = time.perf_counter()
+        with closing(self.connection.cursor()) as cur:
+            cur.executemany(query, parameters)
+            cnt = cur.rowcount
+            self._commit()
+            self._record(query, max(cnt, 0), start)
+            return cnt
+
+    @contextmanager
+    def transaction(self):
+        # The outermost context is a transaction, and nested contexts are
+        # savepoints within it.
+        depth: int = self._local.transaction_depth
+        savepoint: str = f"transaction_{depth}"
+        if depth == 0:
+            if not self.connection.in_transaction:
+                self.connection.execute("begin;")
+        else:
+            self.connection.execute(f"savepoint {savepoint};")
+        self._local.transaction_depth = depth + 1
+        try:
+            yield
+        except BaseException:
+            self._local.transaction_depth = depth
+            if depth == 0:
+                self.connection.rollback()
+            else:
+                self.connection.execute(f"rollback to {savepoint};")
+                self.connection.execute(f"release {savepoint};")
+            raise
+        self._local.transaction_depth = depth
+        if depth > 0:
+            self.connection.execute(f"release {savepoint};")
+        self._commit()
+
+    def _commit(self) -> None:
+        """Commits the current transaction, unless within a transaction context."""
+        if self._local.transaction_depth == 0:
+            self.connection.commit()
+
     def execute_insert_statement(self, query, parameters=()):
+        start: float = time.perf_counter()
         with closing(self.connection.cursor()) as cur:
             cur.execute(query, parameters)
             cnt = cur.rowcount
+            self._record(query, max(cnt, 0), start)
             if cnt == 0:
                 return None
             if cnt > 1:
                 raise ValueError(
                     f"Insert statements inserting more than one row is not supported. Number of affected rows: {cnt}"
                 )
-            self.connection.commit()
+            self._commit()
             return cur.lastrowid
 
 
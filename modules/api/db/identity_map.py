@@ -0,0 +1,158 @@
+"""Contains a cache for reference data entities read from the database."""
+
+__all__: list[str] = ["IdentityMap"]
+
+from ...types import BaseEntity, BaseEntityNamed
+from typing import Callable, Iterable
+import threading
+import time
+
+
+class _EntityTable:
+    """The cached entities of a single table."""
+
+    def __init__(self) -> None:
+        self.by_id: dict[int, BaseEntity] = {}
+        self.by_name: dict[str, BaseEntity] = {}
+        self.loaded_at: float | None = None
+
+
+class IdentityMap:
+    """Type used for caching reference data entities, keyed by id and by name.
+
+    Reference data tables (instruments, portfolios, key figures etc.) are small,
+    so a table is loaded as a whole the first time it is needed and every
+    subsequent lookup is served from memory. A table is reloaded when it has
+    been cached for longer than the time to live, or after it has been invalidated.
+
+    An entity is only ever hydrated once per id: reloading a table keeps the
+    already cached objects, so the same object is returned for the same id
+    during the lifetime of the identity map. Loading and adding entities is
+    thread safe, so an identity map can be shared by several threads.
+
+    Example usage:
+        identity_map = IdentityMap(ttl=60.0)
+        identity_map.load(Portfolio, lambda: [Portfolio(1, "EQ_US")])
+        portfolio = identity_map.get(Portfolio, 1)
+
+    Attributes:
+        ttl: The time to live of a loaded table in seconds, or None if tables never expire.
+    """
+
+    def __init__(
+        self, ttl: float | None = 300.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.ttl = ttl
+        self._clock = clock
+        self._tables: dict[type, _EntityTable] = {}
+        self._lock = threading.RLock()
+
+    def is_loaded(self, entity_type: type) -> bool:
+        """Returns True if the table of the entity type is cached and has not expired."""
+        table: _EntityTable | None = self._tables.get(entity_type)
+        if table is None or table.loaded_at is None:
+            return False
+        if self.ttl is None:
+            return True
+        return self._clock() - table.loaded_at < self.ttl
+
+    def load(
+        self, entity_type: type, loader: Callable[[], Iterable[BaseEntity]]
+    ) -> None:
+        """Loads the table of an entity type, unless it is already loaded.
+
+        Args:
+            entity_type: The type used as key for the table, e.g. Instrument.
+            loader: A callable returning all entities of the table.
+        """
+        if self.is_loaded(entity_type):
+            return
+        with self._lock:
+            # Another thread may have loaded the table while waiting for the lock.
+            if self.is_loaded(entity_type):
+                return
+            previous: _EntityTable = self._tables.get(entity_type, _EntityTable())
+            table: _EntityTable = _EntityTable()
+            for entity in loader():
+                cached: BaseEntity | None = previous.by_id.get(entity.id_)
+                if cached is not None and type(cached) is type(entity):
+                    if isinstance(entity, BaseEntityNamed):
+                        cached.name = entity.name
+                    entity = cached
+                table.by_id[entity.id_] = entity
+                if isinstance(entity, BaseEntityNamed):
+                    table.by_name.setdefault(entity.name, entity)
+            table.loaded_at = self._clock()
+            self._tables[entity_type] = table
+
+    def get(self, entity_type: type, id_: int) -> BaseEntity | None:
+        """Gets a cached entity from its id, or None if not found."""
+        table: _EntityTable | None = self._tables.get(entity_type)
+        if table is None:
+            return None
+        return table.by_id.get(id_)
+
+    def get_or_add(
+        self, entity_type: type, id_: int, factory: Callable[[], BaseEntity]
+    ) -> BaseEntity:
+        """Gets a cached entity from its id, or caches the entity created by factory.
+
+        This is used for hydrating entities from rows of joined queries, without
+        having to load the whole table of the entity type.
+
+        Args:
+            entity_type: The type used as key for the table, e.g. Instrument.
+            id_: The id of the entity.
+            factory: A callable creating the entity if it is not cached.
+
+        Returns:
+            The cached entity.
+        """
+        table: _EntityTable = self._tables.setdefault(entity_type, _EntityTable())
+        entity: BaseEntity | None = table.by_id.get(id_)
+        if entity is not None:
+            return entity
+        with self._lock:
+            table = self._tables.setdefault(entity_type, _EntityTable())
+            entity = table.by_id.get(id_)
+            if entity is None:
+                entity = factory()
+                table.by_id[id_] = entity
+                if isinstance(entity, BaseEntityNamed):
+                    table.by_name.setdefault(entity.name, entity)
+            return entity
+
+    def get_from_name(self, entity_type: type, name: str) -> BaseEntity | None:
+        """Gets a cached entity from its name, or None if not found."""
+        table: _EntityTable | None = self._tables.get(entity_type)
+        if table is None:
+            return None
+        return table.by_name.get(name)
+
+    def get_all(self, entity_type: type) -> list[BaseEntity]:
+        """Gets all cached entities of an entity type, ordered as they were loaded."""
+        table: _EntityTable | None = self._tables.get(entity_type)
+        if table is None:
+            return []
+        return list(table.by_id.values())
+
+    def invalidate(self, entity_type: type | None = None) -> None:
+        """Marks the table of an entity type as expired.
+
+        Cached objects are kept, so that a subsequent reload returns the same
+        objects for ids which are still present in the database.
+
+        Args:
+            entity_type: The entity type to invalidate. If None, all tables are invalidated.
+        """
+        tables: Iterable[_EntityTable]
+        if entity_type is None:
+            tables = self._tables.values()
+        else:
+            tables = [self._tables.get(entity_type, _EntityTable())]
+        for table in tables:
+            table.loaded_at = None
+
+    def clear(self) -> None:
+        """Removes all cached entities."""
+        self._tables.clear()
@@ -0,0 +1,325 @@
+"""Contains the schema migrations applied to the risk report database.
+
+The database schema version is tracked using SQLite's user_version pragma.
+Every element of SCHEMA_MIGRATIONS is a tuple of statements taking the schema
+from version n to version n + 1, where n is the index of the element.
+"""
+
+__all__: list[str] = [
+    "SCHEMA_MIGRATIONS",
+    "HOLDING_SNAPSHOT_SELECT",
+    "schema_version",
+    "apply_schema_migrations",
+]
+
+from .dbaccessor import DbAccessor
+
+
+def _bump_watermark(ref_type: str, entity_id: str) -> str:
+    """Creates a statement setting the watermark of an entity to a new version.
+
+    Versions are taken from a single sequence shared by all entities, so that
+    the maximum version over a set of entities increases whenever any of the
+    entities changes.
+    """
+    return (
+        "insert into ChangeWatermark (ref_type, ref_entity_id, version) values ("
+        f"(select id from KeyFigureRefType where name = '{ref_type}'), {entity_id}, "
+        "(select coalesce(max(version), 0) + 1 from ChangeWatermark)) "
+        "on conflict (ref_type, ref_entity_id) do update set version = excluded.version;"
+    )
+
+
+def _log_change(ref_type: str, entity_id: str, date_: str) -> str:
+    """Creates a statement recording the date from which an entity changed.
+
+    The change is recorded with the current watermark of the entity, see
+    _bump_watermark, so that the earliest date changed since a watermark can be
+    looked up, see RiskDbAccessor.validate_key_figure_values.
+    """
+    ref_type_id: str = f"(select id from KeyFigureRefType where name = '{ref_type}')"
+    return (
+        "insert into ChangeLog (ref_type, ref_entity_id, date, version) values ("
+        f"{ref_type_id}, {entity_id}, {date_}, (select version from ChangeWatermark "
+        f"where ref_type = {ref_type_id} and ref_entity_id = {entity_id})) "
+        "on conflict (ref_type, ref_entity_id, date) "
+        "do update set version = excluded.version;"
+    )
+
+
+# The change tracking triggers of every table, as (table, ref type, entity id column,
+# column of the first date affected by a change of a row).
+_CHANGE_TRACKED_TABLES: list[tuple[str, str, str, str]] = [
+    ("Prices", "Instrument", "instrument_id", "date"),
+    ("Position", "Portfolio", "portfolio_id", "date_from"),
+]
+
+# The rows of every trigger event.
+_TRIGGER_ROWS: list[tuple[str, list[str]]] = [
+    ("insert", ["new"]),
+    ("update", ["old", "new"]),
+    ("delete", ["old"]),
+]
+
+
+def _track_changes(
+    ref_type: str, column: str, date_column: str, rows: list[str]
+) -> str:
+    """Creates the statements of a change tracking trigger, see version 7."""
+    return " ".join(
+        [
+            *[_bump_watermark(ref_type, f"{row}.{column}") for row in rows],
+            *[
+                _log_change(ref_type, f"{row}.{column}", f"{row}.{date_column}")
+                for row in rows
+            ],
+        ]
+    )
+
+
+def _day_after(date_to: str) -> str:
+    """Creates an expression of the day after the date_to of a position.
+
+    The expression is NULL for open-ended positions, whose date_to is the last
+    date SQLite supports (9999-12-31), as they never end.
+    """
+    return f"date({date_to}, '+1 day')"
+
+
+# The holdings of every portfolio, computed from scratch from the positions. Every
+# row is a date on which the quantity of an instrument held by a portfolio changes,
+# i.e. the date_from of a position or the day after its date_to, unless the position
+# is open-ended, and the quantity held from that date, until the next row of the
+# portfolio and instrument.
+HOLDING_SNAPSHOT_SELECT: str = (
+    "select portfolio_id, instrument_id, date, quantity from ("
+    "select portfolio_id, instrument_id, date, quantity, lag(quantity, 1, 0) over ("
+    "partition by portfolio_id, instrument_id order by date) as previous from ("
+    "select b.portfolio_id, b.instrument_id, b.date, ("
+    "select coalesce(sum(p.quantity), 0) from Position p "
+    "where p.portfolio_id = b.portfolio_id and p.instrument_id = b.instrument_id "
+    "and p.date_from <= b.date and b.date <= p.date_to) as quantity from ("
+    "select portfolio_id, instrument_id, date_from as date from Position union "
+    f"select portfolio_id, instrument_id, {_day_after('date_to')} as date "
+    f"from Position where {_day_after('date_to')} is not null) b)) "
+    "where quantity != previous"
+)
+
+
+def _maintain_holding_snapshot(row: str) -> str:
+    """Creates statements updating the holdings affected by a position row.
+
+    The dates on which the position starts and ends are added to the snapshot
+    of its portfolio and instrument, and the quantities of the snapshot rows
+    in [date_from, date_to + 1] are recomputed from the positions. Open-ended
+    positions have no end date, see _day_after.
+    """
+    end: str = _day_after(f"{row}.date_to")
+    return (
+        "insert into HoldingSnapshot (portfolio_id, instrument_id, date, quantity) "
+        f"select {row}.portfolio_id, {row}.instrument_id, date, 0 from ("
+        f"select {row}.date_from as date union all select {end}) "
+        "where date is not null "
+        "on conflict do nothing; "
+        "update HoldingSnapshot set quantity = ("
+        "select coalesce(sum(p.quantity), 0) from Position p "
+        "where p.portfolio_id = HoldingSnapshot.portfolio_id "
+        "and p.instrument_id = HoldingSnapshot.instrument_id "
+        "and p.date_from <= HoldingSnapshot.date "
+        "and HoldingSnapshot.date <= p.date_to) "
+        f"where portfolio_id = {row}.portfolio_id "
+        f"and instrument_id = {row}.instrument_id "
+        f"and date >= {row}.date_from and ({end} is null or date <= {end});"
+    )
+
+
+def _compact_holding_snapshot(row: str) -> str:
+    """Creates a statement deleting the rows at the dates of a position row which
+    do not change the quantity held, see _maintain_holding_snapshot."""
+    return (
+        "delete from HoldingSnapshot "
+        f"where portfolio_id = {row}.portfolio_id "
+        f"and instrument_id = {row}.instrument_id "
+        f"and date in ({row}.date_from, {_day_after(f'{row}.date_to')}) "
+        "and quantity = coalesce(("
+        "select s.quantity from HoldingSnapshot s "
+        "where s.portfolio_id = HoldingSnapshot.portfolio_id "
+        "and s.instrument_id = HoldingSnapshot.instrument_id "
+        "and s.date < HoldingSnapshot.date order by s.date desc limit 1), 0);"
+    )
+
+
+SCHEMA_MIGRATIONS: list[tuple[str, ...]] = [
+    # Version 1: Composite index used by price lookups on instrument and date.
+    (
+        'create unique index if not exists "U_Prices" '
+        'on "Prices" ("instrument_id", "date");',
+    ),
+    # Version 2: Composite index used by position lookups on portfolio and date.
+    (
+        'create index if not exists "I_Position" '
+        'on "Position" ("portfolio_id", "date_from", "date_to");',
+    ),
+    # Version 3: Change watermarks of instruments (bumped when their prices change)
+    # and portfolios (bumped when their positions change), used for invalidating
+    # stored key figure values.
+    (
+        'create table if not exists "ChangeWatermark" ('
+        '"ref_type" INTEGER NOT NULL, "ref_entity_id" INTEGER NOT NULL, '
+        '"version" INTEGER NOT NULL, PRIMARY KEY ("ref_type", "ref_entity_id"), '
+        'FOREIGN KEY("ref_type") REFERENCES "KeyFigureRefType"("id"));',
+        'create index if not exists "I_ChangeWatermark" '
+        'on "ChangeWatermark" ("version");',
+        'create table if not exists "KeyFigureCacheState" ('
+        '"portfolio_id" INTEGER NOT NULL PRIMARY KEY, "watermark" INTEGER NOT NULL, '
+        'FOREIGN KEY("portfolio_id") REFERENCES "Portfolio"("id"));',
+        *[
+            f'create trigger if not exists "T_{table}_{event}" after {event} '
+            f'on "{table}" begin '
+            + " ".join(
+                _bump_watermark(ref_type, f"{row}.{column}") for row in rows
+            )
+            + " end;"
+            for table, ref_type, column, _ in _CHANGE_TRACKED_TABLES
+            for event, rows in _TRIGGER_ROWS
+        ],
+    ),
+    # Version 4: State of the rolling key figures of every portfolio, advanced one
+    # day at a time by the end-of-day update, see EndOfDayUpdater.
+    (
+        'create table if not exists "RollingKeyFigureState" ('
+        '"portfolio_id" INTEGER NOT NULL PRIMARY KEY, "date" TEXT NOT NULL, '
+        '"market_value" REAL NOT NULL, "cumulative_from" TEXT NOT NULL, '
+        '"cumulative_growth" REAL NOT NULL, "return_count" INTEGER NOT NULL, '
+        '"return_mean" REAL NOT NULL, "return_m2" REAL NOT NULL, '
+        '"log_returns" BLOB NOT NULL, '
+        'FOREIGN KEY("portfolio_id") REFERENCES "Portfolio"("id"));',
+    ),
+    # Version 5: Key figures computed from the covariance matrix of the instruments,
+    # see CovarianceRiskEngine.
+    tuple(
+        f"insert into KeyFigure (name) select '{name}' "
+        f"where not exists (select 1 from KeyFigure where name = '{name}');"
+        for name in [
+            "Volatility (3M, ann., covariance)",
+            "Marginal risk (3M, ann.)",
+            "Component risk (3M, ann.)",
+        ]
+    ),
+    # Version 6: Holdings of every portfolio materialized from the positions, and
+    # maintained by triggers on Position, see RiskDbAccessor.get_holdings.
+    (
+        'create table if not exists "HoldingSnapshot" ('
+        '"portfolio_id" INTEGER NOT NULL, "instrument_id" INTEGER NOT NULL, '
+        '"date" TEXT NOT NULL, "quantity" REAL NOT NULL, '
+        'PRIMARY KEY ("portfolio_id", "instrument_id", "date"), '
+        'FOREIGN KEY("portfolio_id") REFERENCES "Portfolio"("id"), '
+        'FOREIGN KEY("instrument_id") REFERENCES "Instrument"("id"));',
+        "delete from HoldingSnapshot;",
+        "insert into HoldingSnapshot (portfolio_id, instrument_id, date, quantity) "
+        f"{HOLDING_SNAPSHOT_SELECT};",
+        *[
+            f'create trigger if not exists "T_Position_{event}_HoldingSnapshot" '
+            f'after {event} on "Position" begin '
+            + " ".join(
+                [
+                    *[_maintain_holding_snapshot(row) for row in rows],
+                    *[_compact_holding_snapshot(row) for row in rows],
+                ]
+            )
+            + " end;"
+            for event, rows in _TRIGGER_ROWS
+        ],
+    ),
+    # Version 7: Dates from which instruments and portfolios changed, recorded by
+    # the change tracking triggers of version 3, used for invalidating only the
+    # stored key figure values on or after the earliest changed date.
+    (
+        'create table if not exists "ChangeLog" ('
+        '"ref_type" INTEGER NOT NULL, "ref_entity_id" INTEGER NOT NULL, '
+        '"date" TEXT NOT NULL, "version" INTEGER NOT NULL, '
+        'PRIMARY KEY ("ref_type", "ref_entity_id", "date"), '
+        'FOREIGN KEY("ref_type") REFERENCES "KeyFigureRefType"("id"));',
+        'create index if not exists "I_ChangeLog" on "ChangeLog" ("version");',
+        *[
+            statement
+            for table, ref_type, column, date_column in _CHANGE_TRACKED_TABLES
+            for event, rows in _TRIGGER_ROWS
+            for statement in [
+                f'drop trigger if exists "T_{table}_{event}";',
+                f'create trigger "T_{table}_{event}" after {event} '
+                f'on "{table}" begin '
+                + _track_changes(ref_type, column, date_column, rows)
+                + " end;",
+            ]
+        ],
+    ),
+    # Version 8: Settings the stored key figure values of every portfolio were
+    # computed with, e.g. the calendar, see RiskDbAccessor.validate_key_figure_values.
+    (
+        'alter table "KeyFigureCacheState" '
+        'add column "settings" TEXT NOT NULL DEFAULT \'\';',
+    ),
+    # Version 9: Suspension of the change tracking triggers of version 7 for a table,
+    # while a bulk write records its changes once per entity instead of once per
+    # row, see RiskDbAccessor.batch_changes.
+    (
+        'create table if not exists "SuspendedChangeTracking" ('
+        '"table_name" TEXT NOT NULL PRIMARY KEY);',
+        *[
+            statement
+            for table, ref_type, column, date_column in _CHANGE_TRACKED_TABLES
+            for event, rows in _TRIGGER_ROWS
+            for statement in [
+                f'drop trigger if exists "T_{table}_{event}";',
+                f'create trigger "T_{table}_{event}" after {event} on "{table}" '
+                'when not exists (select 1 from "SuspendedChangeTracking" '
+                f"where table_name = '{table}') begin "
+                + _track_changes(ref_type, column, date_column, rows)
+                + " end;",
+            ]
+        ],
+    ),
+    # Version 10: Settings the rolling key figure state of every portfolio was
+    # computed with, e.g. the calendar, see EndOfDayUpdater.
+    (
+        'alter table "RollingKeyFigureState" '
+        'add column "settings" TEXT NOT NULL DEFAULT \'\';',
+    ),
+]
+
+
+def schema_version(db_accessor: DbAccessor) -> int:
+    """Gets the schema version of the database.
+
+    Args:
+        db_accessor: An open database accessor.
+
+    Returns:
+        The number of schema migrations applied to the database.
+    """
+    return db_accessor.execute_select_query("pragma user_version;")[0][0]
+
+
+def apply_schema_migrations(db_accessor: DbAccessor) -> int:
+    """Applies all schema migrations not yet applied to the database.
+
+    Every migration is applied in a transaction of its own, so if a migration
+    fails, the migrations before it remain applied.
+
+    Args:
+        db_accessor: An open database accessor.
+
+    Returns:
+        The schema version of the database after applying the migrations.
+    """
+    version: int = schema_version(db_accessor)
+    for statements in SCHEMA_MIGRATIONS[version:]:
+        # The schema version is updated in the transaction of the migration.
+        with db_accessor.transaction():
+            for statement in statements:
+                db_accessor.execute_query(statement)
+            # Pragma statements do not support parameters.
+            db_accessor.execute_query(f"pragma user_version = {version + 1};")
+        version += 1
+    return version
@@ -0,0 +1,232 @@
+"""Contains an in-memory interval index of the validity periods of positions."""
+
+__all__: list[str] = ["PositionIndex"]
+
+from .risk_dbaccessor import RiskDbAccessor
+from ...types import Portfolio, Position
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Iterable, Iterator
+
+
+class _PortfolioIntervals:
+    """The change points of the positions of one portfolio.
+
+    - ordinals: The dates on which the holdings change, as date ordinals in
+      ascending order, i.e. the date_from of a position and the day after its
+      date_to.
+    - changes: The changes of every change point, as (position, quantity)
+      tuples, where quantity is negative for positions ending.
+    - tree: A segment tree over the intervals between consecutive change
+      points, stored as a list of 2 * len(ordinals) nodes, where the leaf of
+      the interval starting at change point k is the node len(ordinals) + k,
+      and the parent of node i is node i // 2. Every position is stored in the
+      O(log n) nodes whose intervals make up its validity period, so the
+      positions held from change point k are those stored on the path from its
+      leaf to the root, and the tree takes O(n log n) memory.
+    """
+
+    __slots__ = ("ordinals", "changes", "tree")
+
+    def __init__(self, positions: list[Position]) -> None:
+        events: dict[int, list[tuple[Position, float]]] = {}
+        for pos in positions:
+            events.setdefault(pos.date_from.toordinal(), []).append(
+                (pos, pos.quantity)
+            )
+            end: int = pos.date_to.toordinal() + 1
+            events.setdefault(end, []).append((pos, -pos.quantity))
+        self.ordinals: array = array("q", sorted(events))
+        self.changes: list[list[tuple[Position, float]]] = [
+            events[ordinal] for ordinal in self.ordinals
+        ]
+        size: int = len(self.ordinals)
+        index: dict[int, int] = {ordinal: k for k, ordinal in enumerate(self.ordinals)}
+        self.tree: list[list[Position]] = [[] for _ in range(2 * size)]
+        for pos in positions:
+            lo: int = index[pos.date_from.toordinal()] + size
+            hi: int = index[pos.date_to.toordinal() + 1] + size
+            while lo < hi:
+                if lo & 1:
+                    self.tree[lo].append(pos)
+                    lo += 1
+                if hi & 1:
+                    hi -= 1
+                    self.tree[hi].append(pos)
+                lo >>= 1
+                hi >>= 1
+
+    def live(self, k: int) -> list[Position]:
+        """Gets the positions held from change point k until the next, ordered by id."""
+        result: list[Position] = []
+        node: int = len(self.ordinals) + k
+        while node > 0:
+            result.extend(self.tree[node])
+            node >>= 1
+        result.sort(key=lambda pos: pos.id_)
+        return result
+
+
+def _total_quantity(positions: dict[int, Position]) -> float:
+    """Sums the quantities of positions keyed by id, in id order."""
+    total: float = 0.0
+    for id_ in sorted(positions):
+        total += positions[id_].quantity
+    return total
+
+
+class PositionIndex:
+    """Interval index answering which positions are held on a date or date range.
+
+    The validity periods [date_from, date_to] of the positions of every
+    portfolio are turned into a sorted array of change points, the dates on
+    which a position starts or ends, and a segment tree over the intervals
+    between consecutive change points, taking O(n log n) memory. The positions
+    held on a date are found with one binary search and a walk up the tree,
+    and the changes within a date range with two binary searches, so both are
+    O(log n) plus the size of the answer, and range computations only need to
+    do work on the dates the holdings actually change.
+
+    Example usage:
+        with risk_db_accessor as db:
+            index = PositionIndex.from_db(db)
+        index.positions_on(portfolio, date(2024, 5, 31))
+        for date_, changes in index.iter_changes(portfolio, date_from, date_to):
+            ...
+    """
+
+    def __init__(self, positions: Iterable[Position]) -> None:
+        by_portfolio: dict[int, list[Position]] = {}
+        for pos in positions:
+            by_portfolio.setdefault(pos.portfolio.id_, []).append(pos)
+        self._portfolios: dict[int, _PortfolioIntervals] = {
+            id_: _PortfolioIntervals(positions_)
+            for id_, positions_ in by_portfolio.items()
+        }
+
+    @classmethod
+    def from_db(
+        cls, risk_db_accessor: RiskDbAccessor, portfolio: Portfolio | None = None
+    ) -> "PositionIndex":
+        """Creates an index of the positions in the database.
+
+        Args:
+            risk_db_accessor: An open database accessor.
+            portfolio: If provided, only the positions of this portfolio are
+                indexed.
+
+        Returns:
+            A PositionIndex.
+        """
+        return cls(risk_db_accessor.get_positions(portfolio=portfolio))
+
+    def __contains__(self, portfolio: Portfolio) -> bool:
+        return portfolio.id_ in self._portfolios
+
+    def positions_on(self, portfolio: Portfolio, date_: date) -> list[Position]:
+        """Gets the positions of a portfolio held on a date.
+
+        Returns:
+            The positions whose [date_from, date_to] covers date_, ordered by id.
+        """
+        intervals: _PortfolioIntervals | None = self._portfolios.get(portfolio.id_)
+        if intervals is None:
+            return []
+        k: int = bisect_right(intervals.ordinals, date_.toordinal()) - 1
+        return intervals.live(k) if k >= 0 else []
+
+    def positions_overlapping(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> list[Position]:
+        """Gets the positions of a portfolio held on any date of a date range.
+
+        Returns:
+            The positions whose [date_from, date_to] overlaps the range,
+            ordered by id.
+        """
+        held: dict[int, Position] = {
+            pos.id_: pos for pos in self.positions_on(portfolio, date_from)
+        }
+        for _, changes in self.iter_changes(
+            portfolio, date_from + timedelta(days=1), date_to
+        ):
+            for pos, _ in changes:
+                if pos.date_from <= date_to and pos.date_to >= date_from:
+                    held[pos.id_] = pos
+        return [held[id_] for id_ in sorted(held)]
+
+    def iter_changes(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> Iterator[tuple[date, list[tuple[Position, float]]]]:
+        """Yields the changes of the holdings of a portfolio within a date range.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Yields:
+            Tuples of a date on which the holdings change, in ascending order,
+            and the changes of that date as (position, quantity) tuples. The
+            quantity is the quantity of the position on the date it starts,
+            and minus its quantity on the day after it ends.
+        """
+        intervals: _PortfolioIntervals | None = self._portfolios.get(portfolio.id_)
+        if intervals is None:
+            return
+        first: int = bisect_left(intervals.ordinals, date_from.toordinal())
+        last: int = bisect_right(intervals.ordinals, date_to.toordinal())
+        for k in range(first, last):
+            yield date.fromordinal(intervals.ordinals[k]), intervals.changes[k]
+
+    def holdings(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> Iterator[tuple[date, dict[int, float]]]:
+        """Yields the holdings of a portfolio on date_from and on every change after it.
+
+        The holdings of date_from are looked up in the index, and the holdings
+        of every later change are derived from the previous ones, recomputing
+        only the quantities of the instruments whose positions changed.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Yields:
+            Tuples of a date and the quantity held of every instrument from that
+            date until the next date yielded, keyed by instrument id. The
+            quantities are summed over the positions held, in id order.
+        """
+        intervals: _PortfolioIntervals | None = self._portfolios.get(portfolio.id_)
+        if intervals is None:
+            yield date_from, {}
+            return
+        first: int = bisect_right(intervals.ordinals, date_from.toordinal()) - 1
+        last: int = bisect_right(intervals.ordinals, date_to.toordinal())
+        held: dict[int, dict[int, Position]] = {}
+        for pos in intervals.live(first) if first >= 0 else []:
+            held.setdefault(pos.instrument.id_, {})[pos.id_] = pos
+        quantities: dict[int, float] = {
+            instrument_id: _total_quantity(positions)
+            for instrument_id, positions in held.items()
+        }
+        yield date_from, dict(quantities)
+        for k in range(first + 1, last):
+            ordinal: int = intervals.ordinals[k]
+            changed: set[int] = set()
+            for pos, _ in intervals.changes[k]:
+                instrument_id: int = pos.instrument.id_
+                changed.add(instrument_id)
+                if pos.date_from.toordinal() == ordinal:
+                    held.setdefault(instrument_id, {})[pos.id_] = pos
+                else:
+                    held.get(instrument_id, {}).pop(pos.id_, None)
+            for instrument_id in changed:
+                if len(held.get(instrument_id, {})) == 0:
+                    held.pop(instrument_id, None)
+                    quantities.pop(instrument_id, None)
+                else:
+                    quantities[instrument_id] = _total_quantity(held[instrument_id])
+            yield date.fromordinal(ordinal), dict(quantities)
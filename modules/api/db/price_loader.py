@@ -0,0 +1,195 @@
+"""Contains types used for loading price files into the Prices table."""
+
+__all__: list[str] = ["PriceLoadResult", "PriceLoader"]
+
+from .risk_dbaccessor import RiskDbAccessor
+from datetime import date
+from typing import Any, Iterable, Iterator
+import csv
+import itertools
+import time
+
+
+class PriceLoadResult:
+    """Type representing the outcome of a price load.
+
+    Attributes:
+        rows: The number of rows read.
+        loaded: The number of prices inserted or changed.
+        rejected: The number of rows skipped because they were invalid.
+        elapsed: The time of the load in seconds.
+    """
+
+    def __init__(self) -> None:
+        self.rows: int = 0
+        self.loaded: int = 0
+        self.rejected: int = 0
+        self.elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """The number of rows read per second."""
+        if self.elapsed == 0.0:
+            return 0.0
+        return self.rows / self.elapsed
+
+    def summary(self) -> dict[str, Any]:
+        """Gets the outcome of the load, suitable for JSON serialization."""
+        return {
+            "rows": self.rows,
+            "loaded": self.loaded,
+            "rejected": self.rejected,
+            "elapsed": self.elapsed,
+            "rows_per_second": self.rows_per_second,
+        }
+
+
+class PriceLoader:
+    """Type used for loading price files, such as db/prices.csv, into the database.
+
+    Files are streamed in chunks of chunk_size rows, so the memory used does
+    not depend on the size of the file. Every row is validated, and its
+    instrument id is checked against the instruments of the database. The
+    id column of the file is ignored: prices are matched on instrument and
+    date, and existing prices are updated.
+
+    By default the chunks are upserted with RiskDbAccessor.upsert_prices, and
+    committed every transaction_size rows. With rebuild_index, the chunks are
+    staged in a temporary table and merged in one go, with the price index
+    dropped and rebuilt around the merge, which is faster for very large
+    loads, see RiskDbAccessor.merge_staged_prices. Either way, the changed
+    prices are recorded once per instrument and transaction, see
+    RiskDbAccessor.batch_changes.
+
+    Example usage:
+        loader = PriceLoader(RiskDbAccessor())
+        result = loader.load("./db/prices.csv")
+        print(result.rows_per_second)
+
+    Attributes:
+        chunk_size: The number of rows passed to the database at once.
+        transaction_size: The number of rows committed at once.
+        skip_invalid: If True, invalid rows are skipped and counted, otherwise
+            a ValueError is raised.
+    """
+
+    COLUMNS: list[str] = ["id", "instrument_id", "date", "price"]
+
+    def __init__(
+        self,
+        risk_db_accessor: RiskDbAccessor,
+        *,
+        chunk_size: int = 10_000,
+        transaction_size: int = 500_000,
+        skip_invalid: bool = False,
+    ) -> None:
+        if chunk_size <= 0 or transaction_size <= 0:
+            raise ValueError("chunk_size and transaction_size must be positive.")
+        self.chunk_size = chunk_size
+        self.transaction_size = transaction_size
+        self.skip_invalid = skip_invalid
+        self._risk_db_accessor = risk_db_accessor
+
+    def load(self, path: str, *, rebuild_index: bool = False) -> PriceLoadResult:
+        """Loads a price file.
+
+        Args:
+            path: The path of a CSV file with a header row and the columns
+                id, instrument_id, date and price.
+            rebuild_index: If True, the price index is rebuilt around the load.
+
+        Raises:
+            ValueError: If the file has unexpected columns, or if a row is
+                invalid and skip_invalid is False.
+
+        Returns:
+            A PriceLoadResult.
+        """
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            header: list[str] = next(reader, [])
+            if [column.strip() for column in header] != self.COLUMNS:
+                raise ValueError(
+                    f"{path} must have the columns {', '.join(self.COLUMNS)}."
+                )
+            return self.load_rows(reader, rebuild_index=rebuild_index)
+
+    def load_rows(
+        self, rows: Iterable[list[str]], *, rebuild_index: bool = False
+    ) -> PriceLoadResult:
+        """Loads price rows, e.g. from a csv.reader.
+
+        Args:
+            rows: [id, instrument_id, date, price] rows of strings.
+            rebuild_index: If True, the price index is rebuilt around the load.
+
+        Raises:
+            ValueError: If a row is invalid and skip_invalid is False.
+
+        Returns:
+            A PriceLoadResult.
+        """
+        result: PriceLoadResult = PriceLoadResult()
+        start: float = time.perf_counter()
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            instrument_ids: set[int] = {i.id_ for i in db.get_instruments()}
+            chunks: Iterator[list[tuple[int, str, float]]] = self._chunks(
+                rows, instrument_ids, result
+            )
+            if rebuild_index:
+                db.create_price_staging_table()
+                for chunk in chunks:
+                    db.stage_prices(chunk)
+                result.loaded = db.merge_staged_prices()
+            else:
+                chunks_per_transaction: int = max(
+                    self.transaction_size // self.chunk_size, 1
+                )
+                while True:
+                    batch = list(itertools.islice(chunks, chunks_per_transaction))
+                    if len(batch) == 0:
+                        break
+                    with db.batch_changes():
+                        for chunk in batch:
+                            result.loaded += db.upsert_prices(chunk)
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _chunks(
+        self,
+        rows: Iterable[list[str]],
+        instrument_ids: set[int],
+        result: PriceLoadResult,
+    ) -> Iterator[list[tuple[int, str, float]]]:
+        """Validates rows and yields them in chunks of (instrument_id, date, price)."""
+        chunk: list[tuple[int, str, float]] = []
+        for row in rows:
+            result.rows += 1
+            try:
+                chunk.append(self._parse_row(row, instrument_ids))
+            except ValueError as e:
+                if not self.skip_invalid:
+                    raise ValueError(f"Invalid price row {result.rows}: {e}") from e
+                result.rejected += 1
+                continue
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    @staticmethod
+    def _parse_row(
+        row: list[str], instrument_ids: set[int]
+    ) -> tuple[int, str, float]:
+        if len(row) != 4:
+            raise ValueError(f"Expected 4 columns, got {len(row)}.")
+        instrument_id: int = int(row[1])
+        if instrument_id not in instrument_ids:
+            raise ValueError(f"Unknown instrument id {instrument_id}.")
+        date_: str = date.fromisoformat(row[2].strip()).isoformat()
+        price: float = float(row[3])
+        if price != price:
+            raise ValueError("Price must be a number.")
+        return instrument_id, date_, price
@@ -0,0 +1,284 @@
+"""Contains a columnar in-memory store of prices."""
+
+__all__: list[str] = ["PriceStore"]
+
+from .risk_dbaccessor import RiskDbAccessor
+from ...types import Instrument
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Sequence
+import math
+import mmap
+import struct
+import sys
+
+
+class PriceStore:
+    """Type holding prices in contiguous arrays instead of Price objects.
+
+    The prices are sorted by instrument and date, and stored in the following columns:
+
+    - instrument_ids: The id of every instrument, in ascending order.
+    - offsets: The index of the first price of every instrument, i.e. the prices
+      of the instrument with index i are found at [offsets[i], offsets[i + 1]).
+      The instrument index of every price is thus implied by the offsets.
+    - date_ordinals: The date of every price, as returned by date.toordinal.
+    - prices: The price of every date and instrument, as float64.
+
+    A store can be saved to a binary snapshot file, which can later be opened
+    with the arrays memory-mapped from the file rather than read into memory.
+
+    Example usage:
+        with risk_db_accessor as db:
+            store = PriceStore.from_db(db)
+        store.save("./db/prices.snapshot")
+        store = PriceStore.open("./db/prices.snapshot")
+        price = store.price(1, date(2024, 1, 2))
+    """
+
+    _MAGIC: bytes = b"PRSTORE1"
+    _HEADER: struct.Struct = struct.Struct("<8sqq")
+
+    def __init__(
+        self,
+        instrument_ids: Sequence[int],
+        offsets: Sequence[int],
+        date_ordinals: Sequence[int],
+        prices: Sequence[float],
+    ) -> None:
+        if len(offsets) != len(instrument_ids) + 1:
+            raise ValueError(
+                "offsets must have one element more than instrument_ids."
+            )
+        if len(date_ordinals) != len(prices) or offsets[-1] != len(prices):
+            raise ValueError(
+                "date_ordinals and prices must have one element per price."
+            )
+        self.instrument_ids = instrument_ids
+        self.offsets = offsets
+        self.date_ordinals = date_ordinals
+        self.prices = prices
+        self._indexes: dict[int, int] = {
+            id_: i for i, id_ in enumerate(instrument_ids)
+        }
+        self._mmap: mmap.mmap | None = None
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple[int, int, str, float]]) -> "PriceStore":
+        """Creates a store from price rows.
+
+        Args:
+            rows: (id, instrument_id, date, price) tuples ordered by instrument id
+                and date, as returned by RiskDbAccessor.get_price_rows.
+
+        Returns:
+            A PriceStore.
+        """
+        instrument_ids: array = array("q")
+        offsets: array = array("q")
+        date_ordinals: array = array("q", bytes(8 * len(rows)))
+        prices: array = array("d", bytes(8 * len(rows)))
+        for i, (_, instrument_id, date_, price) in enumerate(rows):
+            if len(instrument_ids) == 0 or instrument_ids[-1] != instrument_id:
+                instrument_ids.append(instrument_id)
+                offsets.append(i)
+            date_ordinals[i] = date.fromisoformat(date_).toordinal()
+            prices[i] = price
+        offsets.append(len(rows))
+        return cls(instrument_ids, offsets, date_ordinals, prices)
+
+    @classmethod
+    def from_db(
+        cls,
+        db: RiskDbAccessor,
+        *,
+        instruments: list[Instrument] | None = None,
+        date_from: date | None = None,
+        date_to: date | None = None,
+    ) -> "PriceStore":
+        """Creates a store from the prices in the database.
+
+        The database accessor must be open when calling this method.
+
+        Args:
+            db: The database accessor.
+            instruments: The instruments to load prices for, None for all instruments.
+            date_from: The earliest date to load prices for.
+            date_to: The latest date to load prices for.
+
+        Returns:
+            A PriceStore.
+        """
+        return cls.from_rows(
+            db.get_price_rows(
+                instruments=instruments, date_from=date_from, date_to=date_to
+            )
+        )
+
+    def save(self, path: str) -> None:
+        """Saves the store to a binary snapshot file.
+
+        The file consists of a header (magic bytes, number of instruments and
+        number of prices) followed by the instrument_ids, offsets, date_ordinals
+        and prices arrays, all stored as little-endian 8 byte values. On
+        big-endian hosts the arrays are byte-swapped when saved.
+        """
+        with open(path, "wb") as file:
+            file.write(
+                self._HEADER.pack(
+                    self._MAGIC, len(self.instrument_ids), len(self.prices)
+                )
+            )
+            for values, typecode in [
+                (self.instrument_ids, "q"),
+                (self.offsets, "q"),
+                (self.date_ordinals, "q"),
+                (self.prices, "d"),
+            ]:
+                column: array = array(typecode, values)
+                if sys.byteorder == "big":
+                    column.byteswap()
+                file.write(column.tobytes())
+
+    @classmethod
+    def open(cls, path: str) -> "PriceStore":
+        """Opens a snapshot file, memory-mapping its arrays.
+
+        The store should be closed when no longer used, see close. The arrays
+        are stored little-endian, so on big-endian hosts they are read into
+        memory and byte-swapped instead of being memory-mapped.
+
+        Args:
+            path: The path of a snapshot file created by save.
+
+        Returns:
+            A PriceStore.
+
+        Raises:
+            ValueError: If the file is not a snapshot, or its length does not
+                match the number of instruments and prices of its header.
+        """
+        with open(path, "rb") as file:
+            mapped: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < cls._HEADER.size:
+            mapped.close()
+            raise ValueError(f"{path} is not a price store snapshot.")
+        magic, instrument_count, price_count = cls._HEADER.unpack_from(mapped)
+        if magic != cls._MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a price store snapshot.")
+        expected_length: int = cls._HEADER.size + 8 * (
+            2 * instrument_count + 1 + 2 * price_count
+        )
+        if instrument_count < 0 or price_count < 0 or len(mapped) != expected_length:
+            mapped.close()
+            raise ValueError(
+                f"{path} is truncated or corrupt: expected {expected_length} bytes "
+                f"for {instrument_count} instruments and {price_count} prices, "
+                f"found {len(mapped)}."
+            )
+
+        view: memoryview = memoryview(mapped)
+        start: int = cls._HEADER.size
+        columns: list[memoryview | array] = []
+        for count, typecode in [
+            (instrument_count, "q"),
+            (instrument_count + 1, "q"),
+            (price_count, "q"),
+            (price_count, "d"),
+        ]:
+            column: memoryview = view[start : start + 8 * count]
+            if sys.byteorder == "big":
+                swapped: array = array(typecode, column.tobytes())
+                swapped.byteswap()
+                column.release()
+                columns.append(swapped)
+            else:
+                columns.append(column.cast(typecode))
+            start += 8 * count
+        if sys.byteorder == "big":
+            view.release()
+            mapped.close()
+            return cls(*columns)
+        store: PriceStore = cls(*columns)
+        store._mmap = mapped
+        return store
+
+    def close(self) -> None:
+        """Releases the memory-mapped file of a store created by open."""
+        if self._mmap is None:
+            return
+        for column in [
+            self.instrument_ids,
+            self.offsets,
+            self.date_ordinals,
+            self.prices,
+        ]:
+            if isinstance(column, memoryview):
+                column.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self) -> "PriceStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def price(self, instrument_id: int, date_: date) -> float | None:
+        """Gets the price of an instrument on a date.
+
+        Args:
+            instrument_id: The id of the instrument.
+            date_: The date of the price.
+
+        Returns:
+            The price, or None if there is no price for the instrument and date.
+        """
+        i: int | None = self._indexes.get(instrument_id)
+        if i is None:
+            return None
+        ordinal: int = date_.toordinal()
+        row: int = bisect_left(
+            self.date_ordinals, ordinal, self.offsets[i], self.offsets[i + 1]
+        )
+        if row < self.offsets[i + 1] and self.date_ordinals[row] == ordinal:
+            return self.prices[row]
+        return None
+
+    def price_slice(
+        self, instrument_ids: Sequence[int], date_from: date, date_to: date
+    ) -> array:
+        """Gets the prices of instruments for every date in a date range.
+
+        Args:
+            instrument_ids: The ids of the instruments.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            A dense date × instrument matrix, stored as a flat array in row-major
+            order, i.e. the price for date index d and instrument index i is found
+            at index d * len(instrument_ids) + i. Missing prices are NaN.
+        """
+        width: int = len(instrument_ids)
+        first: int = date_from.toordinal()
+        last: int = date_to.toordinal()
+        result: array = array("d", [math.nan]) * ((last - first + 1) * width)
+        for column, instrument_id in enumerate(instrument_ids):
+            i: int | None = self._indexes.get(instrument_id)
+            if i is None:
+                continue
+            lo: int = bisect_left(
+                self.date_ordinals, first, self.offsets[i], self.offsets[i + 1]
+            )
+            hi: int = bisect_right(self.date_ordinals, last, lo, self.offsets[i + 1])
+            for row in range(lo, hi):
+                result[(self.date_ordinals[row] - first) * width + column] = (
+                    self.prices[row]
+                )
+        return result
@@ -3,26 +3,169 @@
 __all__: list[str] = ["RiskDbAccessor"]
 
 from .dbaccessor import db_accessor_factory, DbAccessor, DbEngine
+from .migrations import apply_schema_migrations, HOLDING_SNAPSHOT_SELECT
+from .identity_map import IdentityMap
+from ...helpers.instrumentation import MetricsSink
 from ...types import *
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
 from datetime import date
+import threading
 
 
 class RiskDbAccessor:
-    """Type used for communicating with the risk report database."""
+    """Type used for communicating with the risk report database.
 
-    def __init__(self):
-        self._db_accessor = db_accessor_factory(
-            DbEngine.SQLITE, db_path="./db/alecta_case_db.db"
-        )
+    Pending schema migrations are applied when first entering the runtime context.
+    Runtime contexts can be nested, and the database connection is only released
+    when the outermost context exits, so a whole report can run as one session:
+
+        with risk_db_accessor:
+            ...  # Nested with blocks reuse the same connection.
+
+    Reference data (instruments, instrument types, portfolios, key figures and
+    key figure ref types) is cached in an identity map for the lifetime of the
+    object, so the same object is returned for the same id. Accessors created
+    with the identity_map of another accessor share its cache, e.g. to give
+    every report its own accessor without loading reference data again.
+
+    Attributes:
+        db_path: The path to the SQLite database.
+        identity_map: The cache of reference data entities.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "./db/alecta_case_db.db",
+        *,
+        reference_data_ttl: float | None = 300.0,
+        identity_map: IdentityMap | None = None,
+    ):
+        if identity_map is None:
+            identity_map = IdentityMap(ttl=reference_data_ttl)
+        self.db_path = db_path
+        self.identity_map = identity_map
+        self._db_accessor = db_accessor_factory(DbEngine.SQLITE, db_path=db_path)
+        self._is_migrated = False
+        self._migration_lock = threading.Lock()
+        self._local = threading.local()
 
     def __enter__(self) -> object:
         self._db_accessor.connect()
+        if not self._is_migrated:
+            with self._migration_lock:
+                if not self._is_migrated:
+                    apply_schema_migrations(self._db_accessor)
+                    self._is_migrated = True
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         self._db_accessor.close()
 
+    @property
+    def metrics(self) -> MetricsSink | None:
+        """The sink the statements of the accessor are recorded to, see SQLiteDbAccesssor."""
+        return self._db_accessor.metrics
+
+    @metrics.setter
+    def metrics(self, value: MetricsSink | None) -> None:
+        self._db_accessor.metrics = value
+
+    def transaction(self) -> Iterator[None]:
+        """Gets a context manager grouping the writes within it into one transaction.
+
+        See DbAccessor.transaction.
+        """
+        return self._db_accessor.transaction()
+
+    @contextmanager
+    def batch_changes(self) -> Iterator[None]:
+        """Context manager recording the changes of bulk price writes per instrument.
+
+        The change tracking triggers of Prices bump the watermark of the
+        instrument of every row inserted, updated or deleted, and log the date
+        it changed from, see get_portfolio_changed_from. upsert_prices and
+        merge_staged_prices suspend the triggers, and only record the earliest
+        date changed of every instrument they write. When the outermost batch
+        exits, the watermarks of the changed instruments are bumped once, and
+        one change is logged per instrument, for its earliest changed date.
+        This makes bulk loads much faster, and adds one row to the ChangeLog
+        per instrument instead of per price. Every call of upsert_prices and
+        merge_staged_prices outside a batch is a batch of its own.
+
+        The batch is a transaction, see transaction, so other connections never
+        see a batch in progress. Other writes within the batch are tracked row
+        by row as usual.
+
+        Example usage:
+            with risk_db_accessor.batch_changes():
+                for chunk in chunks:
+                    risk_db_accessor.upsert_prices(chunk)
+        """
+        db: DbAccessor = self._db_accessor
+        depth: int = getattr(self._local, "batch_depth", 0)
+        with db.transaction():
+            if depth == 0:
+                db.execute_query(
+                    "create temp table if not exists PendingPriceChange "
+                    "(instrument_id INTEGER NOT NULL PRIMARY KEY, date TEXT NOT NULL);"
+                )
+            self._local.batch_depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.batch_depth = depth
+            if depth > 0:
+                return
+            # All changed instruments get the same new version, see migrations.
+            parameters: tuple[int, int] = (
+                self.get_key_figure_ref_type_from_name("Instrument").id_,
+                self.get_database_watermark() + 1,
+            )
+            db.execute_query(
+                "insert into ChangeWatermark (ref_type, ref_entity_id, version) "
+                "select ?, instrument_id, ? from temp.PendingPriceChange where true "
+                "on conflict (ref_type, ref_entity_id) "
+                "do update set version = excluded.version;",
+                parameters,
+            )
+            db.execute_query(
+                "insert into ChangeLog (ref_type, ref_entity_id, date, version) "
+                "select ?, instrument_id, date, ? from temp.PendingPriceChange "
+                "where true on conflict (ref_type, ref_entity_id, date) "
+                "do update set version = excluded.version;",
+                parameters,
+            )
+            db.execute_query("drop table temp.PendingPriceChange;")
+
+    def _record_price_changes(self, table: str) -> None:
+        """Records the earliest date of every instrument whose staged price is new
+        or changed, see batch_changes.
+
+        Args:
+            table: A staging table with the columns instrument_id, date and price.
+        """
+        self._db_accessor.execute_query(
+            "insert into temp.PendingPriceChange (instrument_id, date) "
+            f"select s.instrument_id, min(s.date) from {table} s "
+            "left join Prices p on p.instrument_id = s.instrument_id "
+            "and p.date = s.date where p.price is null or p.price <> s.price "
+            "group by s.instrument_id on conflict (instrument_id) "
+            "do update set date = min(date, excluded.date);"
+        )
+
+    @contextmanager
+    def _suspend_change_tracking(self, table: str) -> Iterator[None]:
+        """Suspends the change tracking triggers of a table, see batch_changes."""
+        db: DbAccessor = self._db_accessor
+        db.execute_query(
+            "insert into SuspendedChangeTracking (table_name) values (?);", (table,)
+        )
+        yield
+        db.execute_query(
+            "delete from SuspendedChangeTracking where table_name = ?;", (table,)
+        )
+
     def _generic_select(
         self, columns: list[str], table: str, /, *, id_: int | None = None
     ) -> list[Any]:
@@ -40,28 +183,40 @@ class RiskDbAccessor:
             f"delete from {table} where id = ?", (id_,)
         )
 
-    def get_instruments(self) -> list[Instrument]:
-        """Get all instruments in the database.
+    def invalidate_reference_data(self, entity_type: type | None = None) -> None:
+        """Invalidates cached reference data, forcing it to be reloaded on next access.
 
-        Returns:
-            A list of all instruments in the database.
+        Args:
+            entity_type: The type of entity to invalidate, e.g. Instrument.
+                If None, all reference data is invalidated.
         """
+        self.identity_map.invalidate(entity_type)
+
+    @staticmethod
+    def _create_instrument(id_: int, name: str, instrument_type_id: int) -> Instrument:
+        match instrument_type_id:
+            case 1:
+                return Equity.create_trusted(id_, name)
+            case 2:
+                return Bond.create_trusted(id_, name)
+        raise ValueError(
+            f"instrument_type_id {instrument_type_id} has not been implemented."
+        )
 
+    def _select_instruments(self) -> list[Instrument]:
         instruments_ = self._generic_select(
             ["id", "name", "instrument_type_id"], "Instrument"
         )
-        result: list[Instrument] = []
-        for inst in instruments_:
-            match inst[2]:
-                case 1:
-                    result.append(Equity(inst[0], inst[1]))
-                case 2:
-                    result.append(Bond(inst[0], inst[1]))
-                case _:
-                    raise ValueError(
-                        f"instrument_type_id {inst[2]} has not been implemented."
-                    )
-        return result
+        return [self._create_instrument(*inst) for inst in instruments_]
+
+    def get_instruments(self) -> list[Instrument]:
+        """Get all instruments in the database.
+
+        Returns:
+            A list of all instruments in the database.
+        """
+        self.identity_map.load(Instrument, self._select_instruments)
+        return self.identity_map.get_all(Instrument)
 
     def get_instrument(self, id_: int) -> Instrument | None:
         """Get the instrument with the provided id.
@@ -72,14 +227,8 @@ class RiskDbAccessor:
         Returns:
             The instrument if found, otherwise None.
         """
-        instruments_: list[Instrument] = [
-            i for i in self.get_instruments() if i.id_ == id_
-        ]
-        count = len(instruments_)
-        if count == 0:
-            return None
-        else:
-            return instruments_[0]
+        self.identity_map.load(Instrument, self._select_instruments)
+        return self.identity_map.get(Instrument, id_)
 
     def get_instrument_from_name(self, name: str) -> Instrument | None:
         """Gets the instrument with the provided name.
@@ -90,20 +239,24 @@ class RiskDbAccessor:
         Returns:
             The instrument if found, otherwise None.
         """
-        instruments_: list[Instrument] = [
-            i for i in self.get_instruments() if i.name == name
-        ]
-        count = len(instruments_)
-        if count == 0:
-            return None
-        else:
-            return instruments_[0]
+        self.identity_map.load(Instrument, self._select_instruments)
+        return self.identity_map.get_from_name(Instrument, name)
 
-    def get_instrument_types(self) -> list[InstrumentType]:
+    def _select_instrument_types(self) -> list[InstrumentType]:
         instrument_types: list[Any] = self._generic_select(
             ["id", "name"], "InstrumentType"
         )
-        return [InstrumentType(row[0], row[1]) for row in instrument_types]
+        return [
+            InstrumentType.create_trusted(row[0], row[1]) for row in instrument_types
+        ]
+
+    def get_instrument_types(self) -> list[InstrumentType]:
+        self.identity_map.load(InstrumentType, self._select_instrument_types)
+        return self.identity_map.get_all(InstrumentType)
+
+    def _select_portfolios(self) -> list[Portfolio]:
+        portfolios: list[Any] = self._generic_select(["id", "name"], "Portfolio")
+        return [Portfolio.create_trusted(row[0], row[1]) for row in portfolios]
 
     def get_portfolios(self) -> list[Portfolio]:
         """Gets all portfolios in the database.
@@ -111,9 +264,8 @@ class RiskDbAccessor:
         Returns:
             A list of all portfolios in the database.
         """
-
-        portfolios: list[Any] = self._generic_select(["id", "name"], "Portfolio")
-        return [Portfolio(row[0], row[1]) for row in portfolios]
+        self.identity_map.load(Portfolio, self._select_portfolios)
+        return self.identity_map.get_all(Portfolio)
 
     def get_portfolio(self, id_: int) -> Portfolio | None:
         """Gets the portfolio with the provided id.
@@ -124,14 +276,8 @@ class RiskDbAccessor:
         Returns:
             The portfolio if found, otherwise None.
         """
-        portfolios_: list[Portfolio] = [
-            i for i in self.get_portfolios() if i.id_ == id_
-        ]
-        count = len(portfolios_)
-        if count == 0:
-            return None
-        else:
-            return portfolios_[0]
+        self.identity_map.load(Portfolio, self._select_portfolios)
+        return self.identity_map.get(Portfolio, id_)
 
     def get_portfolio_from_name(self, name: str) -> Portfolio | None:
         """Gets the portfolio with the provided name.
@@ -142,89 +288,119 @@ class RiskDbAccessor:
         Returns:
             The portfolio if found, otherwise None.
         """
-        portfolios_: list[Portfolio] = [
-            i for i in self.get_portfolios() if i.name == name
-        ]
-        count = len(portfolios_)
-        if count == 0:
-            return None
-        else:
-            return portfolios_[0]
+        self.identity_map.load(Portfolio, self._select_portfolios)
+        return self.identity_map.get_from_name(Portfolio, name)
+
+    def _select_positions(
+        self, conditions: list[str], parameters: list[Any], /
+    ) -> list[Position]:
+        query: str = (
+            "select p.id, p.date_from, p.date_to, p.portfolio_id, p.instrument_id"
+            ", p.quantity, pf.name, i.name, i.instrument_type_id from Position p"
+            " inner join Portfolio pf on pf.id = p.portfolio_id"
+            " inner join Instrument i on i.id = p.instrument_id"
+        )
+        if len(conditions) > 0:
+            query = query + " where " + " and ".join(conditions)
+        query = query + " order by p.id;"
+        positions_: list[Any] = self._db_accessor.execute_select_query(
+            query, tuple(parameters)
+        )
+
+        result: list[Position] = []
+        for pos in positions_:
+            portfolio_: Portfolio = self.identity_map.get_or_add(
+                Portfolio, pos[3], lambda: Portfolio.create_trusted(pos[3], pos[6])
+            )
+            instrument_: Instrument = self.identity_map.get_or_add(
+                Instrument,
+                pos[4],
+                lambda: self._create_instrument(pos[4], pos[7], pos[8]),
+            )
+            result.append(
+                Position.create_trusted(
+                    pos[0],
+                    portfolio_,
+                    instrument_,
+                    date.fromisoformat(pos[1]),
+                    date.fromisoformat(pos[2]),
+                    pos[5],
+                )
+            )
+        return result
 
     def get_positions(
-        self, *, position_date: date | None = None, portfolio: Portfolio | None = None
+        self,
+        *,
+        position_date: date | None = None,
+        portfolio: Portfolio | None = None,
+        date_from: date | None = None,
+        date_to: date | None = None,
     ) -> list[Position]:
         """Gets all positions in the database.
 
-        This method can also be called with arguments position_date and portfolio.
-        If an argument is provided it is used to filter the results.
+        This method can also be called with arguments position_date, portfolio,
+        date_from and date_to. If an argument is provided it is used to filter the
+        results in the SQL query, which makes use of the index on
+        (portfolio_id, date_from, date_to).
 
         Args:
             position_date: A date a position's [date_from, date_to] interval must cover.
             portfolio: A portfolio a position must belong to.
+            date_from: The earliest date a position's interval must end on or after.
+            date_to: The latest date a position's interval must start on or before.
 
         Returns:
-            A list of all positions in the database.
+            A list of all positions in the database, ordered by id.
         """
-        positions_: list[Any] = self._generic_select(
-            ["id", "date_from", "date_to", "portfolio_id", "instrument_id", "quantity"],
-            "Position",
-        )
-        result: list[Position] = []
-        for pos in positions_:
-            include: bool = True
-            id_: int = pos[0]
-            date_from = date.fromisoformat(pos[1])
-            date_to = date.fromisoformat(pos[2])
-            portfolio_: Portfolio = self.get_portfolio(pos[3])
-            instrument_: Instrument = self.get_instrument(pos[4])
-            quantity: float = pos[5]
-
-            if position_date is not None:
-                if not (position_date >= date_from and position_date <= date_to):
-                    include = False
-
-            if portfolio is not None:
-                if not portfolio.id_ == portfolio_.id_:
-                    include = False
-
-            if include:
-                result.append(
-                    Position.create(
-                        id_, portfolio_, instrument_, date_from, date_to, quantity
-                    )
-                )
-        return result
+        conditions: list[str] = []
+        parameters: list[Any] = []
+        if portfolio is not None:
+            conditions.append("p.portfolio_id = ?")
+            parameters.append(portfolio.id_)
+        if position_date is not None:
+            conditions.append("p.date_from <= ? and ? <= p.date_to")
+            parameters.extend([position_date.isoformat()] * 2)
+        if date_from is not None:
+            conditions.append("p.date_to >= ?")
+            parameters.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("p.date_from <= ?")
+            parameters.append(date_to.isoformat())
+        return self._select_positions(conditions, parameters)
 
     def get_position(self, id_: int) -> Position | None:
-        positions: Position = [pos for pos in self.get_positions() if pos.id_ == id_]
+        positions: list[Position] = self._select_positions(["p.id = ?"], [id_])
         count: int = len(positions)
         if count == 0:
             return None
         else:
             return positions[0]
 
-    def get_key_figures(self) -> list[KeyFigure]:
+    def _select_key_figures(self) -> list[KeyFigure]:
         key_figures_: list[Any] = self._generic_select(["id", "name"], "KeyFigure")
-        return [KeyFigure(row[0], row[1]) for row in key_figures_]
+        return [KeyFigure.create_trusted(row[0], row[1]) for row in key_figures_]
+
+    def get_key_figures(self) -> list[KeyFigure]:
+        self.identity_map.load(KeyFigure, self._select_key_figures)
+        return self.identity_map.get_all(KeyFigure)
 
     def get_key_figure(self, id_: int) -> KeyFigure | None:
-        suspects = [kf for kf in self.get_key_figures() if kf.id_ == id_]
-        count = len(suspects)
-        if count == 0:
-            return None
-        else:
-            return suspects[0]
+        self.identity_map.load(KeyFigure, self._select_key_figures)
+        return self.identity_map.get(KeyFigure, id_)
 
     def get_key_figure_from_name(self, name: str) -> KeyFigure | None:
-        key_figures_: list[KeyFigure] = [
-            i for i in self.get_key_figures() if i.name == name
+        self.identity_map.load(KeyFigure, self._select_key_figures)
+        return self.identity_map.get_from_name(KeyFigure, name)
+
+    def _select_key_figure_ref_types(self) -> list[KeyFigureRefType]:
+        key_figure_ref_types: list[Any] = self._generic_select(
+            ["id", "name"], "KeyFigureRefType"
+        )
+        return [
+            KeyFigureRefType.create_trusted(row[0], row[1])
+            for row in key_figure_ref_types
         ]
-        count: int = len(key_figures_)
-        if count == 0:
-            return None
-        else:
-            return key_figures_[0]
 
     def get_key_figure_ref_types(self) -> list[KeyFigureRefType]:
         """Gets all key figure ref types in the database.
@@ -232,10 +408,8 @@ class RiskDbAccessor:
         Returns:
             A list of all key figure ref types in the database.
         """
-        key_figure_ref_types: list[Any] = self._generic_select(
-            ["id", "name"], "KeyFigureRefType"
-        )
-        return [KeyFigureRefType(row[0], row[1]) for row in key_figure_ref_types]
+        self.identity_map.load(KeyFigureRefType, self._select_key_figure_ref_types)
+        return self.identity_map.get_all(KeyFigureRefType)
 
     def get_key_figure_ref_type_from_name(self, name: str) -> KeyFigureRefType | None:
         """Gets a key figure ref type matching the provided name from the database.
@@ -246,58 +420,137 @@ class RiskDbAccessor:
         Returns:
             A KeyFigureRefType instance if found, otherwise None.
         """
-        key_figure_ref_types: list[KeyFigureRefType] = [
-            i for i in self.get_key_figure_ref_types() if i.name == name
-        ]
-        count = len(key_figure_ref_types)
-        if count == 0:
-            return None
-        else:
-            return key_figure_ref_types[0]
+        self.identity_map.load(KeyFigureRefType, self._select_key_figure_ref_types)
+        return self.identity_map.get_from_name(KeyFigureRefType, name)
 
     def get_key_figure_ref_type_from_id(self, id_: int) -> KeyFigureRefType | None:
-        key_figure_ref_types: list[KeyFigureRefType] = self._generic_select(
-            ["id", "name"], "KeyFigureRefType", id_=id_
-        )
-        count = len(key_figure_ref_types)
-        if count == 0:
-            return None
-        else:
-            return KeyFigureRefType(
-                key_figure_ref_types[0][0], key_figure_ref_types[0][1]
-            )
+        self.identity_map.load(KeyFigureRefType, self._select_key_figure_ref_types)
+        return self.identity_map.get(KeyFigureRefType, id_)
 
     def get_key_figure_values(self) -> list[KeyFigureValue]:
         """Gets all key figure values in the database.
 
+        See iter_key_figure_values, for filtering and for iterating over the
+        values without loading all of them.
+
         Returns:
             A list of KeyFigureValue instances.
         """
-        key_figure_values: list[Any] = self._generic_select(
-            ["id", "date", "value", "ref_type", "ref_entity_id", "key_figure_id"],
-            "KeyFigureValue",
+        return list(self.iter_key_figure_values())
+
+    def iter_key_figure_values(
+        self,
+        *,
+        key_figure: KeyFigure | None = None,
+        key_figure_ref_type: KeyFigureRefType | None = None,
+        reference_entity: BaseEntity | None = None,
+        date_from: date | None = None,
+        date_to: date | None = None,
+        batch_size: int = 1000,
+    ) -> Iterator[KeyFigureValue]:
+        """Yields key figure values from the database, reading them in batches.
+
+        If an argument is provided it is used to filter the values in the SQL
+        query. Rows are read batch_size rows at a time, so memory use does not
+        depend on the number of values. Key figures, ref types, instruments
+        and portfolios are resolved from the cached reference data, and the
+        positions of a batch are loaded with one query.
+
+        The accessor must remain open while iterating.
+
+        Args:
+            key_figure: The key figure of the values.
+            key_figure_ref_type: The type of the entities the values are for.
+            reference_entity: The entity the values are for. Its ref type is
+                derived from its type if key_figure_ref_type is None.
+            date_from: The earliest date to get values for.
+            date_to: The latest date to get values for.
+            batch_size: The number of rows read at a time.
+
+        Yields:
+            KeyFigureValue instances, in no particular order.
+        """
+        if reference_entity is not None and key_figure_ref_type is None:
+            for entity_type in (Instrument, Position, Portfolio):
+                if isinstance(reference_entity, entity_type):
+                    key_figure_ref_type = self.get_key_figure_ref_type_from_name(
+                        entity_type.__name__
+                    )
+                    break
+            else:
+                raise ValueError(
+                    f"{type(reference_entity).__name__} is not a key figure ref type."
+                )
+
+        conditions: list[str] = []
+        parameters: list[Any] = []
+        if key_figure is not None:
+            conditions.append("key_figure_id = ?")
+            parameters.append(key_figure.id_)
+        if key_figure_ref_type is not None:
+            conditions.append("ref_type = ?")
+            parameters.append(key_figure_ref_type.id_)
+        if reference_entity is not None:
+            conditions.append("ref_entity_id = ?")
+            parameters.append(reference_entity.id_)
+        if date_from is not None:
+            conditions.append("date >= ?")
+            parameters.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("date <= ?")
+            parameters.append(date_to.isoformat())
+        query: str = (
+            "select id, date, value, ref_type, ref_entity_id, key_figure_id "
+            "from KeyFigureValue"
         )
-        result: list[KeyFigureValue] = []
-        for kfv in key_figure_values:
-            id_: int = kfv[0]
-            date_: date = date.fromisoformat(kfv[1])
-            value: float | int = kfv[2]
-            ref_type: KeyFigureRefType = self.get_key_figure_ref_type_from_id(kfv[3])
-            ref_entity: BaseEntity
-            match ref_type.name:
-                case "Instrument":
-                    ref_entity = self.get_instrument(kfv[4])
-                case "Position":
-                    ref_entity = self.get_position(kfv[4])
-                case "Portfolio":
-                    ref_entity = self.get_portfolio(kfv[4])
-                case _:
-                    raise RuntimeError
-            key_figure = self.get_key_figure(kfv[5])
-            result.append(
-                KeyFigureValue(id_, date_, value, ref_type, ref_entity, key_figure)
-            )
-        return result
+        if len(conditions) > 0:
+            query = query + " where " + " and ".join(conditions)
+
+        key_figures: dict[int, KeyFigure] = {
+            kf.id_: kf for kf in self.get_key_figures()
+        }
+        ref_types: dict[int, KeyFigureRefType] = {
+            t.id_: t for t in self.get_key_figure_ref_types()
+        }
+        instruments: dict[int, Instrument] = {
+            i.id_: i for i in self.get_instruments()
+        }
+        portfolios: dict[int, Portfolio] = {p.id_: p for p in self.get_portfolios()}
+        for rows in self._db_accessor.iter_select_query(
+            query + ";", tuple(parameters), batch_size=batch_size
+        ):
+            position_ids: set[int] = {
+                row[4] for row in rows if ref_types[row[3]].name == "Position"
+            }
+            positions: dict[int, Position] = {}
+            if len(position_ids) > 0:
+                positions = {
+                    p.id_: p
+                    for p in self._select_positions(
+                        [f"p.id in ({','.join('?' * len(position_ids))})"],
+                        list(position_ids),
+                    )
+                }
+            for row in rows:
+                ref_type: KeyFigureRefType = ref_types[row[3]]
+                ref_entity: BaseEntity
+                match ref_type.name:
+                    case "Instrument":
+                        ref_entity = instruments.get(row[4])
+                    case "Position":
+                        ref_entity = positions.get(row[4])
+                    case "Portfolio":
+                        ref_entity = portfolios.get(row[4])
+                    case _:
+                        raise RuntimeError
+                yield KeyFigureValue.create_trusted(
+                    row[0],
+                    date.fromisoformat(row[1]),
+                    row[2],
+                    ref_type,
+                    ref_entity,
+                    key_figures[row[5]],
+                )
 
     def insert_key_figure_value(self, key_figure_value: KeyFigureValue) -> None:
         v: KeyFigureValue = key_figure_value
@@ -352,6 +605,433 @@ class RiskDbAccessor:
             self.insert_key_figure_value(v)
             return None
 
+    def upsert_key_figure_values(
+        self, key_figure_values: list[KeyFigureValue]
+    ) -> list[int]:
+        """Inserts or updates key figure values in bulk, in a single transaction.
+
+        Rows are matched on (date, ref_type, ref_entity_id, key_figure_id), i.e.
+        the columns of the unique index U_KeyFigureValue. The id_ attribute of
+        every key figure value is set to the id of its row.
+
+        Args:
+            key_figure_values: The key figure values to insert or update.
+
+        Returns:
+            The ids of the rows, in the order of key_figure_values.
+        """
+        if len(key_figure_values) == 0:
+            return []
+
+        keys: list[tuple[str, int, int, int]] = [
+            (
+                v.key_figure_date.isoformat(),
+                v.key_figure_ref_type.id_,
+                v.reference_entity.id_,
+                v.key_figure.id_,
+            )
+            for v in key_figure_values
+        ]
+        entity_ids: set[int] = {k[2] for k in keys}
+        key_figure_ids: set[int] = {k[3] for k in keys}
+
+        with self._db_accessor.transaction():
+            self._db_accessor.execute_many(
+                "insert into KeyFigureValue (date, value, ref_type, ref_entity_id"
+                ", key_figure_id) values (?, ?, ?, ?, ?) on conflict (date, ref_type"
+                ", ref_entity_id, key_figure_id) do update set value = excluded.value;",
+                [
+                    (k[0], v.value, k[1], k[2], k[3])
+                    for k, v in zip(keys, key_figure_values)
+                ],
+            )
+            rows: list[Any] = self._db_accessor.execute_select_query(
+                "select id, date, ref_type, ref_entity_id, key_figure_id "
+                "from KeyFigureValue where date >= ? and date <= ? "
+                f"and ref_entity_id in ({','.join('?' * len(entity_ids))}) "
+                f"and key_figure_id in ({','.join('?' * len(key_figure_ids))});",
+                (
+                    min(k[0] for k in keys),
+                    max(k[0] for k in keys),
+                    *entity_ids,
+                    *key_figure_ids,
+                ),
+            )
+
+        ids: dict[tuple[str, int, int, int], int] = {
+            (row[1], row[2], row[3], row[4]): row[0] for row in rows
+        }
+        result: list[int] = []
+        for k, v in zip(keys, key_figure_values):
+            v.id_ = ids[k]
+            result.append(v.id_)
+        return result
+
+    def get_key_figure_values_for_range(
+        self,
+        key_figure: KeyFigure,
+        key_figure_ref_type: KeyFigureRefType,
+        reference_entity: BaseEntity,
+        date_from: date,
+        date_to: date,
+        /,
+    ) -> list[KeyFigureValue]:
+        """Gets the stored values of a key figure for an entity and a date range.
+
+        Args:
+            key_figure: The key figure.
+            key_figure_ref_type: The type of the entity.
+            reference_entity: The entity the values are for.
+            date_from: The earliest date to get values for.
+            date_to: The latest date to get values for.
+
+        Returns:
+            A list of KeyFigureValue instances, ordered by date.
+        """
+        rows: list[Any] = self._db_accessor.execute_select_query(
+            "select id, date, value from KeyFigureValue where key_figure_id = ? "
+            "and ref_type = ? and ref_entity_id = ? and date >= ? and date <= ? "
+            "order by date;",
+            (
+                key_figure.id_,
+                key_figure_ref_type.id_,
+                reference_entity.id_,
+                date_from.isoformat(),
+                date_to.isoformat(),
+            ),
+        )
+        return [
+            KeyFigureValue.create_trusted(
+                row[0],
+                date.fromisoformat(row[1]),
+                row[2],
+                key_figure_ref_type,
+                reference_entity,
+                key_figure,
+            )
+            for row in rows
+        ]
+
+    def get_portfolio_watermark(self, portfolio: Portfolio) -> int:
+        """Gets the change watermark of a portfolio.
+
+        The watermark increases whenever a position of the portfolio, or a price
+        of an instrument the portfolio has a position in, is inserted, updated
+        or deleted.
+
+        Args:
+            portfolio: The portfolio.
+
+        Returns:
+            The watermark, 0 if none of the portfolio's inputs has changed
+            since change tracking was enabled.
+        """
+        return self._db_accessor.execute_select_query(
+            "select coalesce(max(w.version), 0) from ChangeWatermark w "
+            "inner join KeyFigureRefType t on t.id = w.ref_type "
+            "where (t.name = 'Portfolio' and w.ref_entity_id = ?1) "
+            "or (t.name = 'Instrument' and w.ref_entity_id in "
+            "(select instrument_id from Position where portfolio_id = ?1));",
+            (portfolio.id_,),
+        )[0][0]
+
+    def get_database_watermark(self) -> int:
+        """Gets the change watermark of the whole database.
+
+        The watermark increases whenever any position or price is inserted,
+        updated or deleted, see get_portfolio_watermark.
+
+        Returns:
+            The watermark, 0 if no position or price has changed since change
+            tracking was enabled.
+        """
+        return self._db_accessor.execute_select_query(
+            "select coalesce(max(version), 0) from ChangeWatermark;"
+        )[0][0]
+
+    def get_rolling_key_figure_state_rows(
+        self, portfolios: list[Portfolio] | None = None
+    ) -> list[tuple[Any, ...]]:
+        """Gets the saved rolling key figure states of portfolios, see EndOfDayUpdater.
+
+        Args:
+            portfolios: The portfolios to get the states of, None for all portfolios.
+
+        Returns:
+            A list of (portfolio_id, date, market_value, cumulative_from,
+            cumulative_growth, return_count, return_mean, return_m2, log_returns,
+            settings) tuples, where the dates are ISO formatted strings,
+            log_returns is a bytes object, and settings identifies the settings
+            the state was computed with, ordered by portfolio id.
+        """
+        query: str = (
+            "select portfolio_id, date, market_value, cumulative_from, "
+            "cumulative_growth, return_count, return_mean, return_m2, log_returns, "
+            "settings from RollingKeyFigureState"
+        )
+        parameters: tuple[int, ...] = ()
+        if portfolios is not None:
+            query += f" where portfolio_id in ({','.join('?' * len(portfolios))})"
+            parameters = tuple(portfolio.id_ for portfolio in portfolios)
+        return self._db_accessor.execute_select_query(
+            query + " order by portfolio_id;", parameters
+        )
+
+    def upsert_rolling_key_figure_state_rows(
+        self, rows: Iterable[tuple[Any, ...]]
+    ) -> None:
+        """Inserts or replaces rolling key figure states, on portfolio id.
+
+        Args:
+            rows: Tuples in the format returned by get_rolling_key_figure_state_rows.
+        """
+        self._db_accessor.execute_many(
+            "insert into RollingKeyFigureState (portfolio_id, date, market_value, "
+            "cumulative_from, cumulative_growth, return_count, return_mean, "
+            "return_m2, log_returns, settings) "
+            "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "on conflict (portfolio_id) do update set date = excluded.date, "
+            "market_value = excluded.market_value, "
+            "cumulative_from = excluded.cumulative_from, "
+            "cumulative_growth = excluded.cumulative_growth, "
+            "return_count = excluded.return_count, "
+            "return_mean = excluded.return_mean, return_m2 = excluded.return_m2, "
+            "log_returns = excluded.log_returns, settings = excluded.settings;",
+            list(rows),
+        )
+
+    def get_holding_snapshot_rows(
+        self, portfolio: Portfolio | None = None
+    ) -> list[tuple[int, int, str, float]]:
+        """Gets the materialized holdings of portfolios, see get_holdings.
+
+        Args:
+            portfolio: The portfolio to get the holdings of, None for all portfolios.
+
+        Returns:
+            A list of (portfolio_id, instrument_id, date, quantity) tuples, where
+            date is an ISO formatted string, ordered by portfolio id, instrument
+            id and date.
+        """
+        query: str = "select portfolio_id, instrument_id, date, quantity "
+        query += "from HoldingSnapshot"
+        parameters: tuple[Any, ...] = ()
+        if portfolio is not None:
+            query += " where portfolio_id = ?"
+            parameters = (portfolio.id_,)
+        return self._db_accessor.execute_select_query(
+            query + " order by portfolio_id, instrument_id, date;", parameters
+        )
+
+    def get_holdings(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> list[tuple[date, dict[int, float]]]:
+        """Gets the holdings of a portfolio on date_from and on every change after it.
+
+        The holdings are read from the table HoldingSnapshot, which materializes
+        the quantity of every instrument held by every portfolio on the dates it
+        changes. It is maintained by triggers whenever a position is inserted,
+        updated or deleted, so the holdings are not derived from the validity
+        periods of the positions, see check_holding_snapshot.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            A list of tuples of a date and the quantity held of every instrument
+            from that date until the next date, keyed by instrument id, in the
+            format of PositionIndex.holdings.
+        """
+        rows: list[tuple[int, str, float]] = self._db_accessor.execute_select_query(
+            "select instrument_id, date, quantity from HoldingSnapshot h "
+            "where portfolio_id = ?1 and date <= ?3 and (date > ?2 or date = ("
+            "select max(s.date) from HoldingSnapshot s "
+            "where s.portfolio_id = ?1 and s.instrument_id = h.instrument_id "
+            "and s.date <= ?2)) order by date, instrument_id;",
+            (portfolio.id_, date_from.isoformat(), date_to.isoformat()),
+        )
+        first_date: str = date_from.isoformat()
+        quantities: dict[int, float] = {}
+        result: list[tuple[date, dict[int, float]]] = [(date_from, quantities)]
+        for instrument_id, date_, quantity in rows:
+            if date_ > first_date and result[-1][0].isoformat() != date_:
+                quantities = dict(quantities)
+                result.append((date.fromisoformat(date_), quantities))
+            if quantity == 0.0:
+                quantities.pop(instrument_id, None)
+            else:
+                quantities[instrument_id] = quantity
+        return result
+
+    def rebuild_holding_snapshot(self) -> int:
+        """Rebuilds the materialized holdings of all portfolios from the positions.
+
+        Returns:
+            The number of rows of the rebuilt snapshot.
+        """
+        with self._db_accessor.transaction():
+            self._db_accessor.execute_query("delete from HoldingSnapshot;")
+            return self._db_accessor.execute_query(
+                "insert into HoldingSnapshot (portfolio_id, instrument_id, date, "
+                f"quantity) {HOLDING_SNAPSHOT_SELECT};"
+            )
+
+    def check_holding_snapshot(
+        self,
+    ) -> list[tuple[int, int, str, float, float]]:
+        """Compares the materialized holdings with holdings rebuilt from the positions.
+
+        The holdings are rebuilt from scratch in a query, without modifying the
+        snapshot, and the quantity held according to both is compared on every
+        date on which either changes.
+
+        Returns:
+            A list of (portfolio_id, instrument_id, date, expected, actual)
+            tuples, one for every date on which the quantity held differs,
+            where expected is the quantity rebuilt from the positions and actual
+            the quantity of the snapshot, held from that date. Empty if the
+            snapshot is consistent.
+        """
+        series: dict[tuple[int, int], list[list[tuple[str, float]]]] = {}
+        for column, rows in enumerate(
+            [
+                self._db_accessor.execute_select_query(
+                    f"{HOLDING_SNAPSHOT_SELECT} order by 1, 2, 3;"
+                ),
+                self.get_holding_snapshot_rows(),
+            ]
+        ):
+            for portfolio_id, instrument_id, date_, quantity in rows:
+                series.setdefault((portfolio_id, instrument_id), [[], []])[
+                    column
+                ].append((date_, quantity))
+
+        differences: list[tuple[int, int, str, float, float]] = []
+        for (portfolio_id, instrument_id), (expected, actual) in sorted(
+            series.items()
+        ):
+            held: list[float] = [0.0, 0.0]
+            changes: list[tuple[str, int, float]] = sorted(
+                [(d, 0, q) for d, q in expected] + [(d, 1, q) for d, q in actual]
+            )
+            for k, (date_, column, quantity) in enumerate(changes):
+                held[column] = quantity
+                if k + 1 < len(changes) and changes[k + 1][0] == date_:
+                    continue
+                if held[0] != held[1]:
+                    differences.append(
+                        (portfolio_id, instrument_id, date_, held[0], held[1])
+                    )
+        return differences
+
+    def get_portfolio_changed_from(
+        self, portfolio: Portfolio, watermark: int
+    ) -> date | None:
+        """Gets the earliest date from which the inputs of a portfolio changed.
+
+        Args:
+            portfolio: The portfolio.
+            watermark: A watermark of the portfolio, see get_portfolio_watermark.
+
+        Returns:
+            The earliest date of the positions of the portfolio, and of the
+            prices of the instruments it has a position in, which were inserted,
+            updated or deleted after the watermark. None if no change after the
+            watermark was recorded.
+        """
+        rows: list[Any] = self._db_accessor.execute_select_query(
+            "select min(c.date) from ChangeLog c "
+            "inner join KeyFigureRefType t on t.id = c.ref_type "
+            "where c.version > ?2 and ("
+            "(t.name = 'Portfolio' and c.ref_entity_id = ?1) or "
+            "(t.name = 'Instrument' and c.ref_entity_id in "
+            "(select instrument_id from Position where portfolio_id = ?1)));",
+            (portfolio.id_, watermark),
+        )
+        return None if rows[0][0] is None else date.fromisoformat(rows[0][0])
+
+    def validate_key_figure_values(
+        self, portfolio: Portfolio, settings: str = ""
+    ) -> bool:
+        """Deletes the stored key figure values of a portfolio affected by changed inputs.
+
+        The watermark of the portfolio is compared with the watermark recorded
+        the last time the stored values were validated. If they differ, the
+        stored key figure values of the portfolio on or after the earliest
+        changed date are deleted, see get_portfolio_changed_from, and the new
+        watermark is recorded. Values before that date only depend on prices
+        and positions of earlier dates, and are kept. All stored values are
+        deleted if the changed date is unknown, or if the values were validated
+        with other settings. The first time a portfolio is validated, its
+        watermark and settings are recorded and no values are deleted, i.e.
+        values stored before are assumed to be computed from the current prices
+        and positions, with the settings passed.
+
+        Args:
+            portfolio: The portfolio.
+            settings: Identifies the settings the values are computed with,
+                e.g. MarketValueEngine.settings_key. Values computed with other
+                settings are not reused.
+
+        Returns:
+            True if the watermark or the settings changed and stored values may
+            have been deleted, otherwise False.
+        """
+        watermark: int = self.get_portfolio_watermark(portfolio)
+        rows: list[Any] = self._db_accessor.execute_select_query(
+            "select watermark, settings from KeyFigureCacheState "
+            "where portfolio_id = ?;",
+            (portfolio.id_,),
+        )
+        if len(rows) > 0 and tuple(rows[0]) == (watermark, settings):
+            return False
+
+        changed_from: date | None = None
+        if len(rows) > 0 and rows[0][1] == settings:
+            changed_from = self.get_portfolio_changed_from(portfolio, rows[0][0])
+        with self._db_accessor.transaction():
+            if len(rows) > 0:
+                self._db_accessor.execute_query(
+                    "delete from KeyFigureValue where ref_type = ? "
+                    "and ref_entity_id = ? and date >= ?;",
+                    (
+                        self.get_key_figure_ref_type_from_name("Portfolio").id_,
+                        portfolio.id_,
+                        (changed_from or date.min).isoformat(),
+                    ),
+                )
+            self._db_accessor.execute_query(
+                "insert into KeyFigureCacheState (portfolio_id, watermark, settings) "
+                "values (?, ?, ?) on conflict (portfolio_id) do update set "
+                "watermark = excluded.watermark, settings = excluded.settings;",
+                (portfolio.id_, watermark, settings),
+            )
+            # Changes seen by every validated portfolio are no longer needed.
+            # Portfolios without a recorded watermark do not look changes up.
+            self._db_accessor.execute_query(
+                "delete from ChangeLog where version <= "
+                "(select min(watermark) from KeyFigureCacheState);"
+            )
+        return len(rows) > 0
+
+    def get_key_figure_settings(self, portfolio: Portfolio) -> str | None:
+        """Gets the settings the stored key figure values of a portfolio were
+        last validated with, see validate_key_figure_values.
+
+        Args:
+            portfolio: The portfolio.
+
+        Returns:
+            The settings, None if the portfolio was never validated.
+        """
+        rows: list[Any] = self._db_accessor.execute_select_query(
+            "select settings from KeyFigureCacheState where portfolio_id = ?;",
+            (portfolio.id_,),
+        )
+        return rows[0][0] if len(rows) > 0 else None
+
     def delete_key_figure_values(self) -> int:
         """Deletes all key figure values in the database.
 
@@ -368,10 +1048,51 @@ class RiskDbAccessor:
             return True
         return False
 
+    def get_price_rows(
+        self,
+        *,
+        instrument: Instrument | None = None,
+        instruments: list[Instrument] | None = None,
+        date_from: date | None = None,
+        date_to: date | None = None,
+    ) -> list[tuple[int, int, str, float]]:
+        """Gets prices from the database as rows, without creating Price objects.
+
+        Takes the same arguments as get_prices, and is meant for computations
+        which process many prices at once.
+
+        Returns:
+            A list of (id, instrument_id, date, price) tuples, where date is an
+            ISO formatted string, ordered by instrument id and date.
+        """
+        conditions: list[str] = []
+        parameters: list[Any] = []
+        if instrument is not None:
+            conditions.append("instrument_id = ?")
+            parameters.append(instrument.id_)
+        if instruments is not None:
+            conditions.append(
+                f"instrument_id in ({','.join('?' * len(instruments))})"
+            )
+            parameters.extend([i.id_ for i in instruments])
+        if date_from is not None:
+            conditions.append("date >= ?")
+            parameters.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("date <= ?")
+            parameters.append(date_to.isoformat())
+
+        query: str = "select id, instrument_id, date, price from Prices"
+        if len(conditions) > 0:
+            query = query + " where " + " and ".join(conditions)
+        query = query + " order by instrument_id, date;"
+        return self._db_accessor.execute_select_query(query, tuple(parameters))
+
     def get_prices(
         self,
         *,
         instrument: Instrument | None = None,
+        instruments: list[Instrument] | None = None,
         date_from: date | None = None,
         date_to: date | None = None,
     ) -> list[Price]:
@@ -379,41 +1100,156 @@ class RiskDbAccessor:
 
         This method can be called without arguments or optionally
         with arguments. If any argument is provided it is used as
-        a filter.
+        a filter in the SQL query, which makes use of the index on
+        (instrument_id, date).
 
         Args:
             instrument: The instrument to get prices for.
+            instruments: The instruments to get prices for.
             date_from: The earliest date to get prices for.
             date_to: The latest date to get prices for.
 
         Returns:
-            A list of Price objects.
+            A list of Price objects, ordered by instrument id and date.
         """
 
-        all_prices: list[Any] = self._generic_select(
-            ["id", "instrument_id", "date", "price"], "Prices"
+        prices_: list[Any] = self.get_price_rows(
+            instrument=instrument,
+            instruments=instruments,
+            date_from=date_from,
+            date_to=date_to,
         )
 
-        result: list[Price] = []
-        for price in all_prices:
-            include: bool = True
-            id_: int = price[0]
-            instrument_id = price[1]
-            date_: date = date.fromisoformat(price[2])
-            value: float = price[3]
-
-            if instrument is not None:
-                if instrument.id_ != instrument_id:
-                    include = False
-            if date_from is not None:
-                if date_ < date_from:
-                    include = False
-            if date_to is not None:
-                if date_ > date_to:
-                    include = False
-
-            if include:
-                result.append(
-                    Price(id_, self.get_instrument(instrument_id), date_, value)
+        # Resolve the instruments once per call rather than once per row.
+        instruments_: dict[int, Instrument]
+        if instrument is not None:
+            instruments_ = {instrument.id_: instrument}
+        elif instruments is not None:
+            instruments_ = {i.id_: i for i in instruments}
+        else:
+            instruments_ = {i.id_: i for i in self.get_instruments()}
+
+        return [
+            Price.create_trusted(
+                row[0], instruments_[row[1]], date.fromisoformat(row[2]), row[3]
+            )
+            for row in prices_
+        ]
+
+    def upsert_prices(self, rows: Iterable[tuple[int, str, float]]) -> int:
+        """Inserts or updates prices in bulk, in a single transaction.
+
+        Rows are matched on (instrument_id, date), i.e. the columns of the
+        unique index U_Prices, and the price of existing rows is updated. If a
+        row is passed more than once, the last row is used. Rows whose price is
+        unchanged are left as is, so that they do not bump the change watermark
+        of their instrument. The changes are recorded once per instrument, see
+        batch_changes.
+
+        Args:
+            rows: (instrument_id, date, price) tuples, where date is an ISO
+                formatted string.
+
+        Returns:
+            The number of inserted or changed rows.
+        """
+        db: DbAccessor = self._db_accessor
+        with self.batch_changes():
+            db.execute_query(
+                "create temp table if not exists PriceUpsert (instrument_id INTEGER "
+                "NOT NULL, date TEXT NOT NULL, price REAL NOT NULL);"
+            )
+            db.execute_many(
+                "insert into temp.PriceUpsert (instrument_id, date, price) "
+                "values (?, ?, ?);",
+                rows,
+            )
+            self._record_price_changes("temp.PriceUpsert")
+            with self._suspend_change_tracking("Prices"):
+                count: int = db.execute_query(
+                    "insert into Prices (instrument_id, date, price) "
+                    "select instrument_id, date, price from temp.PriceUpsert "
+                    "where true order by rowid on conflict (instrument_id, date) "
+                    "do update set price = excluded.price "
+                    "where price <> excluded.price;"
                 )
-        return result
+            db.execute_query("drop table temp.PriceUpsert;")
+            return count
+
+    def create_price_staging_table(self) -> None:
+        """Creates an empty temporary table used by stage_prices.
+
+        The table only exists for the current connection, so the staging and
+        merging of prices must happen within one runtime context. It is stored
+        in a temporary file, so its size is not limited by the memory available.
+        """
+        self._db_accessor.execute_query("drop table if exists temp.PriceStaging;")
+        self._db_accessor.execute_query(
+            "create temp table PriceStaging "
+            "(instrument_id INTEGER NOT NULL, date TEXT NOT NULL, price REAL NOT NULL);"
+        )
+
+    def stage_prices(self, rows: Iterable[tuple[int, str, float]]) -> int:
+        """Appends prices to the staging table, see create_price_staging_table.
+
+        Args:
+            rows: (instrument_id, date, price) tuples, where date is an ISO
+                formatted string.
+
+        Returns:
+            The number of staged rows.
+        """
+        return self._db_accessor.execute_many(
+            "insert into temp.PriceStaging (instrument_id, date, price) "
+            "values (?, ?, ?);",
+            rows,
+        )
+
+    def merge_staged_prices(self) -> int:
+        """Upserts the staged prices into Prices and drops the staging table.
+
+        Meant for very large loads: existing prices are updated through the
+        (instrument_id, date) index, whereas new prices are appended with the
+        index dropped, and the index is rebuilt once afterwards. If a price is
+        staged more than once, the last staged price is used. Prices which are
+        unchanged are left as is, and the changes are recorded once per
+        instrument, as in upsert_prices.
+
+        Returns:
+            The number of inserted or changed rows.
+        """
+        db: DbAccessor = self._db_accessor
+        with self.batch_changes():
+            db.execute_query(
+                "delete from temp.PriceStaging where rowid not in (select max(rowid) "
+                "from temp.PriceStaging group by instrument_id, date);"
+            )
+            db.execute_query(
+                'create unique index temp."U_PriceStaging" '
+                'on "PriceStaging" ("instrument_id", "date");'
+            )
+            self._record_price_changes("temp.PriceStaging")
+            with self._suspend_change_tracking("Prices"):
+                updated: int = db.execute_query(
+                    "update Prices set price = s.price from temp.PriceStaging s "
+                    "where s.instrument_id = Prices.instrument_id "
+                    "and s.date = Prices.date and s.price <> Prices.price;"
+                )
+                db.execute_query(
+                    "delete from temp.PriceStaging where exists (select 1 from "
+                    "Prices p where p.instrument_id = PriceStaging.instrument_id "
+                    "and p.date = PriceStaging.date);"
+                )
+                db.execute_query('drop index "U_Prices";')
+                inserted: int = db.execute_query(
+                    "insert into Prices (instrument_id, date, price) select "
+                    "instrument_id, date, price from temp.PriceStaging "
+                    "order by instrument_id, date;"
+                )
+                # Same index as created by schema migration 1.
+                db.execute_query(
+                    'create unique index "U_Prices" '
+                    'on "Prices" ("instrument_id", "date");'
+                )
+            db.execute_query("drop table temp.PriceStaging;")
+        return updated + inserted
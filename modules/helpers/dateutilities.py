@@ -1,18 +1,28 @@
 """Useful date functions.
 
 Contains useful date functions, such as retrieving
-the last business day etc.
+the last business day etc. See trading_calendar for
+the business days of a market.
 """
 
 __all__: list[str] = ["last_business_day"]
 
+from .trading_calendar import TradingCalendar
 from datetime import date, timedelta
 
 
-def last_business_day(input_date: date) -> date:
-    """Get the last business day based on a given input date."""
+def last_business_day(
+    input_date: date, calendar: TradingCalendar | None = None
+) -> date:
+    """Get the last business day based on a given input date.
+
+    Only weekends are considered, unless a calendar with the holidays of a
+    market is provided.
+    """
     if not isinstance(input_date, date):
         raise TypeError
+    if calendar is not None:
+        return calendar.previous_business_day(input_date)
     weekday = input_date.weekday()
     subtract_days = 1
     match weekday:
@@ -0,0 +1,300 @@
+"""Instrumentation of database statements and method calls.
+
+Contains the MetricsSink interface, which instrumented code reports to, and
+sinks aggregating the reported metrics in memory, as well as a histogram of
+latencies.
+"""
+
+__all__: list[str] = [
+    "MetricsSink",
+    "MetricsCollector",
+    "MultiMetricsSink",
+    "LatencyHistogram",
+    "statement_shape",
+    "timed",
+]
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import lru_cache, wraps
+from typing import Any, Callable, Iterator
+import inspect
+import re
+import threading
+import time
+
+
+class MetricsSink(ABC):
+    """Abstract base class (ABC) of the receivers of instrumentation metrics.
+
+    Implement this interface to forward metrics to a monitoring system.
+    """
+
+    @abstractmethod
+    def record_statement(self, shape: str, rows: int, elapsed: float) -> None:
+        """Records the execution of a database statement.
+
+        Args:
+            shape: The statement, normalized by statement_shape.
+            rows: The number of rows returned or affected by the statement.
+            elapsed: The execution time in seconds.
+        """
+
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_timing(self, name: str, elapsed: float) -> None:
+        """Records the execution of a timed operation, e.g. a method call.
+
+        Args:
+            name: The name of the operation.
+            elapsed: The execution time in seconds.
+        """
+
+        raise NotImplementedError
+
+
+class MetricsCollector(MetricsSink):
+    """Metrics sink aggregating counts and times in memory.
+
+    Statements are aggregated per shape, and timings per name. The collector
+    can be shared by several threads.
+
+    Example usage:
+        metrics = MetricsCollector()
+        rfg = RiskFigureGenerator(metrics=metrics)
+        rfg.market_value_for_portfolio_and_date("EQ_US", date(2024, 5, 31))
+        print(metrics.to_dict())
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._statements: dict[str, list[float]] = {}
+        self._timings: dict[str, list[float]] = {}
+
+    def record_statement(self, shape: str, rows: int, elapsed: float) -> None:
+        with self._lock:
+            stats: list[float] = self._statements.setdefault(shape, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += rows
+            stats[2] += elapsed
+
+    def record_timing(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            stats: list[float] = self._timings.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def reset(self) -> None:
+        """Discards all recorded metrics."""
+        with self._lock:
+            self._statements.clear()
+            self._timings.clear()
+
+    def to_dict(self) -> dict[str, Any]:
+        """Gets the aggregated metrics, suitable for JSON serialization.
+
+        Returns:
+            A dictionary with the totals of all statements, and the count,
+            rows and time of every statement shape and the count and time of
+            every timed operation, ordered by descending time.
+        """
+        with self._lock:
+            statements: list[tuple[str, list[float]]] = sorted(
+                self._statements.items(), key=lambda item: -item[1][2]
+            )
+            timings: list[tuple[str, list[float]]] = sorted(
+                self._timings.items(), key=lambda item: -item[1][1]
+            )
+        return {
+            "queries": sum(stats[0] for _, stats in statements),
+            "rows": sum(stats[1] for _, stats in statements),
+            "query_time": sum(stats[2] for _, stats in statements),
+            "statements": [
+                {"shape": shape, "count": count, "rows": rows, "time": elapsed}
+                for shape, (count, rows, elapsed) in statements
+            ],
+            "timings": {
+                name: {"count": count, "time": elapsed}
+                for name, (count, elapsed) in timings
+            },
+        }
+
+
+class MultiMetricsSink(MetricsSink):
+    """Metrics sink forwarding every metric to several sinks."""
+
+    def __init__(self, sinks: list[MetricsSink]) -> None:
+        self.sinks = sinks
+
+    def record_statement(self, shape: str, rows: int, elapsed: float) -> None:
+        for sink in self.sinks:
+            sink.record_statement(shape, rows, elapsed)
+
+    def record_timing(self, name: str, elapsed: float) -> None:
+        for sink in self.sinks:
+            sink.record_timing(name, elapsed)
+
+
+class LatencyHistogram:
+    """Histogram of latencies, with fixed bucket boundaries.
+
+    Recording a latency is O(log(number of buckets)) and the memory used is
+    constant, so a histogram can record every request of a long-running
+    process. Percentiles are estimated as the upper boundary of the bucket
+    the percentile falls into. The histogram can be shared by several threads.
+
+    Example usage:
+        histogram = LatencyHistogram()
+        histogram.record(0.012)
+        print(histogram.percentile(0.99))
+
+    Attributes:
+        boundaries: The upper boundaries of the buckets in seconds, in
+            ascending order. Latencies above the last boundary are counted
+            in an overflow bucket.
+    """
+
+    DEFAULT_BOUNDARIES: tuple[float, ...] = (
+        0.0005,
+        0.001,
+        0.002,
+        0.005,
+        0.01,
+        0.02,
+        0.05,
+        0.1,
+        0.2,
+        0.5,
+        1.0,
+        2.0,
+        5.0,
+    )
+
+    def __init__(self, boundaries: tuple[float, ...] = DEFAULT_BOUNDARIES) -> None:
+        self.boundaries = boundaries
+        self._lock = threading.Lock()
+        self._counts: list[int] = [0] * (len(boundaries) + 1)
+        self._count: int = 0
+        self._sum: float = 0.0
+        self._max: float = 0.0
+
+    def record(self, elapsed: float) -> None:
+        """Records a latency in seconds."""
+        bucket: int = bisect_left(self.boundaries, elapsed)
+        with self._lock:
+            self._counts[bucket] += 1
+            self._count += 1
+            self._sum += elapsed
+            self._max = max(self._max, elapsed)
+
+    def percentile(self, fraction: float) -> float:
+        """Estimates a percentile of the recorded latencies.
+
+        Args:
+            fraction: The percentile as a fraction, e.g. 0.99.
+
+        Returns:
+            The upper boundary of the bucket of the percentile, or the maximum
+            latency if it falls into the overflow bucket. 0.0 if nothing has
+            been recorded.
+        """
+        with self._lock:
+            if self._count == 0:
+                return 0.0
+            rank: float = fraction * self._count
+            cumulative: int = 0
+            for bucket, count in enumerate(self._counts):
+                cumulative += count
+                if cumulative >= rank and count > 0:
+                    if bucket == len(self.boundaries):
+                        return self._max
+                    return min(self.boundaries[bucket], self._max)
+            return self._max
+
+    def to_dict(self) -> dict[str, Any]:
+        """Gets the histogram, suitable for JSON serialization."""
+        percentiles: dict[str, float] = {
+            f"p{round(fraction * 100)}": self.percentile(fraction)
+            for fraction in [0.5, 0.9, 0.99]
+        }
+        with self._lock:
+            return {
+                "count": self._count,
+                "mean": self._sum / self._count if self._count > 0 else 0.0,
+                "max": self._max,
+                **percentiles,
+                "buckets": {
+                    **{
+                        f"le_{boundary:g}": count
+                        for boundary, count in zip(self.boundaries, self._counts)
+                    },
+                    "overflow": self._counts[-1],
+                },
+            }
+
+
+_WHITESPACE: re.Pattern = re.compile(r"\s+")
+_PLACEHOLDER_LIST: re.Pattern = re.compile(r"\(\s*\?(\s*,\s*\?)*\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(query: str) -> str:
+    """Normalizes a statement, so that statements differing only in layout or in
+    the length of their parameter lists have the same shape.
+
+    Example:
+        statement_shape("select * from T\\n where id in (?, ?, ?);")
+        # "select * from T where id in (?...);"
+    """
+    return _PLACEHOLDER_LIST.sub("(?...)", _WHITESPACE.sub(" ", query).strip())
+
+
+def timed(method: Callable) -> Callable:
+    """Decorator recording the execution time of a method to the metrics sink of
+    its instance, i.e. its metrics attribute, if not None.
+
+    The timing is recorded under the qualified name of the method. For
+    generator methods, the time spent producing the values is recorded once
+    the generator is exhausted or closed.
+    """
+    name: str = method.__qualname__
+
+    if inspect.isgeneratorfunction(method):
+
+        @wraps(method)
+        def generator_wrapper(self, *args, **kwargs) -> Iterator[Any]:
+            metrics: MetricsSink | None = self.metrics
+            if metrics is None:
+                yield from method(self, *args, **kwargs)
+                return
+            elapsed: float = 0.0
+            generator: Iterator[Any] = method(self, *args, **kwargs)
+            try:
+                while True:
+                    start: float = time.perf_counter()
+                    try:
+                        value: Any = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield value
+            finally:
+                generator.close()
+                metrics.record_timing(name, elapsed)
+
+        return generator_wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs) -> Any:
+        metrics: MetricsSink | None = self.metrics
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        start: float = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            metrics.record_timing(name, time.perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,74 @@
+"""Rolling window statistics.
+
+Contains types for updating statistics of a sliding window of observations
+in constant time per observation.
+"""
+
+__all__: list[str] = ["RollingStatistics"]
+
+import math
+
+
+class RollingStatistics:
+    """Mean and sample standard deviation of a window of observations.
+
+    The statistics are updated using Welford's algorithm, extended to also
+    support removing observations, so that sliding a window one step costs
+    O(1) regardless of the window size.
+
+    Example usage:
+        stats = RollingStatistics()
+        for x in observations:
+            stats.add(x)
+            if stats.count > window_size:
+                stats.remove(observations_to_drop.popleft())
+    """
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.mean: float = 0.0
+        self._m2: float = 0.0
+
+    @classmethod
+    def from_moments(cls, count: int, mean: float, m2: float) -> "RollingStatistics":
+        """Creates statistics from a state saved with the moments attribute."""
+        stats: RollingStatistics = cls()
+        stats.count = count
+        stats.mean = mean
+        stats._m2 = m2
+        return stats
+
+    @property
+    def moments(self) -> tuple[int, float, float]:
+        """The state of the statistics, the count, mean and sum of squared deviations."""
+        return self.count, self.mean, self._m2
+
+    def add(self, value: float) -> None:
+        """Adds an observation to the window."""
+        self.count += 1
+        delta: float = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def remove(self, value: float) -> None:
+        """Removes an observation, previously added, from the window."""
+        if self.count <= 1:
+            self.count = 0
+            self.mean = 0.0
+            self._m2 = 0.0
+            return
+        mean: float = (self.count * self.mean - value) / (self.count - 1)
+        self._m2 -= (value - self.mean) * (value - mean)
+        self._m2 = max(self._m2, 0.0)
+        self.mean = mean
+        self.count -= 1
+
+    def variance(self) -> float:
+        """Returns the sample variance of the observations in the window."""
+        if self.count < 2:
+            raise ValueError("variance requires at least two observations.")
+        return self._m2 / (self.count - 1)
+
+    def stdev(self) -> float:
+        """Returns the sample standard deviation of the observations in the window."""
+        return math.sqrt(self.variance())
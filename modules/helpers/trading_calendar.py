@@ -0,0 +1,274 @@
+"""Trading calendars.
+
+Contains types for iterating over and stepping between the business days of a
+market, and the holiday rules of the supported markets (SE and US).
+"""
+
+__all__: list[str] = [
+    "TradingCalendar",
+    "AllDaysCalendar",
+    "easter_sunday",
+    "swedish_holidays",
+    "us_holidays",
+    "MARKET_HOLIDAYS",
+]
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Callable, Iterable
+
+
+def easter_sunday(year: int) -> date:
+    """Gets the date of Easter Sunday of a year, using the anonymous Gregorian algorithm."""
+    a: int = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f: int = (b + 8) // 25
+    g: int = (b - f + 1) // 3
+    h: int = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l: int = (32 + 2 * e + 2 * i - h - k) % 7
+    m: int = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """Gets the nth (1-based, or -1 for the last) weekday of a month."""
+    if n > 0:
+        first: date = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last: date = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(holiday: date) -> date:
+    """Moves a holiday falling on a Saturday to Friday and on a Sunday to Monday."""
+    match holiday.weekday():
+        case 5:
+            return holiday - timedelta(days=1)
+        case 6:
+            return holiday + timedelta(days=1)
+    return holiday
+
+
+def swedish_holidays(year: int) -> set[date]:
+    """Gets the dates of a year on which the Stockholm stock exchange is closed."""
+    easter: date = easter_sunday(year)
+    midsummer_eve: date = date(year, 6, 19)
+    midsummer_eve += timedelta(days=(4 - midsummer_eve.weekday()) % 7)
+    return {
+        date(year, 1, 1),  # New Year's Day
+        date(year, 1, 6),  # Epiphany
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        date(year, 5, 1),  # May Day
+        easter + timedelta(days=39),  # Ascension Day
+        date(year, 6, 6),  # National Day
+        midsummer_eve,  # The Friday of June 19-25
+        date(year, 12, 24),  # Christmas Eve
+        date(year, 12, 25),  # Christmas Day
+        date(year, 12, 26),  # Boxing Day
+        date(year, 12, 31),  # New Year's Eve
+    }
+
+
+def us_holidays(year: int) -> set[date]:
+    """Gets the dates of a year on which the New York stock exchange is closed."""
+    holidays: set[date] = {
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter_sunday(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(date(year, 7, 4)),  # Independence Day
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        _observed(date(year, 12, 25)),  # Christmas Day
+    }
+    # New Year's Day is not observed on the Friday before when on a Saturday.
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(_observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+# The holiday rules of every supported market.
+MARKET_HOLIDAYS: dict[str, Callable[[int], set[date]]] = {
+    "SE": swedish_holidays,
+    "US": us_holidays,
+}
+
+
+class TradingCalendar:
+    """The business days of a market over a range of years.
+
+    The business days are precomputed as a sorted array of date ordinals, and
+    an index from every calendar day of the range to the last business day on
+    or before it, so stepping between business days is O(1) and getting the
+    business days of a date range is O(number of days returned).
+
+    Example usage:
+        calendar = TradingCalendar.for_market("SE")
+        calendar.business_days(date(2024, 3, 25), date(2024, 4, 5))
+
+    Attributes:
+        name: The name of the calendar, e.g. the market.
+        first_date: The first date of the range of the calendar.
+        last_date: The last date of the range of the calendar.
+        days_per_year: The mean number of business days per year, used
+            for annualizing daily figures.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        holidays: Iterable[date],
+        *,
+        first_year: int = 2000,
+        last_year: int = 2050,
+        weekend: tuple[int, ...] = (5, 6),
+    ) -> None:
+        if first_year > last_year:
+            raise ValueError("first_year must be <= last_year.")
+        self.name = name
+        self.first_date = date(first_year, 1, 1)
+        self.last_date = date(last_year, 12, 31)
+        holiday_ordinals: set[int] = {d.toordinal() for d in holidays}
+        first_ordinal: int = self.first_date.toordinal()
+        self._first_ordinal = first_ordinal
+        self._ordinals: array = array("q")
+        self._index: array = array("q")
+        for ordinal in range(first_ordinal, self.last_date.toordinal() + 1):
+            if (ordinal - 1) % 7 not in weekend and ordinal not in holiday_ordinals:
+                self._ordinals.append(ordinal)
+            self._index.append(len(self._ordinals) - 1)
+        if len(self._ordinals) == 0:
+            raise ValueError(f"Calendar {name} has no business days.")
+        self.days_per_year: float = len(self._ordinals) / (last_year - first_year + 1)
+
+    @classmethod
+    def for_market(
+        cls, market: str, *, first_year: int = 2000, last_year: int = 2050
+    ) -> "TradingCalendar":
+        """Creates the calendar of a market, see MARKET_HOLIDAYS.
+
+        Args:
+            market: The market, e.g. "SE" or "US".
+            first_year: The first year of the calendar.
+            last_year: The last year of the calendar.
+
+        Raises:
+            ValueError: If the market is not supported.
+        """
+        holidays: Callable[[int], set[date]] | None = MARKET_HOLIDAYS.get(market)
+        if holidays is None:
+            raise ValueError(f"Market {market} is not supported.")
+        return cls(
+            market,
+            [d for year in range(first_year, last_year + 1) for d in holidays(year)],
+            first_year=first_year,
+            last_year=last_year,
+        )
+
+    def _offset(self, date_: date) -> int:
+        """Gets the index of a date in the range of the calendar."""
+        offset: int = date_.toordinal() - self._first_ordinal
+        if offset < 0 or offset >= len(self._index):
+            raise ValueError(
+                f"{date_.isoformat()} is outside calendar {self.name} "
+                f"({self.first_date.isoformat()} - {self.last_date.isoformat()})."
+            )
+        return offset
+
+    def _business_day(self, position: int) -> date:
+        """Gets the business day at a position of the array of business days."""
+        if position < 0 or position >= len(self._ordinals):
+            raise ValueError(f"No such business day in calendar {self.name}.")
+        return date.fromordinal(self._ordinals[position])
+
+    def is_business_day(self, date_: date) -> bool:
+        """Returns True if date_ is a business day, otherwise False."""
+        position: int = self._index[self._offset(date_)]
+        return position >= 0 and self._ordinals[position] == date_.toordinal()
+
+    def roll_backward(self, date_: date) -> date:
+        """Gets the last business day on or before date_."""
+        return self._business_day(self._index[self._offset(date_)])
+
+    def roll_forward(self, date_: date) -> date:
+        """Gets the first business day on or after date_."""
+        return self.next_business_day(date_ - timedelta(days=1))
+
+    def previous_business_day(self, date_: date) -> date:
+        """Gets the last business day before date_."""
+        return self.roll_backward(date_ - timedelta(days=1))
+
+    def next_business_day(self, date_: date) -> date:
+        """Gets the first business day after date_."""
+        return self._business_day(self._index[self._offset(date_)] + 1)
+
+    def shift(self, date_: date, business_days: int) -> date:
+        """Gets the business day a number of business days from date_.
+
+        Args:
+            date_: A business day.
+            business_days: The number of business days to move, negative to
+                move backward.
+
+        Raises:
+            ValueError: If date_ is not a business day, or the result is
+                outside the calendar.
+        """
+        if not self.is_business_day(date_):
+            raise ValueError(f"{date_.isoformat()} is not a business day.")
+        return self._business_day(self._index[self._offset(date_)] + business_days)
+
+    def business_days(self, date_from: date, date_to: date) -> list[date]:
+        """Gets the business days of [date_from, date_to], in ascending order."""
+        if date_from > date_to:
+            return []
+        self._offset(date_from)
+        self._offset(date_to)
+        first: int = bisect_left(self._ordinals, date_from.toordinal())
+        last: int = bisect_right(self._ordinals, date_to.toordinal())
+        return [date.fromordinal(o) for o in self._ordinals[first:last]]
+
+
+class AllDaysCalendar(TradingCalendar):
+    """Calendar in which every day is a business day, with 365 days per year.
+
+    This is the calendar used by default, and it covers every date. Stepping
+    between days is simple date arithmetic.
+    """
+
+    def __init__(self) -> None:
+        self.name = "All days"
+        self.first_date = date.min
+        self.last_date = date.max
+        self.days_per_year = 365.0
+
+    def is_business_day(self, date_: date) -> bool:
+        return True
+
+    def roll_backward(self, date_: date) -> date:
+        return date_
+
+    def roll_forward(self, date_: date) -> date:
+        return date_
+
+    def previous_business_day(self, date_: date) -> date:
+        return date_ - timedelta(days=1)
+
+    def next_business_day(self, date_: date) -> date:
+        return date_ + timedelta(days=1)
+
+    def shift(self, date_: date, business_days: int) -> date:
+        return date_ + timedelta(days=business_days)
+
+    def business_days(self, date_from: date, date_to: date) -> list[date]:
+        return [
+            date_from + timedelta(days=d)
+            for d in range((date_to - date_from).days + 1)
+        ]
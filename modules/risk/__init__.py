@@ -1,2 +1,9 @@
 from .risk_figure_generator import *
+from .key_figure_registry import *
 from .riskreport import *
+from .market_value_engine import *
+from .batch_riskreport import *
+from .async_riskreport import *
+from .report_server import *
+from .end_of_day import *
+from .covariance_engine import *
@@ -0,0 +1,128 @@
+"""Contains an asyncio facade used for generating many risk reports concurrently."""
+
+__all__: list[str] = ["AsyncRiskReport"]
+
+from ..api.db import AsyncRiskDbAccessor, RiskDbAccessor
+from .risk_figure_generator import RiskFigureGenerator
+from .riskreport import RiskReportSettings, RiskReport
+from datetime import date
+from typing import Any
+import asyncio
+
+# The inputs identifying a report: portfolio name, date range and key figures.
+_ReportKey = tuple[str, date, date, tuple[str, ...]]
+
+
+class AsyncRiskReport:
+    """Type used to serve concurrent risk report requests from asyncio code.
+
+    Reports are generated on the worker threads of an AsyncRiskDbAccessor, so
+    the number of threads is bounded regardless of the number of requests.
+    Every report is generated with its own RiskFigureGenerator and database
+    accessor, which only share the reference data cached by the accessor of
+    the AsyncRiskDbAccessor, so that concurrent reports never see the metrics
+    sinks or diagnostics of each other.
+
+    Requests for the same inputs (portfolio, date range and key figures) made
+    while a report for those inputs is being generated are coalesced: they
+    wait for the report in flight instead of generating it again, and receive
+    the same report object, which should therefore not be modified.
+
+    At most max_pending distinct reports are queued or generated at a time.
+    Further requests wait until a report completes, which applies backpressure
+    to the callers instead of queueing an unbounded amount of work.
+
+    Example usage:
+        async with AsyncRiskReport() as service:
+            reports = await asyncio.gather(
+                *[service.generate(settings) for settings in many_settings]
+            )
+
+    Attributes:
+        db: The accessor whose worker threads generate the reports.
+        max_pending: The maximum number of distinct reports in flight.
+        read_through: True if stored figures are reused, see RiskFigureGenerator.
+        coalesced_count: The number of requests served by a report in flight.
+    """
+
+    def __init__(
+        self,
+        db: AsyncRiskDbAccessor | None = None,
+        *,
+        max_pending: int = 64,
+        read_through: bool = False,
+    ) -> None:
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be >= 1, argument is {max_pending}.")
+        if db is None:
+            db = AsyncRiskDbAccessor()
+        self.db = db
+        self.max_pending = max_pending
+        self.read_through = read_through
+        self.coalesced_count: int = 0
+        self._semaphore = asyncio.Semaphore(max_pending)
+        self._in_flight: dict[_ReportKey, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "AsyncRiskReport":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.db.close()
+
+    @property
+    def in_flight(self) -> int:
+        """The number of distinct reports queued or being generated."""
+        return len(self._in_flight)
+
+    async def generate(self, settings: RiskReportSettings) -> dict[str, Any]:
+        """Generates a risk report, see RiskReport.generate.
+
+        Args:
+            settings: The settings of the report.
+
+        Returns:
+            The report.
+        """
+        key: _ReportKey = (
+            settings.portfolio_name,
+            settings.date_from,
+            settings.date_to,
+            tuple(settings.key_figures),
+        )
+        task: asyncio.Task | None = self._in_flight.get(key)
+        if task is None:
+            # Waits for a free slot when max_pending reports are in flight.
+            await self._semaphore.acquire()
+            # A report for the same inputs may have started while waiting.
+            task = self._in_flight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._generate(settings))
+                self._in_flight[key] = task
+                task.add_done_callback(lambda _: self._complete(key))
+            else:
+                self._semaphore.release()
+                self.coalesced_count += 1
+        else:
+            self.coalesced_count += 1
+        # Shielded, so that a cancelled caller does not cancel the report
+        # of the other callers waiting for it.
+        return await asyncio.shield(task)
+
+    def _complete(self, key: _ReportKey) -> None:
+        self._in_flight.pop(key, None)
+        self._semaphore.release()
+
+    async def _generate(self, settings: RiskReportSettings) -> dict[str, Any]:
+        shared: RiskDbAccessor = self.db.risk_db_accessor
+        risk_db_accessor: RiskDbAccessor = RiskDbAccessor(
+            shared.db_path, identity_map=shared.identity_map
+        )
+        report: RiskReport = RiskReport(
+            settings,
+            risk_figure_generator=RiskFigureGenerator(
+                risk_db_accessor, read_through=self.read_through
+            ),
+        )
+        return await self.db.run(
+            lambda _: report.generate(), risk_db_accessor=risk_db_accessor
+        )
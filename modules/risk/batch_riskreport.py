@@ -0,0 +1,194 @@
+"""Contains types used for generating risk reports for many portfolios at once."""
+
+__all__: list[str] = ["BatchRiskReportResult", "BatchRiskReport"]
+
+from ..api.db import RiskDbAccessor
+from ..types import KeyFigureValue
+from .risk_figure_generator import RiskFigureGenerator
+from .riskreport import RiskReportSettings, RiskReport
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Any
+import time
+
+# The state of a worker process, set by _initialize_worker.
+_worker_db: RiskDbAccessor | None = None
+_worker_read_through: bool = False
+
+
+def _initialize_worker(db_path: str, read_through: bool) -> None:
+    """Creates the database accessor of a worker process and loads reference data.
+
+    The reference data is loaded once per worker process and shared by all
+    reports generated by the process.
+    """
+    global _worker_db, _worker_read_through
+    _worker_db = RiskDbAccessor(db_path)
+    _worker_read_through = read_through
+    with _worker_db as db:
+        db.get_instruments()
+        db.get_portfolios()
+        db.get_key_figures()
+        db.get_key_figure_ref_types()
+
+
+def _generate_report(
+    settings: RiskReportSettings,
+) -> tuple[dict[str, Any], list[KeyFigureValue], float]:
+    """Generates a report in a worker process, without writing to the database.
+
+    Returns:
+        A tuple of the report, the key figure values to write and the
+        time it took to generate the report in seconds.
+    """
+    start: float = time.perf_counter()
+    key_figure_values: list[KeyFigureValue] = []
+    rfg: RiskFigureGenerator = RiskFigureGenerator(
+        _worker_db,
+        read_through=_worker_read_through,
+        key_figure_value_writer=key_figure_values.extend,
+    )
+    report: dict[str, Any] = RiskReport(
+        settings, risk_figure_generator=rfg
+    ).generate()
+    return report, key_figure_values, time.perf_counter() - start
+
+
+class BatchRiskReportResult:
+    """Type representing the outcome of a batch of risk reports.
+
+    Attributes:
+        reports: The generated reports, keyed by portfolio name.
+        timings: The time it took to generate each report in seconds, keyed by portfolio name.
+        write_time: The total time spent writing key figure values in seconds.
+        wall_clock: The total time of the batch in seconds.
+    """
+
+    def __init__(self) -> None:
+        self.reports: dict[str, dict[str, Any]] = {}
+        self.timings: dict[str, float] = {}
+        self.write_time: float = 0.0
+        self.wall_clock: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """The number of reports generated per second."""
+        if self.wall_clock == 0.0:
+            return 0.0
+        return len(self.reports) / self.wall_clock
+
+    def summary(self) -> dict[str, Any]:
+        """Gets the timings of the batch, suitable for JSON serialization."""
+        return {
+            "reports": len(self.reports),
+            "wall_clock": self.wall_clock,
+            "write_time": self.write_time,
+            "throughput": self.throughput,
+            "timings": self.timings,
+        }
+
+
+class BatchRiskReport:
+    """Type used to generate risk reports for many portfolios in parallel.
+
+    The figures of every portfolio are computed in a pool of worker processes.
+    The workers only read from the database: the key figure values they compute
+    are sent back to the calling process, which is the single writer to the
+    database, so that the workers do not contend for SQLite's write lock. The
+    stored figures of every portfolio are validated by the calling process
+    before the workers start, see RiskFigureGenerator.validate_key_figure_values.
+
+    Example usage:
+        batch = BatchRiskReport.for_all_portfolios(
+            date(2024, 1, 1), date(2024, 5, 31), ["Market value"]
+        )
+        result = batch.generate()
+        print(result.summary())
+
+    Attributes:
+        settings: The settings of every report in the batch.
+        max_workers: The maximum number of worker processes, None for one per CPU.
+        read_through: If True, figures already stored in the database are reused.
+        db_path: The path to the SQLite database.
+    """
+
+    def __init__(
+        self,
+        settings: list[RiskReportSettings],
+        *,
+        max_workers: int | None = None,
+        read_through: bool = False,
+        db_path: str = "./db/alecta_case_db.db",
+    ) -> None:
+        self.settings = settings
+        self.max_workers = max_workers
+        self.read_through = read_through
+        self.db_path = db_path
+
+    @classmethod
+    def for_all_portfolios(
+        cls,
+        date_from: date,
+        date_to: date,
+        key_figures: list[str],
+        /,
+        **kwargs: Any,
+    ) -> "BatchRiskReport":
+        """Creates a batch with a report for every portfolio in the database.
+
+        Args:
+            date_from: The first date of every report.
+            date_to: The last date of every report.
+            key_figures: The key figures of every report.
+            kwargs: Keyword arguments passed on to BatchRiskReport.
+
+        Returns:
+            A BatchRiskReport.
+        """
+        db: RiskDbAccessor
+        with RiskDbAccessor(kwargs.get("db_path", "./db/alecta_case_db.db")) as db:
+            portfolio_names: list[str] = [p.name for p in db.get_portfolios()]
+        return cls(
+            [
+                RiskReportSettings(name, date_from, date_to, list(key_figures))
+                for name in portfolio_names
+            ],
+            **kwargs,
+        )
+
+    def generate(self) -> BatchRiskReportResult:
+        """Generates all reports of the batch.
+
+        Returns:
+            A BatchRiskReportResult with the reports and timings of the batch.
+        """
+        result: BatchRiskReportResult = BatchRiskReportResult()
+        start: float = time.perf_counter()
+        writer: RiskDbAccessor = RiskDbAccessor(self.db_path)
+        # Validated with the settings of the generators of the workers.
+        validator: RiskFigureGenerator = RiskFigureGenerator(
+            writer, read_through=self.read_through
+        )
+        with writer:
+            for settings in self.settings:
+                validator.validate_key_figure_values(settings.portfolio_name)
+        with writer, ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_initialize_worker,
+            initargs=(self.db_path, self.read_through),
+        ) as executor:
+            futures = {
+                executor.submit(_generate_report, settings): settings.portfolio_name
+                for settings in self.settings
+            }
+            for future in as_completed(futures):
+                report, key_figure_values, elapsed = future.result()
+                portfolio_name: str = futures[future]
+                result.reports[portfolio_name] = report
+                result.timings[portfolio_name] = elapsed
+
+                write_start: float = time.perf_counter()
+                writer.upsert_key_figure_values(key_figure_values)
+                result.write_time += time.perf_counter() - write_start
+        result.wall_clock = time.perf_counter() - start
+        return result
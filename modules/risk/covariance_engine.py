@@ -0,0 +1,418 @@
+"""Contains types used for computing risk figures of all portfolios from one covariance matrix."""
+
+__all__: list[str] = ["CovarianceRiskResult", "CovarianceRiskEngine"]
+
+from ..api.db import RiskDbAccessor, PriceStore
+from ..types import *
+from ..helpers.trading_calendar import TradingCalendar, AllDaysCalendar
+from .market_value_engine import MarketValueEngine
+from .risk_figure_generator import VOLATILITY_WINDOW_DAYS
+from array import array
+from datetime import date
+from typing import Any
+import math
+import operator
+
+
+class CovarianceRiskResult:
+    """Type representing the risk figures of all instruments and portfolios for a date.
+
+    The figures are keyed by the ids of the instruments and portfolios, since
+    names are not unique, and only keyed by name in summary.
+
+    Attributes:
+        date_: The date of the figures.
+        instruments: The instruments of the rows and columns of the covariance
+            matrix, i.e. the instruments with a price on every date of the window.
+        portfolios: The portfolios with figures, ordered by id.
+        covariance: The annualized covariance matrix of the log returns of the
+            instruments, stored as a flat array in row-major order.
+        volatilities: The annualized volatility of every instrument, keyed by
+            instrument id.
+        portfolio_volatilities: The annualized volatility of every portfolio,
+            keyed by portfolio id.
+        marginal_risks: The marginal risk of every instrument held by a
+            portfolio, keyed by portfolio id and instrument id.
+        component_risks: The component risk of every instrument held by a
+            portfolio, keyed by portfolio id and instrument id. The component
+            risks of a portfolio sum to its volatility.
+        excluded_instruments: The instruments missing a price in the window.
+        skipped_portfolios: The portfolios holding an excluded instrument, or
+            without market value.
+    """
+
+    def __init__(self, date_: date) -> None:
+        self.date_ = date_
+        self.instruments: list[Instrument] = []
+        self.portfolios: list[Portfolio] = []
+        self.covariance: array = array("d")
+        self.volatilities: dict[int, float] = {}
+        self.portfolio_volatilities: dict[int, float] = {}
+        self.marginal_risks: dict[int, dict[int, float]] = {}
+        self.component_risks: dict[int, dict[int, float]] = {}
+        self.excluded_instruments: list[Instrument] = []
+        self.skipped_portfolios: list[Portfolio] = []
+
+    def covariance_of(
+        self, instrument_a: Instrument, instrument_b: Instrument
+    ) -> float:
+        """Gets the annualized covariance of the log returns of two instruments.
+
+        Raises:
+            ValueError: If an instrument is not in the covariance matrix.
+        """
+        width: int = len(self.instruments)
+        return self.covariance[
+            self.instruments.index(instrument_a) * width
+            + self.instruments.index(instrument_b)
+        ]
+
+    def summary(self) -> dict[str, Any]:
+        """Gets the figures keyed by name, suitable for JSON serialization."""
+        instruments: dict[int, str] = {i.id_: i.name for i in self.instruments}
+        portfolios: dict[int, str] = {p.id_: p.name for p in self.portfolios}
+        return {
+            "date": self.date_.isoformat(),
+            "volatilities": {
+                instruments[id_]: value for id_, value in self.volatilities.items()
+            },
+            "portfolio_volatilities": {
+                portfolios[id_]: value
+                for id_, value in self.portfolio_volatilities.items()
+            },
+            "component_risks": {
+                portfolios[id_]: {
+                    instruments[instrument_id]: value
+                    for instrument_id, value in risks.items()
+                }
+                for id_, risks in self.component_risks.items()
+            },
+            "excluded_instruments": [i.name for i in self.excluded_instruments],
+            "skipped_portfolios": [p.name for p in self.skipped_portfolios],
+        }
+
+
+class CovarianceRiskEngine:
+    """Type used for computing instrument and portfolio risk figures in one batch.
+
+    The log returns of all instruments over the 3 month window are loaded and
+    computed once, and their covariance matrix Σ is shared by all portfolios:
+    the volatility of a portfolio with market value weights w is sqrt(wᵀΣw),
+    the marginal risk of an instrument is (Σw)ᵢ / sqrt(wᵀΣw) and its
+    component risk is wᵢ times its marginal risk. The cost of a portfolio is
+    therefore quadratic in the number of instruments it holds, instead of
+    linear in the length of its history.
+
+    Figures are stored as key figure values:
+        - "Volatility (3M, ann.)" of every instrument, with ref type Instrument.
+        - "Volatility (3M, ann., covariance)" of every portfolio, with ref type
+          Portfolio. It uses the weights of the date, so it differs from the
+          "Volatility (3M, ann.)" of the market value series of the portfolio
+          if the positions changed during the window.
+        - "Marginal risk (3M, ann.)" and "Component risk (3M, ann.)" of every
+          position held on the date, with ref type Position. The component risk
+          of an instrument held in several positions is split between them in
+          proportion to their market values.
+
+    The stored figures of a portfolio are validated before its volatility is
+    stored, see RiskDbAccessor.validate_key_figure_values and settings_key.
+
+    Example usage:
+        engine = CovarianceRiskEngine()
+        result = engine.compute(date(2024, 5, 31))
+        print(result.portfolio_volatilities)
+    """
+
+    def __init__(
+        self,
+        risk_db_accessor: RiskDbAccessor | None = None,
+        *,
+        price_store: PriceStore | None = None,
+        calendar: TradingCalendar | None = None,
+    ) -> None:
+        if risk_db_accessor is None:
+            risk_db_accessor = RiskDbAccessor()
+        self.price_store = price_store
+        self.calendar = calendar if calendar is not None else AllDaysCalendar()
+        self._risk_db_accessor = risk_db_accessor
+
+    @property
+    def settings_key(self) -> str:
+        """Identifies the settings the figures depend on, see MarketValueEngine.
+
+        Instruments missing a price are excluded, i.e. the settings are those of
+        PricePolicy.STRICT.
+        """
+        return MarketValueEngine(
+            self._risk_db_accessor, calendar=self.calendar
+        ).settings_key
+
+    @property
+    def window(self) -> int:
+        """The number of returns in the window, 3 months of business days."""
+        return round(VOLATILITY_WINDOW_DAYS * self.calendar.days_per_year / 365)
+
+    def compute(self, date_: date, *, store: bool = True) -> CovarianceRiskResult:
+        """Computes the risk figures of all instruments and portfolios for a date.
+
+        Args:
+            date_: The date, the last date of the window. A date which is not a
+                business day is rolled back to the business day before it.
+            store: If True, the figures are stored as key figure values.
+
+        Returns:
+            The figures.
+        """
+        date_ = self.calendar.roll_backward(date_)
+        result: CovarianceRiskResult = CovarianceRiskResult(date_)
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            instruments: list[Instrument] = db.get_instruments()
+            dates: list[date] = self.calendar.business_days(
+                self.calendar.shift(date_, -self.window), date_
+            )
+            unit_values: array = self._unit_values(db, instruments, dates)
+            self._compute_covariance(result, instruments, dates, unit_values)
+            positions: list[Position] = db.get_positions(position_date=date_)
+            weights: dict[int, float] = self._compute_portfolios(
+                result, instruments, unit_values, len(dates) - 1, positions
+            )
+            if store:
+                self._store(db, result, instruments, positions, weights)
+        return result
+
+    def _unit_values(
+        self, db: RiskDbAccessor, instruments: list[Instrument], dates: list[date]
+    ) -> array:
+        """Loads the unit value of every instrument and date, NaN if a price is missing.
+
+        Returns:
+            A dense date × instrument matrix, stored as a flat array in row-major
+            order.
+        """
+        width: int = len(instruments)
+        unit_values: array = array("d", [math.nan]) * (len(dates) * width)
+        if len(dates) == 0 or width == 0:
+            return unit_values
+        if self.price_store is not None:
+            first_ordinal: int = dates[0].toordinal()
+            prices: array = self.price_store.price_slice(
+                [instrument.id_ for instrument in instruments], dates[0], dates[-1]
+            )
+            for d, date_ in enumerate(dates):
+                source: int = (date_.toordinal() - first_ordinal) * width
+                for i in range(width):
+                    price: float = prices[source + i]
+                    if not math.isnan(price):
+                        unit_values[d * width + i] = instruments[i].market_value(
+                            price, 1.0
+                        )
+        else:
+            columns: dict[int, int] = {
+                instrument.id_: i for i, instrument in enumerate(instruments)
+            }
+            rows: dict[str, int] = {
+                date_.isoformat(): d * width for d, date_ in enumerate(dates)
+            }
+            for _, instrument_id, date_, price in db.get_price_rows(
+                date_from=dates[0], date_to=dates[-1]
+            ):
+                row: int | None = rows.get(date_)
+                i: int | None = columns.get(instrument_id)
+                if row is not None and i is not None:
+                    unit_values[row + i] = instruments[i].market_value(price, 1.0)
+        return unit_values
+
+    def _compute_covariance(
+        self,
+        result: CovarianceRiskResult,
+        instruments: list[Instrument],
+        dates: list[date],
+        unit_values: array,
+    ) -> None:
+        """Computes the covariance matrix and the instrument volatilities."""
+        width: int = len(instruments)
+        count: int = len(dates) - 1
+        columns: list[list[float]] = []
+        for i, instrument in enumerate(instruments):
+            values: list[float] = [
+                unit_values[d * width + i] for d in range(len(dates))
+            ]
+            if count < 2 or any(math.isnan(v) or v <= 0.0 for v in values):
+                result.excluded_instruments.append(instrument)
+                continue
+            log_returns: list[float] = [
+                math.log(values[d] / values[d - 1]) for d in range(1, len(values))
+            ]
+            mean: float = math.fsum(log_returns) / count
+            columns.append([r - mean for r in log_returns])
+            result.instruments.append(instrument)
+
+        n: int = len(columns)
+        scale: float = self.calendar.days_per_year / (count - 1) if count > 1 else 0.0
+        covariance: array = array("d", bytes(8 * n * n))
+        for a in range(n):
+            for b in range(a, n):
+                value: float = sum(map(operator.mul, columns[a], columns[b])) * scale
+                covariance[a * n + b] = value
+                covariance[b * n + a] = value
+        result.covariance = covariance
+        for a, instrument in enumerate(result.instruments):
+            result.volatilities[instrument.id_] = math.sqrt(covariance[a * n + a])
+
+    def _compute_portfolios(
+        self,
+        result: CovarianceRiskResult,
+        instruments: list[Instrument],
+        unit_values: array,
+        last_row: int,
+        positions: list[Position],
+    ) -> dict[int, float]:
+        """Computes the volatility, marginal and component risks of every portfolio.
+
+        Returns:
+            The market value of every position, keyed by position id.
+        """
+        width: int = len(instruments)
+        columns: dict[int, int] = {
+            instrument.id_: i for i, instrument in enumerate(instruments)
+        }
+        indexes: dict[int, int] = {
+            instrument.id_: a for a, instrument in enumerate(result.instruments)
+        }
+        n: int = len(result.instruments)
+        position_values: dict[int, float] = {}
+        portfolios: dict[int, Portfolio] = {}
+        holdings: dict[int, dict[int, float]] = {}
+        for pos in positions:
+            unit_value: float = unit_values[
+                last_row * width + columns[pos.instrument.id_]
+            ]
+            position_values[pos.id_] = unit_value * pos.quantity
+            portfolios[pos.portfolio.id_] = pos.portfolio
+            holding: dict[int, float] = holdings.setdefault(pos.portfolio.id_, {})
+            holding[pos.instrument.id_] = (
+                holding.get(pos.instrument.id_, 0.0) + position_values[pos.id_]
+            )
+
+        for portfolio_id, holding in sorted(holdings.items()):
+            market_value: float = math.fsum(holding.values())
+            if any(i not in indexes for i in holding) or market_value == 0.0:
+                result.skipped_portfolios.append(portfolios[portfolio_id])
+                continue
+            held: list[int] = [indexes[i] for i in holding]
+            weights: list[float] = [v / market_value for v in holding.values()]
+            # (Σw)ᵢ for every held instrument i.
+            sigma_w: list[float] = [
+                math.fsum(
+                    result.covariance[a * n + b] * w for b, w in zip(held, weights)
+                )
+                for a in held
+            ]
+            volatility: float = math.sqrt(
+                max(math.fsum(map(operator.mul, weights, sigma_w)), 0.0)
+            )
+            result.portfolios.append(portfolios[portfolio_id])
+            result.portfolio_volatilities[portfolio_id] = volatility
+            marginal: dict[int, float] = {}
+            component: dict[int, float] = {}
+            for a, w, s in zip(held, weights, sigma_w):
+                instrument_id: int = result.instruments[a].id_
+                marginal[instrument_id] = s / volatility if volatility > 0.0 else 0.0
+                component[instrument_id] = w * marginal[instrument_id]
+            result.marginal_risks[portfolio_id] = marginal
+            result.component_risks[portfolio_id] = component
+        return position_values
+
+    def _store(
+        self,
+        db: RiskDbAccessor,
+        result: CovarianceRiskResult,
+        instruments: list[Instrument],
+        positions: list[Position],
+        position_values: dict[int, float],
+    ) -> None:
+        """Stores the figures of a result as key figure values."""
+        instrument_type: KeyFigureRefType = db.get_key_figure_ref_type_from_name(
+            "Instrument"
+        )
+        portfolio_type: KeyFigureRefType = db.get_key_figure_ref_type_from_name(
+            "Portfolio"
+        )
+        position_type: KeyFigureRefType = db.get_key_figure_ref_type_from_name(
+            "Position"
+        )
+        volatility, portfolio_volatility, marginal_risk, component_risk = [
+            db.get_key_figure_from_name(name)
+            for name in [
+                "Volatility (3M, ann.)",
+                "Volatility (3M, ann., covariance)",
+                "Marginal risk (3M, ann.)",
+                "Component risk (3M, ann.)",
+            ]
+        ]
+        date_: date = result.date_
+        values: list[KeyFigureValue] = [
+            KeyFigureValue.create_trusted(
+                0,
+                date_,
+                result.volatilities[instrument.id_],
+                instrument_type,
+                instrument,
+                volatility,
+            )
+            for instrument in result.instruments
+        ]
+        for portfolio_ in result.portfolios:
+            values.append(
+                KeyFigureValue.create_trusted(
+                    0,
+                    date_,
+                    result.portfolio_volatilities[portfolio_.id_],
+                    portfolio_type,
+                    portfolio_,
+                    portfolio_volatility,
+                )
+            )
+
+        # The market value of every instrument held by every portfolio.
+        holdings: dict[tuple[int, int], float] = {}
+        for pos in positions:
+            key: tuple[int, int] = (pos.portfolio.id_, pos.instrument.id_)
+            holdings[key] = holdings.get(key, 0.0) + position_values[pos.id_]
+        for pos in positions:
+            marginal: dict[int, float] | None = result.marginal_risks.get(
+                pos.portfolio.id_
+            )
+            if marginal is None:
+                continue
+            holding: float = holdings[(pos.portfolio.id_, pos.instrument.id_)]
+            share: float = position_values[pos.id_] / holding if holding != 0.0 else 0.0
+            values.append(
+                KeyFigureValue.create_trusted(
+                    0,
+                    date_,
+                    marginal[pos.instrument.id_],
+                    position_type,
+                    pos,
+                    marginal_risk,
+                )
+            )
+            values.append(
+                KeyFigureValue.create_trusted(
+                    0,
+                    date_,
+                    result.component_risks[pos.portfolio.id_][pos.instrument.id_]
+                    * share,
+                    position_type,
+                    pos,
+                    component_risk,
+                )
+            )
+
+        settings: str = self.settings_key
+        with db.transaction():
+            # Stored figures computed with other settings are deleted first.
+            for portfolio_ in result.portfolios:
+                db.validate_key_figure_values(portfolio_, settings)
+            db.upsert_key_figure_values(values)
@@ -0,0 +1,473 @@
+"""Contains types used for advancing the rolling key figures of portfolios day by day."""
+
+__all__: list[str] = ["RollingKeyFigureState", "EndOfDayUpdater"]
+
+from ..api.db import RiskDbAccessor, PriceStore
+from ..types import *
+from ..helpers.rolling import RollingStatistics
+from ..helpers.trading_calendar import TradingCalendar, AllDaysCalendar
+from .market_value_engine import MarketValueEngine
+from .risk_figure_generator import VOLATILITY_WINDOW_DAYS
+from array import array
+from collections import deque
+from datetime import date
+from typing import Any, Sequence
+import math
+
+
+def _volatility_window(calendar: TradingCalendar) -> int:
+    """Gets the number of returns in the volatility window, see RiskFigureGenerator."""
+    return round(VOLATILITY_WINDOW_DAYS * calendar.days_per_year / 365)
+
+
+class RollingKeyFigureState:
+    """The state needed to derive the key figures of a portfolio for the next day.
+
+    Holds the market value of the last date, the running product of the gross
+    one-day returns since cumulative_from, and the rolling statistics of the
+    log returns of the last 3 months of business days (including the log
+    returns themselves, which are removed from the statistics as the window
+    slides). Advancing the state by one business day is O(1).
+
+    The dates are the business days of a calendar, by default every day. The
+    volatility window and the annualization use the business days per year
+    of the calendar, as in RiskFigureGenerator. A state can only be advanced
+    with the settings it was computed with, see EndOfDayUpdater.
+
+    Attributes:
+        portfolio_id: The id of the portfolio.
+        date_: The last date the state includes.
+        market_value: The market value of the portfolio on date_.
+        cumulative_from: The first date whose return is included in cumulative_growth.
+        cumulative_growth: The product of the gross returns of [cumulative_from, date_].
+        statistics: The statistics of the log returns in the window.
+        log_returns: The log returns of the window, oldest first.
+        calendar: The calendar whose business days the state advances over.
+        settings: Identifies the settings the state was computed with, see
+            MarketValueEngine.settings_key, empty if unknown.
+    """
+
+    def __init__(
+        self,
+        portfolio_id: int,
+        date_: date,
+        market_value: float,
+        cumulative_from: date,
+        cumulative_growth: float,
+        statistics: RollingStatistics,
+        log_returns: deque[float],
+        calendar: TradingCalendar | None = None,
+        settings: str = "",
+    ) -> None:
+        self.portfolio_id = portfolio_id
+        self.date_ = date_
+        self.market_value = market_value
+        self.cumulative_from = cumulative_from
+        self.cumulative_growth = cumulative_growth
+        self.statistics = statistics
+        self.log_returns = log_returns
+        self.calendar = calendar if calendar is not None else AllDaysCalendar()
+        self.settings = settings
+
+    @property
+    def window(self) -> int:
+        """The number of log returns in the window, 3 months of business days."""
+        return _volatility_window(self.calendar)
+
+    @classmethod
+    def from_market_values(
+        cls,
+        portfolio_id: int,
+        dates: list[date],
+        market_values: Sequence[float],
+        cumulative_from: date,
+        calendar: TradingCalendar | None = None,
+        settings: str = "",
+    ) -> "RollingKeyFigureState":
+        """Creates the state of the last date of a series of market values.
+
+        Args:
+            portfolio_id: The id of the portfolio.
+            dates: Consecutive business days of the calendar, starting at least
+                the window of business days before the last date, and no later
+                than the business day before cumulative_from.
+            market_values: The market value of every date.
+            cumulative_from: The first date whose return is included in the
+                cumulative return.
+            calendar: The calendar of the dates, by default every day.
+            settings: Identifies the settings the market values are computed
+                with, see MarketValueEngine.settings_key.
+
+        Returns:
+            The state.
+        """
+        state: RollingKeyFigureState = cls(
+            portfolio_id,
+            dates[0],
+            market_values[0],
+            cumulative_from,
+            1.0,
+            RollingStatistics(),
+            deque(),
+            calendar,
+            settings,
+        )
+        for date_, market_value in zip(dates[1:], market_values[1:]):
+            state.advance(date_, market_value)
+        return state
+
+    @classmethod
+    def from_row(
+        cls, row: tuple[Any, ...], calendar: TradingCalendar | None = None
+    ) -> "RollingKeyFigureState":
+        """Creates a state from a row, see RiskDbAccessor.get_rolling_key_figure_state_rows."""
+        log_returns: array = array("d")
+        log_returns.frombytes(row[8])
+        return cls(
+            row[0],
+            date.fromisoformat(row[1]),
+            row[2],
+            date.fromisoformat(row[3]),
+            row[4],
+            RollingStatistics.from_moments(row[5], row[6], row[7]),
+            deque(log_returns),
+            calendar,
+            row[9],
+        )
+
+    def to_row(self) -> tuple[Any, ...]:
+        """Gets the state as a row, see RiskDbAccessor.upsert_rolling_key_figure_state_rows."""
+        return (
+            self.portfolio_id,
+            self.date_.isoformat(),
+            self.market_value,
+            self.cumulative_from.isoformat(),
+            self.cumulative_growth,
+            *self.statistics.moments,
+            array("d", self.log_returns).tobytes(),
+            self.settings,
+        )
+
+    @property
+    def cumulative_return(self) -> float:
+        """The compounded return from the start of cumulative_from up to and including date_."""
+        return self.cumulative_growth - 1.0
+
+    def volatility(self) -> float | None:
+        """Gets the annualized volatility of date_, None if the window is not full."""
+        if self.statistics.count < self.window:
+            return None
+        # Annualize
+        return self.statistics.stdev() * math.sqrt(self.calendar.days_per_year)
+
+    def advance(self, date_: date, market_value: float) -> float:
+        """Advances the state to the next business day.
+
+        Args:
+            date_: The next date, which must be the business day after the date
+                of the state.
+            market_value: The market value of the portfolio on date_.
+
+        Raises:
+            ValueError: If date_ is not the business day after the date of the
+                state.
+
+        Returns:
+            The one-day return of date_.
+        """
+        if date_ != self.calendar.next_business_day(self.date_):
+            raise ValueError(
+                f"Cannot advance the state of {self.date_.isoformat()} "
+                f"to {date_.isoformat()}."
+            )
+        return_1D: float = market_value / self.market_value - 1.0
+        if date_ >= self.cumulative_from:
+            self.cumulative_growth *= market_value / self.market_value
+        log_return: float = math.log(1 + return_1D)
+        self.statistics.add(log_return)
+        self.log_returns.append(log_return)
+        while len(self.log_returns) > self.window:
+            self.statistics.remove(self.log_returns.popleft())
+        self.date_ = date_
+        self.market_value = market_value
+        return return_1D
+
+
+class EndOfDayUpdater:
+    """Type used for updating the stored key figures of portfolios when a day's prices arrive.
+
+    The market value, one-day return and annualized 3 month volatility of every
+    portfolio are derived from a RollingKeyFigureState saved in the database,
+    instead of from the price history, so advancing a portfolio by one day
+    costs a market value computation for the new day and O(1) work, and a
+    nightly update scales with the number of portfolios only.
+
+    A portfolio's state is created from its history once, with initialize (or
+    by advance_all for portfolios without a state). Corrections of prices or
+    positions of dates the state already includes are not picked up by
+    advancing; call initialize again to rebuild the state from the history.
+
+    The figures are computed for the business days of a calendar, by default
+    every day, and must use the calendar of the RiskFigureGenerator computing
+    the same key figures, see RollingKeyFigureState. The figures of a date
+    which is not a business day are those of the last business day before it.
+    A state saved with other settings, e.g. by an updater with another
+    calendar, is rebuilt from the history of its date before it is advanced.
+
+    Example usage:
+        updater = EndOfDayUpdater()
+        updater.advance_all(date(2024, 5, 31))
+
+    Attributes:
+        price_store: The store prices are read from, None to read from the database.
+        calendar: The calendar whose business days figures are computed for.
+    """
+
+    KEY_FIGURES: list[str] = ["Market value", "Return (1D)", "Volatility (3M, ann.)"]
+
+    def __init__(
+        self,
+        risk_db_accessor: RiskDbAccessor | None = None,
+        *,
+        price_store: PriceStore | None = None,
+        calendar: TradingCalendar | None = None,
+    ) -> None:
+        if risk_db_accessor is None:
+            risk_db_accessor = RiskDbAccessor()
+        self._risk_db_accessor = risk_db_accessor
+        self._market_value_engine = MarketValueEngine(
+            risk_db_accessor, price_store, calendar=calendar
+        )
+
+    @property
+    def price_store(self) -> PriceStore | None:
+        """The store prices are read from, None if read from the database."""
+        return self._market_value_engine.price_store
+
+    @price_store.setter
+    def price_store(self, value: PriceStore | None) -> None:
+        self._market_value_engine.price_store = value
+
+    @property
+    def calendar(self) -> TradingCalendar:
+        """The calendar whose business days figures are computed for."""
+        return self._market_value_engine.calendar
+
+    def get_state(self, portfolio_name: str) -> RollingKeyFigureState | None:
+        """Gets the saved state of a portfolio, None if it has none."""
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            rows: list[tuple[Any, ...]] = db.get_rolling_key_figure_state_rows(
+                [self._get_portfolio(db, portfolio_name)]
+            )
+        if len(rows) == 0:
+            return None
+        return RollingKeyFigureState.from_row(rows[0], self.calendar)
+
+    def initialize(
+        self, portfolio_name: str, date_: date, *, cumulative_from: date | None = None
+    ) -> list[KeyFigureValue]:
+        """Creates (or rebuilds) the state of a portfolio from its history.
+
+        The key figures of date_ are stored, and the state of date_ is saved.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_: The date to create the state of.
+            cumulative_from: The first date whose return is included in the
+                cumulative return of the state, defaults to date_.
+
+        Returns:
+            A list of the KeyFigureValue objects of date_ which were inserted
+            or updated in the database.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db, db.transaction():
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            return self._initialize(db, portfolio_, date_, cumulative_from or date_)
+
+    def advance(self, portfolio_name: str, date_: date) -> list[KeyFigureValue]:
+        """Advances the state of a portfolio to a date, one day at a time.
+
+        The key figures of every date after the date of the state, up to and
+        including date_, are stored, and the state of date_ is saved. Nothing
+        is done if the state already includes date_.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_: The date to advance the state to.
+
+        Raises:
+            ValueError: If the portfolio has no state, see initialize.
+
+        Returns:
+            A list of the KeyFigureValue objects which were inserted or updated.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db, db.transaction():
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            rows: list[tuple[Any, ...]] = db.get_rolling_key_figure_state_rows(
+                [portfolio_]
+            )
+            if len(rows) == 0:
+                raise ValueError(
+                    f"Portfolio {portfolio_name} has no rolling key figure state."
+                )
+            return self._advance(
+                db,
+                portfolio_,
+                RollingKeyFigureState.from_row(rows[0], self.calendar),
+                date_,
+            )
+
+    def advance_all(self, date_: date) -> dict[str, list[KeyFigureValue]]:
+        """Advances the states of all portfolios to a date, in one transaction.
+
+        Portfolios without a state are initialized at date_.
+
+        Args:
+            date_: The date to advance the states to.
+
+        Returns:
+            The KeyFigureValue objects which were inserted or updated, keyed by
+            portfolio name.
+        """
+        result: dict[str, list[KeyFigureValue]] = {}
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db, db.transaction():
+            states: dict[int, RollingKeyFigureState] = {
+                row[0]: RollingKeyFigureState.from_row(row, self.calendar)
+                for row in db.get_rolling_key_figure_state_rows()
+            }
+            for portfolio_ in db.get_portfolios():
+                state: RollingKeyFigureState | None = states.get(portfolio_.id_)
+                if state is None:
+                    result[portfolio_.name] = self._initialize(
+                        db, portfolio_, date_, date_
+                    )
+                else:
+                    result[portfolio_.name] = self._advance(
+                        db, portfolio_, state, date_
+                    )
+        return result
+
+    def _get_portfolio(self, db: RiskDbAccessor, portfolio_name: str) -> Portfolio:
+        portfolio_: Portfolio | None = db.get_portfolio_from_name(portfolio_name)
+        if portfolio_ is None:
+            raise ValueError(f"Portfolio {portfolio_name} does not exist.")
+        return portfolio_
+
+    def _initialize(
+        self,
+        db: RiskDbAccessor,
+        portfolio: Portfolio,
+        date_: date,
+        cumulative_from: date,
+    ) -> list[KeyFigureValue]:
+        """Creates the state of date_ and stores the key figures of date_."""
+        date_ = self.calendar.roll_backward(date_)
+        state, market_values = self._create_state(portfolio, date_, cumulative_from)
+        return self._store(
+            db,
+            portfolio,
+            state,
+            [(date_, market_values[-1], market_values[-1] / market_values[-2] - 1.0)],
+            [state.volatility()],
+        )
+
+    def _create_state(
+        self, portfolio: Portfolio, date_: date, cumulative_from: date
+    ) -> tuple[RollingKeyFigureState, Sequence[float]]:
+        """Creates the state of a business day from the market values of its window.
+
+        Returns:
+            The state, and the market values of the window, ending with the
+            market value of date_.
+        """
+        date_from: date = min(
+            self.calendar.shift(date_, -_volatility_window(self.calendar)),
+            self.calendar.previous_business_day(cumulative_from),
+        )
+        dates, market_values = self._market_value_engine.market_values(
+            portfolio, date_from, date_
+        )
+        state: RollingKeyFigureState = RollingKeyFigureState.from_market_values(
+            portfolio.id_,
+            dates,
+            market_values,
+            cumulative_from,
+            self.calendar,
+            self._market_value_engine.settings_key,
+        )
+        return state, market_values
+
+    def _advance(
+        self,
+        db: RiskDbAccessor,
+        portfolio: Portfolio,
+        state: RollingKeyFigureState,
+        date_: date,
+    ) -> list[KeyFigureValue]:
+        """Advances a state to date_, computing the market values of the new dates."""
+        date_ = self.calendar.roll_backward(date_)
+        if state.settings != self._market_value_engine.settings_key:
+            # The window and the returns depend on the calendar of the state.
+            state, _ = self._create_state(
+                portfolio,
+                self.calendar.roll_backward(state.date_),
+                state.cumulative_from,
+            )
+        if date_ <= state.date_:
+            return []
+        dates, market_values = self._market_value_engine.market_values(
+            portfolio, self.calendar.next_business_day(state.date_), date_
+        )
+        figures: list[tuple[date, float, float]] = []
+        volatilities: list[float | None] = []
+        for d, market_value in zip(dates, market_values):
+            figures.append((d, market_value, state.advance(d, market_value)))
+            volatilities.append(state.volatility())
+        return self._store(db, portfolio, state, figures, volatilities)
+
+    def _store(
+        self,
+        db: RiskDbAccessor,
+        portfolio: Portfolio,
+        state: RollingKeyFigureState,
+        figures: list[tuple[date, float, float]],
+        volatilities: list[float | None],
+    ) -> list[KeyFigureValue]:
+        """Stores the key figures of a series of dates and saves the state.
+
+        Volatilities which are None, i.e. of dates without a full window, are
+        not stored. Stored figures computed with other settings are deleted
+        first, see RiskDbAccessor.validate_key_figure_values.
+        """
+        ref_type: KeyFigureRefType = db.get_key_figure_ref_type_from_name("Portfolio")
+        market_value_, return_1D, volatility_3M = [
+            db.get_key_figure_from_name(name) for name in self.KEY_FIGURES
+        ]
+        result: list[KeyFigureValue] = []
+        for (date_, market_value, return_), volatility in zip(figures, volatilities):
+            result.append(
+                KeyFigureValue.create_trusted(
+                    0, date_, market_value, ref_type, portfolio, market_value_
+                )
+            )
+            result.append(
+                KeyFigureValue.create_trusted(
+                    0, date_, return_, ref_type, portfolio, return_1D
+                )
+            )
+            if volatility is not None:
+                result.append(
+                    KeyFigureValue.create_trusted(
+                        0, date_, volatility, ref_type, portfolio, volatility_3M
+                    )
+                )
+        db.validate_key_figure_values(
+            portfolio, self._market_value_engine.settings_key
+        )
+        db.upsert_key_figure_values(result)
+        db.upsert_rolling_key_figure_state_rows([state.to_row()])
+        return result
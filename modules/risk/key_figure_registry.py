@@ -0,0 +1,337 @@
+"""Contains types used for computing the key figures of a report from a graph of their inputs."""
+
+__all__: list[str] = [
+    "KeyFigureContext",
+    "KeyFigureNode",
+    "KeyFigureRegistry",
+    "MARKET_VALUE_SERIES",
+    "RETURN_1D_SERIES",
+    "VOLATILITY_SERIES",
+    "CUMULATIVE_RETURNS",
+    "default_key_figure_registry",
+]
+
+from ..types import KeyFigureValue
+from ..helpers.trading_calendar import TradingCalendar
+from .market_value_engine import PricePolicy
+from .risk_figure_generator import RiskFigureGenerator
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from datetime import date
+from graphlib import TopologicalSorter
+from typing import Any, Callable
+
+# The names of the intermediate series of the default registry.
+MARKET_VALUE_SERIES: str = "Market value series"
+RETURN_1D_SERIES: str = "Return (1D) series"
+VOLATILITY_SERIES: str = "Volatility (3M, ann.) series"
+CUMULATIVE_RETURNS: str = "Cumulative returns"
+
+
+class KeyFigureContext:
+    """Type representing the inputs shared by all key figures of a report.
+
+    Attributes:
+        rfg: The generator used for computing the figures.
+        portfolio_name: The name of the portfolio.
+        date_from: The first date of the report.
+        date_to: The last date of the report, rolled back to a business day of
+            the calendar of rfg. Key figures are computed for this date.
+    """
+
+    def __init__(
+        self,
+        rfg: RiskFigureGenerator,
+        portfolio_name: str,
+        date_from: date,
+        date_to: date,
+    ) -> None:
+        self.rfg = rfg
+        self.portfolio_name = portfolio_name
+        self.date_from = date_from
+        self.date_to = rfg.calendar.roll_backward(date_to)
+
+
+class KeyFigureNode:
+    """Type representing a key figure or an intermediate series, and its inputs.
+
+    Attributes:
+        name: The name of the node, e.g. the name of the key figure.
+        compute: A callable computing the value of the node. It is called with
+            the context, the first date the value must cover and the values
+            of the inputs, in the order of inputs. The last date is always
+            the date_to of the context.
+        inputs: The names of the nodes the value is computed from.
+        lookback: The number of business days before its first date the inputs
+            must cover, e.g. 1 for one-day returns, or a callable getting it
+            from the RiskFigureGenerator of the report.
+        series: If True, a requested node covers [date_from, date_to] of the
+            report, otherwise only date_to.
+        key_figure: If True, the node can be requested as a key figure of a
+            report, otherwise it is an intermediate.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        compute: Callable[..., Any],
+        inputs: list[str] | None = None,
+        *,
+        lookback: int | Callable[[RiskFigureGenerator], int] = 0,
+        series: bool = False,
+        key_figure: bool = True,
+    ) -> None:
+        self.name = name
+        self.compute = compute
+        self.inputs: tuple[str, ...] = tuple(inputs or ())
+        self.lookback = lookback
+        self.series = series
+        self.key_figure = key_figure
+
+    def get_lookback(self, rfg: RiskFigureGenerator) -> int:
+        """Gets the lookback of the node, in business days of the calendar of rfg."""
+        return self.lookback(rfg) if callable(self.lookback) else self.lookback
+
+
+class KeyFigureRegistry:
+    """Registry of the key figures a report can contain, and of the series they
+    are computed from.
+
+    Every node declares the nodes it is computed from. To compute a set of
+    nodes, the registry builds the graph of the nodes and all their inputs,
+    plans the date range every node must cover (the union of what its
+    consumers need), and evaluates every node exactly once in topological
+    order, see graphlib.TopologicalSorter. Series shared by several key
+    figures, e.g. the market values, are therefore computed once per report.
+    With an executor, nodes whose inputs are ready are evaluated concurrently.
+
+    Key figures are added by registering a node, without changing RiskReport.
+
+    Example usage:
+        registry = default_key_figure_registry()
+        registry.register(
+            KeyFigureNode(
+                "Return (since start)",
+                lambda context, date_from, cumulative: cumulative[-1][1],
+                [CUMULATIVE_RETURNS],
+                series=True,
+            )
+        )
+    """
+
+    def __init__(self) -> None:
+        self._nodes: dict[str, KeyFigureNode] = {}
+
+    def register(self, node: KeyFigureNode) -> KeyFigureNode:
+        """Registers a node.
+
+        Raises:
+            ValueError: If a node with the same name is already registered.
+        """
+        if node.name in self._nodes:
+            raise ValueError(f"Key figure {node.name} is already registered.")
+        self._nodes[node.name] = node
+        return node
+
+    def get(self, name: str) -> KeyFigureNode:
+        """Gets a registered node.
+
+        Raises:
+            ValueError: If no node is registered under name.
+        """
+        node: KeyFigureNode | None = self._nodes.get(name)
+        if node is None:
+            raise ValueError(f"Key figure {name} is not supported.")
+        return node
+
+    @property
+    def key_figures(self) -> list[str]:
+        """The names of the nodes which can be requested as key figures."""
+        return [name for name, node in self._nodes.items() if node.key_figure]
+
+    def graph(self, names: list[str]) -> dict[str, tuple[str, ...]]:
+        """Gets the graph of nodes needed to compute names.
+
+        Returns:
+            The inputs of every node needed, keyed by node name.
+
+        Raises:
+            ValueError: If a node is not registered.
+        """
+        graph: dict[str, tuple[str, ...]] = {}
+        pending: list[str] = list(names)
+        while len(pending) > 0:
+            name: str = pending.pop()
+            if name not in graph:
+                graph[name] = self.get(name).inputs
+                pending.extend(graph[name])
+        return graph
+
+    def evaluate(
+        self,
+        context: KeyFigureContext,
+        names: list[str],
+        *,
+        executor: Executor | None = None,
+    ) -> dict[str, Any]:
+        """Computes nodes and all their inputs, evaluating every node once.
+
+        Args:
+            context: The context of the report.
+            names: The names of the nodes to compute.
+            executor: If provided, independent nodes are evaluated concurrently
+                on it, otherwise all nodes are evaluated on the calling thread.
+
+        Returns:
+            The value of every node in names, keyed by name.
+
+        Raises:
+            ValueError: If a node is not registered, or the graph has a cycle
+                (graphlib.CycleError).
+        """
+        graph: dict[str, tuple[str, ...]] = self.graph(names)
+        order: list[str] = list(TopologicalSorter(graph).static_order())
+        starts: dict[str, date] = self._plan(context, names, order)
+        values: dict[str, Any] = {}
+
+        def evaluate(name: str) -> Any:
+            node: KeyFigureNode = self._nodes[name]
+            return node.compute(
+                context, starts[name], *[values[i] for i in node.inputs]
+            )
+
+        if executor is None:
+            for name in order:
+                values[name] = evaluate(name)
+        else:
+            sorter: TopologicalSorter = TopologicalSorter(graph)
+            sorter.prepare()
+            pending: dict[Future, str] = {}
+            while sorter.is_active():
+                for name in sorter.get_ready():
+                    pending[executor.submit(evaluate, name)] = name
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    values[name] = future.result()
+                    sorter.done(name)
+        return {name: values[name] for name in names}
+
+    def _plan(
+        self, context: KeyFigureContext, names: list[str], order: list[str]
+    ) -> dict[str, date]:
+        """Plans the first date every node must cover, from consumers to inputs."""
+        calendar: TradingCalendar = context.rfg.calendar
+        starts: dict[str, date] = {}
+        for name in names:
+            start: date = (
+                context.date_from if self._nodes[name].series else context.date_to
+            )
+            starts[name] = min(starts.get(name, start), start)
+        for name in reversed(order):
+            node: KeyFigureNode = self._nodes[name]
+            lookback: int = node.get_lookback(context.rfg)
+            input_start: date = starts[name]
+            if lookback > 0:
+                input_start = calendar.shift(
+                    calendar.roll_forward(input_start), -lookback
+                )
+            for input_name in node.inputs:
+                starts[input_name] = min(
+                    starts.get(input_name, input_start), input_start
+                )
+        return starts
+
+
+def _last_value(context: KeyFigureContext, values: list[KeyFigureValue]) -> float:
+    """Gets the value of a series for the date_to of the report."""
+    if len(values) == 0 or values[-1].key_figure_date != context.date_to:
+        raise ValueError(
+            f"No value for portfolio {context.portfolio_name} on "
+            f"{context.date_to.isoformat()}, prices are missing."
+        )
+    return values[-1].value
+
+
+def _return_lookback(rfg: RiskFigureGenerator) -> int:
+    """Gets the lookback of one-day returns, see RiskFigureGenerator._compute_returns."""
+    if rfg.price_policy is PricePolicy.SKIP:
+        return 1 + rfg.max_staleness
+    return 1
+
+
+def default_key_figure_registry() -> KeyFigureRegistry:
+    """Creates a registry of the key figures supported by RiskReport.
+
+    Key figures:
+        "Market value", "Return (1D)" and "Volatility (3M, ann.)" of date_to.
+
+    Intermediates:
+        MARKET_VALUE_SERIES, RETURN_1D_SERIES and VOLATILITY_SERIES, the
+        stored key figure values of the planned date ranges, and
+        CUMULATIVE_RETURNS, the cumulative returns of [date_from, date_to].
+    """
+    registry: KeyFigureRegistry = KeyFigureRegistry()
+    registry.register(
+        KeyFigureNode(
+            MARKET_VALUE_SERIES,
+            lambda context, date_from: (
+                context.rfg.market_value_for_portfolio_and_date_range(
+                    context.portfolio_name, date_from, context.date_to
+                )
+            ),
+            key_figure=False,
+        )
+    )
+    registry.register(
+        KeyFigureNode(
+            RETURN_1D_SERIES,
+            lambda context, date_from, market_values: (
+                context.rfg.return_1D_from_market_values(
+                    context.portfolio_name, market_values, date_from, context.date_to
+                )
+            ),
+            [MARKET_VALUE_SERIES],
+            lookback=_return_lookback,
+            key_figure=False,
+        )
+    )
+    registry.register(
+        KeyFigureNode(
+            VOLATILITY_SERIES,
+            lambda context, date_from, returns: (
+                context.rfg.volatility_3M_ann_from_returns(
+                    context.portfolio_name, returns, date_from, context.date_to
+                )
+            ),
+            [RETURN_1D_SERIES],
+            lookback=lambda rfg: rfg.volatility_window - 1,
+            key_figure=False,
+        )
+    )
+    registry.register(
+        KeyFigureNode(
+            CUMULATIVE_RETURNS,
+            lambda context, date_from, market_values: list(
+                context.rfg.iter_return_1D_cumulative_from_market_values(
+                    market_values, date_from
+                )
+            ),
+            [MARKET_VALUE_SERIES],
+            lookback=1,
+            series=True,
+            key_figure=False,
+        )
+    )
+    for name, series in [
+        ("Market value", MARKET_VALUE_SERIES),
+        ("Return (1D)", RETURN_1D_SERIES),
+        ("Volatility (3M, ann.)", VOLATILITY_SERIES),
+    ]:
+        registry.register(
+            KeyFigureNode(
+                name,
+                lambda context, date_from, values: _last_value(context, values),
+                [series],
+            )
+        )
+    return registry
@@ -0,0 +1,485 @@
+"""Contains types used for computing portfolio market values over date ranges."""
+
+__all__: list[str] = [
+    "PricePolicy",
+    "PriceResolution",
+    "MarketValueMatrix",
+    "MarketValueEngine",
+]
+
+from ..api.db import RiskDbAccessor, PriceStore, PositionIndex
+from ..types import *
+from ..helpers.trading_calendar import TradingCalendar, AllDaysCalendar
+from array import array
+from bisect import bisect_left
+from datetime import date, timedelta
+from enum import Enum
+from typing import Any
+import math
+
+
+class PricePolicy(Enum):
+    """Enumerates the ways of handling the missing prices of held instruments.
+
+    STRICT: A missing price is an error.
+    FORWARD_FILL: A missing price is replaced with the last earlier price of the
+        instrument, if at most max_staleness days old, otherwise it is an error.
+    SKIP: Dates with a missing price are left out of the market values.
+    """
+
+    STRICT = 1
+    FORWARD_FILL = 2
+    SKIP = 3
+
+
+class PriceResolution:
+    """Type representing the missing prices resolved by a price policy.
+
+    Only prices of instruments held on a date are reported.
+
+    Attributes:
+        policy: The policy the prices were resolved with.
+        filled: Tuples of the date, the instrument and the date of the price
+            the missing price was filled with.
+        skipped_dates: The dates left out because a price was missing.
+    """
+
+    def __init__(self, policy: PricePolicy) -> None:
+        self.policy = policy
+        self.filled: list[tuple[date, Instrument, date]] = []
+        self.skipped_dates: list[date] = []
+
+    def to_dict(self) -> dict[str, Any]:
+        """Gets the resolution, suitable for JSON serialization."""
+        return {
+            "policy": self.policy.name,
+            "filled": [
+                {
+                    "date": date_.isoformat(),
+                    "instrument": instrument.name,
+                    "price_date": price_date.isoformat(),
+                }
+                for date_, instrument, price_date in self.filled
+            ],
+            "skipped_dates": [date_.isoformat() for date_ in self.skipped_dates],
+        }
+
+
+class MarketValueMatrix:
+    """Dense date × instrument matrices used for computing portfolio market values.
+
+    The matrices are stored as flat arrays in row-major order, with one row per
+    date and one column per instrument, i.e. the element for date index d and
+    instrument index i is found at index d * len(instruments) + i.
+
+    Prices are stored as unit values, i.e. the market value of a position of
+    quantity 1 in the instrument, as defined by Instrument.market_value. The
+    market value of a cell is therefore the unit value times the quantity,
+    which matches the pricing rules of Equity (price × quantity) and Bond
+    (price / 100 × notional).
+
+    Attributes:
+        dates: The dates of the rows.
+        instruments: The instruments of the columns.
+        unit_values: The unit value of every cell, NaN if the price is missing.
+        quantities: The quantity held of every cell.
+        resolution: The missing prices resolved by resolve_prices, if called.
+    """
+
+    def __init__(
+        self,
+        dates: list[date],
+        instruments: list[Instrument],
+        unit_values: array,
+        quantities: array,
+    ) -> None:
+        self.dates = dates
+        self.instruments = instruments
+        self.unit_values = unit_values
+        self.quantities = quantities
+        self.resolution: PriceResolution | None = None
+
+    def resolve_prices(
+        self,
+        policy: PricePolicy,
+        max_staleness: int = 0,
+        seed_unit_values: array | None = None,
+        seed_ordinals: array | None = None,
+    ) -> PriceResolution:
+        """Resolves the missing prices of the matrix with a policy.
+
+        The matrix is processed in one pass per instrument column. With
+        FORWARD_FILL, every missing unit value is replaced with the last
+        earlier unit value of its column (or with the seed of the column, for
+        the first rows) if at most max_staleness days old. With SKIP, the rows
+        with a missing price of a held instrument are removed. With STRICT,
+        the matrix is left unchanged.
+
+        Args:
+            policy: The policy.
+            max_staleness: The maximum age of a forward-filled price in days.
+            seed_unit_values: The unit value of every instrument before the
+                first date, NaN if none.
+            seed_ordinals: The date ordinal of every seed unit value.
+
+        Returns:
+            The resolution, which is also assigned to the resolution attribute.
+        """
+        resolution: PriceResolution = PriceResolution(policy)
+        width: int = len(self.instruments)
+        if policy is PricePolicy.FORWARD_FILL:
+            ordinals: list[int] = [d.toordinal() for d in self.dates]
+            filled: list[tuple[int, int, int]] = []
+            for i in range(width):
+                last_value: float = math.nan
+                last_ordinal: int = 0
+                if seed_unit_values is not None and seed_ordinals is not None:
+                    last_value, last_ordinal = seed_unit_values[i], seed_ordinals[i]
+                for d in range(len(ordinals)):
+                    index: int = d * width + i
+                    unit_value: float = self.unit_values[index]
+                    if not math.isnan(unit_value):
+                        last_value, last_ordinal = unit_value, ordinals[d]
+                    elif (
+                        not math.isnan(last_value)
+                        and ordinals[d] - last_ordinal <= max_staleness
+                    ):
+                        self.unit_values[index] = last_value
+                        if self.quantities[index] != 0.0:
+                            filled.append((d, i, last_ordinal))
+            filled.sort()
+            resolution.filled = [
+                (self.dates[d], self.instruments[i], date.fromordinal(ordinal))
+                for d, i, ordinal in filled
+            ]
+        elif policy is PricePolicy.SKIP:
+            kept: list[int] = []
+            for d in range(len(self.dates)):
+                offset: int = d * width
+                if any(
+                    self.quantities[index] != 0.0
+                    and math.isnan(self.unit_values[index])
+                    for index in range(offset, offset + width)
+                ):
+                    resolution.skipped_dates.append(self.dates[d])
+                else:
+                    kept.append(d)
+            if len(kept) < len(self.dates):
+                self.dates = [self.dates[d] for d in kept]
+                self.unit_values = array(
+                    "d",
+                    (
+                        self.unit_values[d * width + i]
+                        for d in kept
+                        for i in range(width)
+                    ),
+                )
+                self.quantities = array(
+                    "d",
+                    (
+                        self.quantities[d * width + i]
+                        for d in kept
+                        for i in range(width)
+                    ),
+                )
+        self.resolution = resolution
+        return resolution
+
+    def market_values(self) -> array:
+        """Computes the market value for every date.
+
+        Raises:
+            ValueError: If a price is missing for an instrument held on a date.
+
+        Returns:
+            An array with the market value of every date.
+        """
+        width: int = len(self.instruments)
+        result: array = array("d", bytes(8 * len(self.dates)))
+        for d in range(len(self.dates)):
+            offset: int = d * width
+            total: float = 0.0
+            for i in range(offset, offset + width):
+                quantity: float = self.quantities[i]
+                if quantity == 0.0:
+                    continue
+                unit_value: float = self.unit_values[i]
+                if math.isnan(unit_value):
+                    raise ValueError(
+                        f"Price missing for instrument {self.instruments[i - offset].name}"
+                        f" on {self.dates[d].isoformat()}."
+                    )
+                total += unit_value * quantity
+            result[d] = total
+        return result
+
+
+class MarketValueEngine:
+    """Type used for computing the market values of a portfolio for a whole date range.
+
+    The positions and prices for the date range are loaded in one pass, and the
+    market values of all dates are computed from a MarketValueMatrix, instead of
+    querying the database for every position and date.
+
+    If a PriceStore is provided, prices are read from it instead of the
+    database, and only the positions are loaded from the database.
+
+    If cache_positions is True, all positions are loaded the first time they
+    are needed and kept in memory in a PositionIndex, until invalidated with
+    invalidate_positions.
+
+    The quantities held are only computed on the dates the holdings change,
+    see PositionIndex.holdings, and copied to the dates in between. If
+    holding_snapshot is True, the holdings are instead read from the holdings
+    materialized in the database, see RiskDbAccessor.get_holdings, and no
+    positions are loaded.
+
+    Market values are computed for the business days of the calendar only,
+    by default every day.
+
+    Missing prices of held instruments are handled with price_policy, see
+    PricePolicy. By default a missing price is an error.
+
+    Attributes:
+        price_store: The store prices are read from, None to read from the database.
+        cache_positions: True if positions are kept in memory, otherwise False.
+        calendar: The calendar whose business days market values are computed for.
+        price_policy: The handling of missing prices.
+        max_staleness: The maximum age of a forward-filled price in days.
+        holding_snapshot: True if holdings are read from the materialized
+            holdings, otherwise they are derived from the positions.
+    """
+
+    def __init__(
+        self,
+        risk_db_accessor: RiskDbAccessor,
+        price_store: PriceStore | None = None,
+        *,
+        cache_positions: bool = False,
+        calendar: TradingCalendar | None = None,
+        price_policy: PricePolicy = PricePolicy.STRICT,
+        max_staleness: int = 5,
+        holding_snapshot: bool = False,
+    ) -> None:
+        self._risk_db_accessor = risk_db_accessor
+        self.price_store = price_store
+        self.cache_positions = cache_positions
+        self.calendar = calendar if calendar is not None else AllDaysCalendar()
+        self.price_policy = price_policy
+        self.max_staleness = max_staleness
+        self.holding_snapshot = holding_snapshot
+        self._position_index: PositionIndex | None = None
+
+    @property
+    def settings_key(self) -> str:
+        """Identifies the settings the computed figures depend on, see
+        RiskDbAccessor.validate_key_figure_values."""
+        key: str = f"calendar={self.calendar.name};price_policy={self.price_policy.name}"
+        if self.price_policy is not PricePolicy.STRICT:
+            key += f";max_staleness={self.max_staleness}"
+        return key
+
+    def invalidate_positions(self) -> None:
+        """Discards the positions kept in memory, see cache_positions."""
+        self._position_index = None
+
+    @property
+    def position_index(self) -> PositionIndex | None:
+        """The positions kept in memory, None if not loaded yet, see cache_positions.
+
+        Setting the index of another engine shares its positions, which are
+        never modified.
+        """
+        return self._position_index
+
+    @position_index.setter
+    def position_index(self, value: PositionIndex | None) -> None:
+        self._position_index = value
+
+    def get_position_index(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> PositionIndex:
+        """Gets an index of the positions of a portfolio overlapping a date range.
+
+        With cache_positions, this is the index of all positions kept in memory.
+        The database accessor must be open when calling this method.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            A PositionIndex covering at least the positions of the portfolio
+            overlapping the range.
+        """
+        db: RiskDbAccessor = self._risk_db_accessor
+        if not self.cache_positions:
+            return PositionIndex(
+                db.get_positions(
+                    portfolio=portfolio, date_from=date_from, date_to=date_to
+                )
+            )
+        position_index: PositionIndex | None = self._position_index
+        if position_index is None:
+            position_index = PositionIndex.from_db(db)
+            self._position_index = position_index
+        return position_index
+
+    def get_positions(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> list[Position]:
+        """Gets the positions of a portfolio overlapping a date range.
+
+        The database accessor must be open when calling this method.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            The positions of the portfolio, ordered by id.
+        """
+        db: RiskDbAccessor = self._risk_db_accessor
+        if not self.cache_positions:
+            return db.get_positions(
+                portfolio=portfolio, date_from=date_from, date_to=date_to
+            )
+        return self.get_position_index(
+            portfolio, date_from, date_to
+        ).positions_overlapping(portfolio, date_from, date_to)
+
+    def build_matrix(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> MarketValueMatrix:
+        """Loads positions and prices and builds the matrices for a date range.
+
+        The missing prices of the matrix are resolved with the price policy,
+        see MarketValueMatrix.resolve_prices. With FORWARD_FILL, the prices of
+        the max_staleness days before date_from are also loaded.
+
+        The database accessor must be open when calling this method.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            A MarketValueMatrix with one row for every business day in
+            [date_from, date_to], except skipped days.
+        """
+        db: RiskDbAccessor = self._risk_db_accessor
+        holdings: list[tuple[date, dict[int, float]]]
+        instruments: list[Instrument] = []
+        columns: dict[int, int] = {}
+        if self.holding_snapshot:
+            holdings = db.get_holdings(portfolio, date_from, date_to)
+            for instrument_id in sorted({i for _, held in holdings for i in held}):
+                columns[instrument_id] = len(instruments)
+                instruments.append(db.get_instrument(instrument_id))
+        else:
+            position_index: PositionIndex = self.get_position_index(
+                portfolio, date_from, date_to
+            )
+            for pos in position_index.positions_overlapping(
+                portfolio, date_from, date_to
+            ):
+                if pos.instrument.id_ not in columns:
+                    columns[pos.instrument.id_] = len(instruments)
+                    instruments.append(pos.instrument)
+            holdings = list(position_index.holdings(portfolio, date_from, date_to))
+
+        dates: list[date] = self.calendar.business_days(date_from, date_to)
+        ordinals: list[int] = [d.toordinal() for d in dates]
+        day_count: int = len(dates)
+        width: int = len(instruments)
+        first_ordinal: int = date_from.toordinal()
+        unit_values: array = array("d", [math.nan]) * (day_count * width)
+        quantities: array = array("d", bytes(8 * day_count * width))
+        # The last unit value of every instrument before date_from, for filling.
+        seed_unit_values: array = array("d", [math.nan]) * width
+        seed_ordinals: array = array("q", bytes(8 * width))
+        lookback: int = (
+            self.max_staleness if self.price_policy is PricePolicy.FORWARD_FILL else 0
+        )
+        load_from: date = date_from - timedelta(days=lookback)
+
+        if width > 0 and self.price_store is not None:
+            # The slice has a row for every calendar day of the range.
+            prices: array = self.price_store.price_slice(
+                [instrument.id_ for instrument in instruments], load_from, date_to
+            )
+            load_ordinal: int = load_from.toordinal()
+            for ordinal in range(load_ordinal, first_ordinal):
+                source: int = (ordinal - load_ordinal) * width
+                for i in range(width):
+                    price: float = prices[source + i]
+                    if not math.isnan(price):
+                        seed_unit_values[i] = instruments[i].market_value(price, 1.0)
+                        seed_ordinals[i] = ordinal
+            for d, ordinal in enumerate(ordinals):
+                source = (ordinal - load_ordinal) * width
+                for i in range(width):
+                    price = prices[source + i]
+                    if not math.isnan(price):
+                        unit_values[d * width + i] = instruments[i].market_value(
+                            price, 1.0
+                        )
+        elif width > 0:
+            rows: dict[str, int] = {
+                dates[d].isoformat(): d * width for d in range(day_count)
+            }
+            first_date: str = date_from.isoformat()
+            for _, instrument_id, date_, price in db.get_price_rows(
+                instruments=instruments, date_from=load_from, date_to=date_to
+            ):
+                i: int = columns[instrument_id]
+                row: int | None = rows.get(date_)
+                if row is not None:
+                    unit_values[row + i] = instruments[i].market_value(price, 1.0)
+                elif date_ < first_date:  # Rows are ordered by date.
+                    seed_unit_values[i] = instruments[i].market_value(price, 1.0)
+                    seed_ordinals[i] = date.fromisoformat(date_).toordinal()
+
+        # The rows from one change of the holdings to the next hold the same
+        # quantities, so they are copied from one row built per change.
+        for k, (change_date, held) in enumerate(holdings):
+            row: array = array("d", bytes(8 * width))
+            for instrument_id, quantity in held.items():
+                row[columns[instrument_id]] = quantity
+            first: int = bisect_left(ordinals, change_date.toordinal())
+            last: int = (
+                bisect_left(ordinals, holdings[k + 1][0].toordinal())
+                if k + 1 < len(holdings)
+                else day_count
+            )
+            quantities[first * width : last * width] = row * (last - first)
+
+        matrix: MarketValueMatrix = MarketValueMatrix(
+            dates, instruments, unit_values, quantities
+        )
+        matrix.resolve_prices(
+            self.price_policy, self.max_staleness, seed_unit_values, seed_ordinals
+        )
+        return matrix
+
+    def market_values(
+        self, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> tuple[list[date], array]:
+        """Computes the market value of a portfolio for every date in a date range.
+
+        The database accessor must be open when calling this method.
+
+        Args:
+            portfolio: The portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            A tuple of the business days in [date_from, date_to] and an array
+            with the market value of every business day.
+        """
+        matrix: MarketValueMatrix = self.build_matrix(portfolio, date_from, date_to)
+        return matrix.dates, matrix.market_values()
@@ -0,0 +1,334 @@
+"""Contains a long-running HTTP server generating risk reports."""
+
+__all__: list[str] = ["RiskReportServer"]
+
+from ..api.db import RiskDbAccessor, PriceStore, PositionIndex
+from ..helpers.instrumentation import LatencyHistogram
+from .risk_figure_generator import RiskFigureGenerator
+from .riskreport import RiskReportSettings, RiskReport
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+import json
+import threading
+import time
+
+# The inputs identifying a report: portfolio name, date range and key figures.
+_ReportKey = tuple[str, date, date, tuple[str, ...]]
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of a RiskReportServer."""
+
+    server: "_HTTPServer"
+
+    def do_GET(self) -> None:
+        start: float = time.perf_counter()
+        url = urlsplit(self.path)
+        report_server: RiskReportServer = self.server.report_server
+        status: int = 200
+        body: bytes
+        try:
+            match url.path:
+                case "/report":
+                    body = report_server.get_report(
+                        report_server.parse_settings(parse_qs(url.query))
+                    )
+                case "/metrics":
+                    body = json.dumps(report_server.metrics(), indent=4).encode()
+                case "/health":
+                    body = b'{"status": "ok"}'
+                case _:
+                    status = 404
+                    body = json.dumps({"error": f"{url.path} not found."}).encode()
+        except ValueError as e:
+            status = 400
+            body = json.dumps({"error": str(e)}).encode()
+        except Exception as e:
+            status = 500
+            body = json.dumps({"error": repr(e)}).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        report_server.record_latency(url.path, time.perf_counter() - start)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.report_server.access_log:
+            super().log_message(format, *args)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    """HTTP server holding a reference to its RiskReportServer."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], report_server: "RiskReportServer"):
+        self.report_server = report_server
+        super().__init__(address, _RequestHandler)
+
+
+class RiskReportServer:
+    """Type used for serving risk reports over HTTP from a long-running process.
+
+    The server keeps the state needed by reports warm in memory: reference
+    data (in the identity map of the database accessor), the positions of
+    every portfolio (in a PositionIndex) and all prices (in a PriceStore).
+    Every report is generated with its own RiskFigureGenerator and database
+    accessor, which share this state but nothing else, so that concurrent
+    reports never see the metrics sinks or diagnostics of each other.
+    Finished reports are cached as JSON, keyed by their inputs, in a cache of
+    at most cache_size reports, evicting the least recently used report.
+    Concurrent requests for a report which is not cached are coalesced into
+    one report.
+
+    The warm state and the report cache are discarded whenever the change
+    watermark of the database moves, i.e. when a price or position changes,
+    see RiskDbAccessor.get_database_watermark. The watermark is checked at
+    most once every watermark_check_interval seconds.
+
+    Endpoints:
+        GET /report?portfolio=EQ_US&date_from=2024-01-01&date_to=2024-05-31
+            &key_figures=Market value&key_figures=Return (1D)
+            The report, see RiskReport.generate. key_figures can be repeated,
+            and defaults to all key figures.
+        GET /metrics
+            Latency histograms of every endpoint and of report generation,
+            and report cache statistics.
+        GET /health
+            {"status": "ok"}
+
+    Example usage:
+        server = RiskReportServer(port=8000)
+        server.serve_forever()
+
+    Attributes:
+        host: The host name or address the server listens on.
+        port: The port the server listens on, 0 for any free port.
+        read_through: True if stored figures are reused, see RiskFigureGenerator.
+        cache_size: The maximum number of cached reports.
+        watermark_check_interval: The minimum time between checks of the
+            database watermark in seconds.
+        access_log: If True, every request is logged to stderr.
+    """
+
+    DEFAULT_KEY_FIGURES: list[str] = [
+        "Market value",
+        "Return (1D)",
+        "Volatility (3M, ann.)",
+    ]
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        *,
+        risk_db_accessor: RiskDbAccessor | None = None,
+        read_through: bool = False,
+        cache_size: int = 256,
+        watermark_check_interval: float = 1.0,
+        access_log: bool = False,
+    ) -> None:
+        if risk_db_accessor is None:
+            risk_db_accessor = RiskDbAccessor()
+        self.host = host
+        self.port = port
+        self.cache_size = cache_size
+        self.watermark_check_interval = watermark_check_interval
+        self.access_log = access_log
+        self.read_through = read_through
+        self._db = risk_db_accessor
+        self._price_store: PriceStore | None = None
+        self._position_index: PositionIndex | None = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._reports: OrderedDict[_ReportKey, bytes] = OrderedDict()
+        self._in_flight: dict[_ReportKey, Future] = {}
+        self._generation: int = 0
+        self._watermark: int | None = None
+        self._watermark_checked_at: float = 0.0
+        self._latencies: dict[str, LatencyHistogram] = {}
+        self._counters: dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "invalidations": 0,
+        }
+        self._http_server: _HTTPServer | None = None
+
+    def warm_up(self) -> None:
+        """Loads reference data, positions and prices into memory."""
+        db: RiskDbAccessor
+        with self._db as db:
+            watermark: int = db.get_database_watermark()
+            db.get_instruments()
+            db.get_portfolios()
+            db.get_key_figures()
+            db.get_key_figure_ref_types()
+            position_index: PositionIndex = PositionIndex.from_db(db)
+            price_store: PriceStore = PriceStore.from_db(db)
+        with self._lock:
+            self._position_index = position_index
+            self._price_store = price_store
+            self._watermark = watermark
+            self._watermark_checked_at = time.monotonic()
+
+    def serve_forever(self) -> None:
+        """Warms up and serves requests until shutdown is called."""
+        self.warm_up()
+        self._http_server = _HTTPServer((self.host, self.port), self)
+        self.port = self._http_server.server_address[1]
+        try:
+            self._http_server.serve_forever()
+        finally:
+            self._http_server.server_close()
+
+    def shutdown(self) -> None:
+        """Stops serve_forever, from another thread."""
+        if self._http_server is not None:
+            self._http_server.shutdown()
+
+    def parse_settings(self, query: dict[str, list[str]]) -> RiskReportSettings:
+        """Creates report settings from the parsed query string of a request.
+
+        Raises:
+            ValueError: If a parameter is missing or invalid.
+        """
+        try:
+            portfolio_name: str = query["portfolio"][0]
+            date_from: date = date.fromisoformat(query["date_from"][0])
+            date_to: date = date.fromisoformat(query["date_to"][0])
+        except KeyError as e:
+            raise ValueError(f"Missing parameter {e}.") from e
+        if date_from > date_to:
+            raise ValueError("date_from must be <= date_to.")
+        key_figures: list[str] = query.get("key_figures", self.DEFAULT_KEY_FIGURES)
+        return RiskReportSettings(portfolio_name, date_from, date_to, key_figures)
+
+    def get_report(self, settings: RiskReportSettings) -> bytes:
+        """Gets a report as JSON, from the cache or by generating it.
+
+        Args:
+            settings: The settings of the report.
+
+        Returns:
+            The report, as UTF-8 encoded JSON.
+        """
+        self._check_watermark()
+        key: _ReportKey = (
+            settings.portfolio_name,
+            settings.date_from,
+            settings.date_to,
+            tuple(settings.key_figures),
+        )
+        with self._lock:
+            report: bytes | None = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+                self._counters["hits"] += 1
+                return report
+            future: Future | None = self._in_flight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                is_owner: bool = False
+            else:
+                self._counters["misses"] += 1
+                future = Future()
+                self._in_flight[key] = future
+                is_owner = True
+                generation: int = self._generation
+        if is_owner:
+            future.set_running_or_notify_cancel()
+            self._generate(key, settings, future, generation)
+        return future.result()
+
+    def _generate(
+        self,
+        key: _ReportKey,
+        settings: RiskReportSettings,
+        future: Future,
+        generation: int,
+    ) -> None:
+        start: float = time.perf_counter()
+        try:
+            rfg: RiskFigureGenerator = self._create_risk_figure_generator()
+            report: bytes = json.dumps(
+                RiskReport(settings, risk_figure_generator=rfg).generate(),
+                indent=4,
+            ).encode()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            return
+        self.record_latency("generate", time.perf_counter() - start)
+        with self._lock:
+            self._in_flight.pop(key, None)
+            # Reports started before an invalidation are not cached.
+            if generation == self._generation:
+                self._reports[key] = report
+                if len(self._reports) > self.cache_size:
+                    self._reports.popitem(last=False)
+        future.set_result(report)
+
+    def _create_risk_figure_generator(self) -> RiskFigureGenerator:
+        """Creates a generator for one report, sharing the warm state of the server."""
+        with self._lock:
+            price_store: PriceStore | None = self._price_store
+            position_index: PositionIndex | None = self._position_index
+        rfg: RiskFigureGenerator = RiskFigureGenerator(
+            RiskDbAccessor(self._db.db_path, identity_map=self._db.identity_map),
+            read_through=self.read_through,
+            price_store=price_store,
+            cache_positions=True,
+        )
+        rfg.position_index = position_index
+        return rfg
+
+    def _check_watermark(self) -> None:
+        """Discards the warm state and the cached reports if the watermark moved."""
+        elapsed: float = time.monotonic() - self._watermark_checked_at
+        if elapsed < self.watermark_check_interval:
+            return
+        # Only one thread checks, the others keep serving the current state.
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._watermark_checked_at = time.monotonic()
+            db: RiskDbAccessor
+            with self._db as db:
+                watermark: int = db.get_database_watermark()
+            if watermark == self._watermark:
+                return
+            self.warm_up()
+            with self._lock:
+                self._generation += 1
+                self._reports.clear()
+                self._counters["invalidations"] += 1
+        finally:
+            self._refresh_lock.release()
+
+    def record_latency(self, name: str, elapsed: float) -> None:
+        """Records a latency in the histogram of name."""
+        histogram: LatencyHistogram | None = self._latencies.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latencies.setdefault(name, LatencyHistogram())
+        histogram.record(elapsed)
+
+    def metrics(self) -> dict[str, Any]:
+        """Gets the latency histograms and report cache statistics."""
+        with self._lock:
+            latencies: dict[str, LatencyHistogram] = dict(self._latencies)
+            cache: dict[str, int] = {**self._counters, "size": len(self._reports)}
+        return {
+            "cache": cache,
+            "latencies": {
+                name: histogram.to_dict() for name, histogram in latencies.items()
+            },
+        }
@@ -2,19 +2,203 @@
 
 __all__: list[str] = ["RiskFigureGenerator"]
 
-from ..api.db import RiskDbAccessor
+from ..api.db import RiskDbAccessor, PriceStore, PositionIndex
 from ..types import *
-from datetime import date, timedelta
-import statistics
+from ..helpers.rolling import RollingStatistics
+from ..helpers.instrumentation import MetricsSink, timed
+from ..helpers.trading_calendar import TradingCalendar
+from .market_value_engine import (
+    MarketValueEngine,
+    MarketValueMatrix,
+    PricePolicy,
+    PriceResolution,
+)
+from datetime import date
+from typing import Any, Callable, Iterable, Iterator, Sequence
+import itertools
+import operator
 import math
 
+VOLATILITY_WINDOW_DAYS: int = 90
+
 
 class RiskFigureGenerator:
-    """Class used for calculating and persisting risk figures consumed by the risk report."""
+    """Class used for calculating and persisting risk figures consumed by the risk report.
+
+    By default every requested figure is computed and stored. In read-through
+    mode, figures already stored in the database are read instead, and only the
+    dates missing from the database are computed and stored. Stored figures of
+    a portfolio are invalidated when the prices or positions they were computed
+    from change, or when they were computed with other settings, i.e. another
+    calendar or price policy, see validate_key_figure_values.
+
+    Computed figures are written with RiskDbAccessor.upsert_key_figure_values,
+    unless a key_figure_value_writer is provided, in which case every batch of
+    computed figures is passed to it instead. This lets callers, e.g.
+    BatchRiskReport, funnel the writes of many generators through one writer.
+    A generator with a key_figure_value_writer never writes to the database:
+    the owner of the writer must validate the stored figures before the
+    generator reads or writes them.
+
+    If a price_store is provided, prices are read from it instead of the
+    database, e.g. a PriceStore memory-mapped from a snapshot file. If
+    cache_positions is True, the positions of every portfolio are kept in
+    memory, see MarketValueEngine.
+
+    Figures are computed for the business days of a calendar, by default every
+    day. With a TradingCalendar, e.g. TradingCalendar.for_market("SE"), returns
+    are between consecutive business days, the volatility window and the
+    annualization use the business days per year of the calendar, and the
+    figures of a date which is not a business day are those of the last
+    business day before it.
+
+    Missing prices are handled with price_policy, by default an error. With
+    PricePolicy.FORWARD_FILL, e.g. for portfolios holding instruments of
+    markets with different holidays, a missing price is replaced with the last
+    price at most max_staleness days old. With PricePolicy.SKIP, dates with
+    missing prices get no figures. See price_resolution_for_portfolio_and_date_range
+    for the prices which were filled or skipped.
+
+    If holding_snapshot is True, the holdings of a portfolio are read from the
+    holdings materialized in the database instead of being derived from the
+    validity periods of its positions, see RiskDbAccessor.get_holdings.
+
+    If a metrics sink is provided, the execution time of every public method is
+    recorded to it, as well as the statements of the database accessor unless
+    the accessor already has a sink of its own.
+
+    Attributes:
+        read_through: True if stored figures are reused, otherwise False.
+        metrics: The sink method timings are recorded to, None to disable timing.
+    """
+
+    def __init__(
+        self,
+        risk_db_accessor: RiskDbAccessor | None = None,
+        *,
+        read_through: bool = False,
+        key_figure_value_writer: Callable[[list[KeyFigureValue]], Any] | None = None,
+        price_store: PriceStore | None = None,
+        metrics: MetricsSink | None = None,
+        cache_positions: bool = False,
+        calendar: TradingCalendar | None = None,
+        price_policy: PricePolicy = PricePolicy.STRICT,
+        max_staleness: int = 5,
+        holding_snapshot: bool = False,
+    ) -> None:
+        if risk_db_accessor is None:
+            risk_db_accessor = RiskDbAccessor()
+        if metrics is not None and risk_db_accessor.metrics is None:
+            risk_db_accessor.metrics = metrics
+        self.read_through = read_through
+        self.metrics = metrics
+        self._key_figure_value_writer = key_figure_value_writer
+        self._risk_db_accessor = risk_db_accessor
+        self._market_value_engine = MarketValueEngine(
+            risk_db_accessor,
+            price_store,
+            cache_positions=cache_positions,
+            calendar=calendar,
+            price_policy=price_policy,
+            max_staleness=max_staleness,
+            holding_snapshot=holding_snapshot,
+        )
+
+    def session(self) -> RiskDbAccessor:
+        """Gets a context manager keeping one database connection open for its scope.
+
+        Example usage:
+            with rfg.session():
+                rfg.market_value_for_portfolio_and_date("EQ_US", date_)
+                rfg.return_1D_for_portfolio_and_date("EQ_US", date_)
+        """
+        return self._risk_db_accessor
+
+    @property
+    def price_store(self) -> PriceStore | None:
+        """The store prices are read from, None if read from the database."""
+        return self._market_value_engine.price_store
+
+    @price_store.setter
+    def price_store(self, value: PriceStore | None) -> None:
+        self._market_value_engine.price_store = value
+
+    @property
+    def position_index(self) -> PositionIndex | None:
+        """The positions kept in memory, see MarketValueEngine.position_index."""
+        return self._market_value_engine.position_index
+
+    @position_index.setter
+    def position_index(self, value: PositionIndex | None) -> None:
+        self._market_value_engine.position_index = value
+
+    def invalidate_positions(self) -> None:
+        """Discards the positions kept in memory, see MarketValueEngine."""
+        self._market_value_engine.invalidate_positions()
+
+    @property
+    def calendar(self) -> TradingCalendar:
+        """The calendar whose business days figures are computed for."""
+        return self._market_value_engine.calendar
+
+    @property
+    def price_policy(self) -> PricePolicy:
+        """The handling of missing prices, see MarketValueEngine."""
+        return self._market_value_engine.price_policy
+
+    @property
+    def max_staleness(self) -> int:
+        """The maximum age in days of a forward filled price, see MarketValueEngine."""
+        return self._market_value_engine.max_staleness
+
+    @property
+    def settings_key(self) -> str:
+        """Identifies the settings the figures depend on, see MarketValueEngine."""
+        return self._market_value_engine.settings_key
 
-    def __init__(self) -> None:
-        self._risk_db_accessor = RiskDbAccessor()
+    @timed
+    def validate_key_figure_values(self, portfolio_name: str) -> bool:
+        """Deletes the stored figures of a portfolio which are out of date.
 
+        In read-through mode, stored figures are deleted from the earliest
+        date whose prices or positions changed since they were last validated,
+        or altogether if they were computed with other settings, see
+        settings_key and RiskDbAccessor.validate_key_figure_values. Otherwise
+        stored figures are never reused, and computed figures overwrite the
+        stored figures of their dates, so stored figures are only deleted if
+        they were computed with other settings, to not store figures computed
+        with different settings alongside each other. This is done before
+        every figure is read or stored, unless a key_figure_value_writer is
+        provided.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+
+        Returns:
+            True if stored figures may have been deleted, otherwise False.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            return self._validate_key_figure_values(
+                db, self._get_portfolio(db, portfolio_name)
+            )
+
+    def _validate_key_figure_values(
+        self, db: RiskDbAccessor, portfolio: Portfolio
+    ) -> bool:
+        """See validate_key_figure_values."""
+        if not self.read_through:
+            # The watermark is only looked up if the settings changed.
+            if db.get_key_figure_settings(portfolio) == self.settings_key:
+                return False
+        return db.validate_key_figure_values(portfolio, self.settings_key)
+
+    @property
+    def volatility_window(self) -> int:
+        """The number of returns in the volatility window, 3 months of business days."""
+        return round(VOLATILITY_WINDOW_DAYS * self.calendar.days_per_year / 365)
+
+    @timed
     def market_value_for_portfolio_and_date(
         self, portfolio_name: str, date_: date
     ) -> KeyFigureValue:
@@ -29,27 +213,16 @@ class RiskFigureGenerator:
             which was either inserted or updated in the database.
         """
 
-        db: RiskDbAccessor
-        with self._risk_db_accessor as db:
-            portfolio_ = db.get_portfolio_from_name(portfolio_name)
-            ref_type = db.get_key_figure_ref_type_from_name("Portfolio")
-            key_figure = db.get_key_figure_from_name("Market value")
-            positions: list[Position] = db.get_positions(
-                position_date=date_, portfolio=portfolio_
-            )
-            total_mv: float = 0.0
-            for pos in positions:
-                instrument_price: Price = db.get_prices(
-                    instrument=pos.instrument, date_from=date_, date_to=date_
-                )[0]
-                total_mv += pos.market_value(instrument_price.price)
-
-            key_figure_value: KeyFigureValue = KeyFigureValue(
-                0, date_, total_mv, ref_type, portfolio_, key_figure
-            )
-            db.insert_or_update_key_figure(key_figure_value)
-            return key_figure_value
+        date_ = self.calendar.roll_backward(date_)
+        return self._single_value(
+            self.market_value_for_portfolio_and_date_range(
+                portfolio_name, date_, date_
+            ),
+            portfolio_name,
+            date_,
+        )
 
+    @timed
     def market_value_for_portfolio_and_date_range(
         self, portfolio_name: str, date_from: date, date_to: date
     ) -> list[KeyFigureValue]:
@@ -65,90 +238,498 @@ class RiskFigureGenerator:
             which were either inserted or updated in the database.
         """
 
-        result: list[KeyFigureValue] = []
-        date_: date = date_from
-        while date_ <= date_to:
-            result.append(
-                self.market_value_for_portfolio_and_date(portfolio_name, date_)
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            return self._key_figure_series(
+                db,
+                portfolio_,
+                "Market value",
+                date_from,
+                date_to,
+                self._compute_market_values,
             )
-            date_ = date_ + timedelta(days=1)
-        return result
 
+    @timed
     def return_1D_for_portfolio_and_date(
         self, portfolio_name: str, date_: date
     ) -> KeyFigureValue:
-        prev_date: date = date_ - timedelta(days=1)
-        market_values: list[KeyFigureValue] = (
-            self.market_value_for_portfolio_and_date_range(
-                portfolio_name, prev_date, date_
-            )
-        )
+        """Calculates and stores the one-day return for a given portfolio and date.
 
-        return_1D: float = market_values[1].value / market_values[0].value - 1.0
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_: The date to calculate and store the return for.
 
-        db: RiskDbAccessor
-        with self._risk_db_accessor as db:
-            key_figure = db.get_key_figure_from_name("Return (1D)")
-            key_figure_value: KeyFigureValue = KeyFigureValue(
-                0,
-                date_,
-                return_1D,
-                market_values[0].key_figure_ref_type,
-                market_values[0].reference_entity,
-                key_figure,
-            )
-            db.insert_or_update_key_figure(key_figure_value)
-            return key_figure_value
+        Returns:
+            A KeyFigureValue object representing the key figure value
+            which was either inserted or updated in the database.
+        """
+        date_ = self.calendar.roll_backward(date_)
+        return self._single_value(
+            self.return_1D_for_portfolio_and_date_range(portfolio_name, date_, date_),
+            portfolio_name,
+            date_,
+        )
 
+    @timed
     def return_1D_for_portfolio_and_date_range(
         self, portfolio_name: str, date_from: date, date_to: date
     ) -> list[KeyFigureValue]:
-        result: list[KeyFigureValue] = []
-        date_: date = date_from
-        while date_ <= date_to:
-            result.append(self.return_1D_for_portfolio_and_date(portfolio_name, date_))
-            date_ = date_ + timedelta(days=1)
-        return result
+        """Calculates and stores the one-day returns for a given portfolio and date range.
+
+        The market values for [date_from - 1, date_to] (from the business day
+        before date_from) are computed and stored once, and every return is
+        derived from that series.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_from: The first date to calculate and store the return for.
+            date_to: The last date to calculate and store the return for.
 
+        Returns:
+            A list of KeyFigureValue objects representing the key figure values
+            which were either inserted or updated in the database.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            return self._key_figure_series(
+                db, portfolio_, "Return (1D)", date_from, date_to, self._compute_returns
+            )
+
+    @timed
     def volatility_3M_ann_for_portfolio_and_date(
         self, portfolio_name: str, date_: date
     ) -> KeyFigureValue:
-        date_start: date = date_ - timedelta(days=89)
-        returns: list[KeyFigureValue] = self.return_1D_for_portfolio_and_date_range(
-            portfolio_name, date_start, date_
+        """Calculates and stores the annualized 3 month volatility for a given date.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_: The date to calculate and store the volatility for.
+
+        Returns:
+            A KeyFigureValue object representing the key figure value
+            which was either inserted or updated in the database.
+        """
+        date_ = self.calendar.roll_backward(date_)
+        return self._single_value(
+            self.volatility_3M_ann_for_portfolio_and_date_range(
+                portfolio_name, date_, date_
+            ),
+            portfolio_name,
+            date_,
         )
-        vol = statistics.stdev([math.log(1 + k.value) for k in returns])
-        vol = vol * math.sqrt(365)  # Annualize
 
+    @timed
+    def volatility_3M_ann_for_portfolio_and_date_range(
+        self, portfolio_name: str, date_from: date, date_to: date
+    ) -> list[KeyFigureValue]:
+        """Calculates and stores the annualized 3 month volatility for a date range.
+
+        The volatility of a date is the annualized sample standard deviation of
+        the log returns of the last 90 days (volatility_window business days).
+        The returns (and market values) for the whole range are computed and
+        stored once, and the volatility of every date is computed by sliding a
+        window over the log returns.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_from: The first date to calculate and store the volatility for.
+            date_to: The last date to calculate and store the volatility for.
+
+        Returns:
+            A list of KeyFigureValue objects representing the key figure values
+            which were either inserted or updated in the database.
+        """
         db: RiskDbAccessor
         with self._risk_db_accessor as db:
-            portfolio_ = db.get_portfolio_from_name(portfolio_name)
-            ref_type = db.get_key_figure_ref_type_from_name("Portfolio")
-            key_figure = db.get_key_figure_from_name("Volatility (3M, ann.)")
-            key_figure_value: KeyFigureValue = KeyFigureValue(
-                0, date_, vol, ref_type, portfolio_, key_figure
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            return self._key_figure_series(
+                db,
+                portfolio_,
+                "Volatility (3M, ann.)",
+                date_from,
+                date_to,
+                self._compute_volatilities,
             )
-            db.insert_or_update_key_figure(key_figure_value)
-            return key_figure_value
 
+    @timed
+    def iter_return_1D_cumulative_series(
+        self, portfolio_name: str, date_from: date, date_to: date
+    ) -> Iterator[tuple[date, float]]:
+        """Yields the cumulative one-day returns for a given portfolio and date range.
+
+        The cumulative return of a date is the compounded return from the
+        start of date_from up to and including the date. The market values for
+        the range are computed once, and the cumulative returns are produced
+        from a running product of the gross returns, without creating (or
+        storing) a KeyFigureValue object for every date.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_from: The first date of the series.
+            date_to: The last date of the series.
+
+        Yields:
+            Tuples of a date and the cumulative return for that date.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            dates, market_values = self._market_value_engine.market_values(
+                portfolio_, self.calendar.previous_business_day(date_from), date_to
+            )
+        yield from self._cumulative_returns(dates, market_values)
+
+    @staticmethod
+    def _cumulative_returns(
+        dates: list[date], market_values: Sequence[float]
+    ) -> Iterator[tuple[date, float]]:
+        """Yields the cumulative returns of a market value series from its first date."""
+        gross_returns: Iterator[float] = (
+            market_values[i] / market_values[i - 1]
+            for i in range(1, len(market_values))
+        )
+        for date_, growth in zip(
+            dates[1:], itertools.accumulate(gross_returns, operator.mul)
+        ):
+            yield date_, growth - 1.0
+
+    @timed
     def return_1D_cumulative_series(
         self, portfolio_name: str, date_from: date, date_to: date
     ) -> list[tuple[date, float]]:
+        """Calculates the cumulative one-day returns for a given portfolio and date range.
 
-        returns: list[KeyFigureValue] = self.return_1D_for_portfolio_and_date_range(
-            portfolio_name, date_from, date_to
+        See iter_return_1D_cumulative_series.
+
+        Returns:
+            A list of tuples of a date and the cumulative return for that date.
+        """
+        return list(
+            self.iter_return_1D_cumulative_series(portfolio_name, date_from, date_to)
         )
 
-        result: list[tuple[date, float]] = []
-        date_: date = date_from
-        cumulative_return: float = 0
-        while date_ <= date_to:
-            key_figure_value: KeyFigureValue = next(
-                filter(lambda k: k.key_figure_date == date_, returns)
+    @timed
+    def return_1D_from_market_values(
+        self,
+        portfolio_name: str,
+        market_values: list[KeyFigureValue],
+        date_from: date,
+        date_to: date,
+    ) -> list[KeyFigureValue]:
+        """Calculates and stores the one-day returns for a date range from market values.
+
+        Like return_1D_for_portfolio_and_date_range, but the returns are
+        derived from market values the caller already has, e.g. the values
+        returned by market_value_for_portfolio_and_date_range, instead of
+        computing them again.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            market_values: The market values of the portfolio, in ascending
+                date order, from the business day before date_from to date_to.
+            date_from: The first date to calculate and store the return for.
+            date_to: The last date to calculate and store the return for.
+
+        Returns:
+            A list of KeyFigureValue objects representing the key figure values
+            which were either inserted or updated in the database.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            return self._key_figure_series(
+                db,
+                portfolio_,
+                "Return (1D)",
+                date_from,
+                date_to,
+                lambda db, portfolio, date_from, date_to: (
+                    self._returns_from_market_values(market_values, date_from, date_to)
+                ),
+            )
+
+    @timed
+    def volatility_3M_ann_from_returns(
+        self,
+        portfolio_name: str,
+        returns: list[KeyFigureValue],
+        date_from: date,
+        date_to: date,
+    ) -> list[KeyFigureValue]:
+        """Calculates and stores the annualized 3 month volatility from returns.
+
+        Like volatility_3M_ann_for_portfolio_and_date_range, but the
+        volatilities are derived from one-day returns the caller already has.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            returns: The one-day returns of the portfolio, in ascending date
+                order, from volatility_window - 1 business days before
+                date_from to date_to.
+            date_from: The first date to calculate and store the volatility for.
+            date_to: The last date to calculate and store the volatility for.
+
+        Returns:
+            A list of KeyFigureValue objects representing the key figure values
+            which were either inserted or updated in the database.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            return self._key_figure_series(
+                db,
+                portfolio_,
+                "Volatility (3M, ann.)",
+                date_from,
+                date_to,
+                lambda db, portfolio, date_from, date_to: (
+                    self._volatilities_from_returns(returns, date_from, date_to)
+                ),
+            )
+
+    @timed
+    def iter_return_1D_cumulative_from_market_values(
+        self, market_values: list[KeyFigureValue], date_from: date
+    ) -> Iterator[tuple[date, float]]:
+        """Yields the cumulative one-day returns from date_from from market values.
+
+        See iter_return_1D_cumulative_series. Market values before the business
+        day before date_from are ignored.
+
+        Args:
+            market_values: The market values of the portfolio, in ascending
+                date order, from the business day before date_from.
+            date_from: The first date of the series.
+
+        Yields:
+            Tuples of a date and the cumulative return for that date.
+        """
+        start: date = self.calendar.previous_business_day(date_from)
+        first: int = 0
+        while (
+            first < len(market_values)
+            and market_values[first].key_figure_date < start
+        ):
+            first += 1
+        yield from self._cumulative_returns(
+            [v.key_figure_date for v in market_values[first:]],
+            [v.value for v in market_values[first:]],
+        )
+
+    @timed
+    def price_resolution_for_portfolio_and_date_range(
+        self, portfolio_name: str, date_from: date, date_to: date
+    ) -> PriceResolution:
+        """Gets the missing prices resolved by the price policy for a date range.
+
+        Args:
+            portfolio_name: The name of the portfolio.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+
+        Returns:
+            The prices which were filled, or the dates which were skipped, when
+            computing the market values of the range.
+        """
+        db: RiskDbAccessor
+        with self._risk_db_accessor as db:
+            portfolio_: Portfolio = self._get_portfolio(db, portfolio_name)
+            matrix: MarketValueMatrix = self._market_value_engine.build_matrix(
+                portfolio_, date_from, date_to
+            )
+        return matrix.resolution
+
+    @staticmethod
+    def _single_value(
+        values: list[KeyFigureValue], portfolio_name: str, date_: date
+    ) -> KeyFigureValue:
+        if len(values) == 0:
+            raise ValueError(
+                f"No value for portfolio {portfolio_name} on {date_.isoformat()}, "
+                "prices are missing."
+            )
+        return values[0]
+
+    def _get_portfolio(self, db: RiskDbAccessor, portfolio_name: str) -> Portfolio:
+        portfolio_: Portfolio | None = db.get_portfolio_from_name(portfolio_name)
+        if portfolio_ is None:
+            raise ValueError(f"Portfolio {portfolio_name} does not exist.")
+        return portfolio_
+
+    def _compute_market_values(
+        self, db: RiskDbAccessor, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> tuple[list[date], Sequence[float]]:
+        return self._market_value_engine.market_values(portfolio, date_from, date_to)
+
+    def _compute_returns(
+        self, db: RiskDbAccessor, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> tuple[list[date], Sequence[float]]:
+        """Computes one-day returns from the market values for [date_from - 1, date_to]."""
+        start: date = self.calendar.previous_business_day(date_from)
+        if self._market_value_engine.price_policy is PricePolicy.SKIP:
+            # The return of a date after skipped dates is from the last date
+            # not skipped, at most max_staleness business days earlier.
+            start = self.calendar.shift(
+                start, -self._market_value_engine.max_staleness
+            )
+        market_values: list[KeyFigureValue] = self._key_figure_series(
+            db,
+            portfolio,
+            "Market value",
+            start,
+            date_to,
+            self._compute_market_values,
+        )
+        return self._returns_from_market_values(market_values, date_from, date_to)
+
+    @staticmethod
+    def _returns_from_market_values(
+        market_values: list[KeyFigureValue], date_from: date, date_to: date
+    ) -> tuple[list[date], list[float]]:
+        """Computes the one-day returns of [date_from, date_to] from a market value series."""
+        first: int = 1
+        while (
+            first < len(market_values)
+            and market_values[first].key_figure_date < date_from
+        ):
+            first += 1
+        last: int = len(market_values)
+        while last > first and market_values[last - 1].key_figure_date > date_to:
+            last -= 1
+        returns: list[float] = [
+            market_values[i].value / market_values[i - 1].value - 1.0
+            for i in range(first, last)
+        ]
+        return [v.key_figure_date for v in market_values[first:last]], returns
+
+    def _compute_volatilities(
+        self, db: RiskDbAccessor, portfolio: Portfolio, date_from: date, date_to: date
+    ) -> tuple[list[date], Sequence[float]]:
+        """Computes volatilities by sliding a window over the log returns of the range."""
+        window: int = self.volatility_window
+        returns: list[KeyFigureValue] = self._key_figure_series(
+            db,
+            portfolio,
+            "Return (1D)",
+            self.calendar.shift(self.calendar.roll_forward(date_from), 1 - window),
+            date_to,
+            self._compute_returns,
+        )
+        return self._volatilities_from_returns(returns, date_from, date_to)
+
+    def _volatilities_from_returns(
+        self, returns: list[KeyFigureValue], date_from: date, date_to: date
+    ) -> tuple[list[date], list[float]]:
+        """Computes the volatilities of [date_from, date_to] from a one-day return series."""
+        window: int = self.volatility_window
+        log_returns: list[float] = [math.log(1 + r.value) for r in returns]
+        annualization: float = math.sqrt(self.calendar.days_per_year)
+        stats: RollingStatistics = RollingStatistics()
+        dates: list[date] = []
+        volatilities: list[float] = []
+        for i, log_return in enumerate(log_returns):
+            stats.add(log_return)
+            if i >= window:
+                stats.remove(log_returns[i - window])
+            if i >= window - 1 and date_from <= returns[i].key_figure_date <= date_to:
+                dates.append(returns[i].key_figure_date)
+                volatilities.append(stats.stdev() * annualization)
+        return dates, volatilities
+
+    def _key_figure_series(
+        self,
+        db: RiskDbAccessor,
+        portfolio: Portfolio,
+        key_figure_name: str,
+        date_from: date,
+        date_to: date,
+        compute: Callable[
+            [RiskDbAccessor, Portfolio, date, date], tuple[list[date], Sequence[float]]
+        ],
+    ) -> list[KeyFigureValue]:
+        """Gets the values of a portfolio key figure for every date in a date range.
+
+        Unless in read-through mode, the values are computed and stored. In
+        read-through mode, stored values are read and compute is only called
+        for the span of dates missing from the database.
+
+        Args:
+            db: An open database accessor.
+            portfolio: The portfolio.
+            key_figure_name: The name of the key figure.
+            date_from: The first date of the range.
+            date_to: The last date of the range.
+            compute: A callable computing the key figure for a date range.
+
+        Returns:
+            A list of KeyFigureValue objects, one for every business day in the
+            range, except the dates skipped by the price policy.
+        """
+        if self._key_figure_value_writer is None:
+            self._validate_key_figure_values(db, portfolio)
+        if not self.read_through:
+            dates, values = compute(db, portfolio, date_from, date_to)
+            return self._store_key_figure_values(
+                db, portfolio, key_figure_name, dates, values
+            )
+
+        stored: dict[date, KeyFigureValue] = {
+            v.key_figure_date: v
+            for v in db.get_key_figure_values_for_range(
+                db.get_key_figure_from_name(key_figure_name),
+                db.get_key_figure_ref_type_from_name("Portfolio"),
+                portfolio,
+                date_from,
+                date_to,
+            )
+        }
+        dates: list[date] = self.calendar.business_days(date_from, date_to)
+        missing: list[date] = [d for d in dates if d not in stored]
+        if len(missing) > 0:
+            computed: list[tuple[date, float]] = [
+                (d, v)
+                for d, v in zip(*compute(db, portfolio, missing[0], missing[-1]))
+                if d not in stored
+            ]
+            for v in self._store_key_figure_values(
+                db,
+                portfolio,
+                key_figure_name,
+                [c[0] for c in computed],
+                [c[1] for c in computed],
+            ):
+                stored[v.key_figure_date] = v
+        # Dates skipped by the price policy have no values.
+        return [stored[d] for d in dates if d in stored]
+
+    def _store_key_figure_values(
+        self,
+        db: RiskDbAccessor,
+        portfolio: Portfolio,
+        key_figure_name: str,
+        dates: list[date],
+        values: Iterable[float],
+    ) -> list[KeyFigureValue]:
+        """Inserts or updates the values of a portfolio key figure for a series of dates.
+
+        All values are written in a single transaction, or passed to the
+        key figure value writer if there is one.
+
+        Returns:
+            A list of the KeyFigureValue objects which were inserted or updated.
+        """
+        ref_type = db.get_key_figure_ref_type_from_name("Portfolio")
+        key_figure = db.get_key_figure_from_name(key_figure_name)
+        result: list[KeyFigureValue] = [
+            KeyFigureValue.create_trusted(
+                0, date_, value, ref_type, portfolio, key_figure
             )
-            cumulative_return = (1 + cumulative_return) * (
-                1 + key_figure_value.value
-            ) - 1.0
-            result.append((date_, cumulative_return))
-            date_ = date_ + timedelta(days=1)
+            for date_, value in zip(dates, values)
+        ]
+        if self._key_figure_value_writer is None:
+            db.upsert_key_figure_values(result)
+        else:
+            self._key_figure_value_writer(result)
         return result
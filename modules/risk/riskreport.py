@@ -3,9 +3,17 @@
 __all__: list[str] = ["RiskReportSettings", "RiskReport"]
 
 from .risk_figure_generator import RiskFigureGenerator
-from ..types import KeyFigureValue
+from .key_figure_registry import (
+    KeyFigureContext,
+    KeyFigureRegistry,
+    CUMULATIVE_RETURNS,
+    default_key_figure_registry,
+)
+from ..helpers.instrumentation import MetricsSink, MetricsCollector, MultiMetricsSink
+from concurrent.futures import Executor
 from datetime import date
 from typing import Any
+import time
 
 
 class RiskReportSettings:
@@ -26,13 +34,81 @@ class RiskReportSettings:
 
 
 class RiskReport:
-    """Type used to generate figures used by the risk report."""
+    """Type used to generate figures used by the risk report.
 
-    def __init__(self, settings: RiskReportSettings) -> None:
+    Args:
+        settings: The settings of the report.
+        read_through: If True, figures already stored in the database are reused,
+            see RiskFigureGenerator.
+        risk_figure_generator: The generator used for computing the figures. If
+            None, a RiskFigureGenerator for the default database is created.
+        diagnostics: If True, a diagnostics section with the statements issued
+            and the time spent in every RiskFigureGenerator method is added to
+            the report, see MetricsCollector.to_dict.
+        metrics_sink: A sink the statements and timings of every report are
+            recorded to, e.g. for forwarding them to a monitoring system.
+        registry: The registry of the key figures the report can contain. If
+            None, the key figures of default_key_figure_registry are supported.
+        executor: If provided, independent key figures and series are computed
+            concurrently on it, see KeyFigureRegistry.evaluate.
+
+    Key figures are computed from the registry, which evaluates every series
+    they are derived from, e.g. the market values, once per report.
+
+    While a report with diagnostics or a metrics sink is generated, its sinks
+    replace the sinks of the RiskFigureGenerator and its database accessor.
+    """
+
+    def __init__(
+        self,
+        settings: RiskReportSettings,
+        *,
+        read_through: bool = False,
+        risk_figure_generator: RiskFigureGenerator | None = None,
+        diagnostics: bool = False,
+        metrics_sink: MetricsSink | None = None,
+        registry: KeyFigureRegistry | None = None,
+        executor: Executor | None = None,
+    ) -> None:
         self.settings = settings
-        self.rfg = RiskFigureGenerator()
+        if risk_figure_generator is None:
+            risk_figure_generator = RiskFigureGenerator(read_through=read_through)
+        self.rfg = risk_figure_generator
+        self.diagnostics = diagnostics
+        self.metrics_sink = metrics_sink
+        self.registry = (
+            registry if registry is not None else default_key_figure_registry()
+        )
+        self.executor = executor
 
     def generate(self) -> dict[str, Any]:
+        collector: MetricsCollector | None = (
+            MetricsCollector() if self.diagnostics else None
+        )
+        sinks: list[MetricsSink] = [
+            sink for sink in [collector, self.metrics_sink] if sink is not None
+        ]
+        if len(sinks) == 0:
+            return self._generate()
+
+        sink: MetricsSink = sinks[0] if len(sinks) == 1 else MultiMetricsSink(sinks)
+        db = self.rfg.session()
+        previous: tuple[MetricsSink | None, MetricsSink | None] = (
+            self.rfg.metrics,
+            db.metrics,
+        )
+        self.rfg.metrics, db.metrics = sink, sink
+        start: float = time.perf_counter()
+        try:
+            result: dict[str, Any] = self._generate()
+        finally:
+            sink.record_timing("RiskReport.generate", time.perf_counter() - start)
+            self.rfg.metrics, db.metrics = previous
+        if collector is not None:
+            result["diagnostics"] = collector.to_dict()
+        return result
+
+    def _generate(self) -> dict[str, Any]:
         result: dict[str, Any] = {
             "portfolio": self.settings.portfolio_name,
             "date_from": self.settings.date_from.isoformat(),
@@ -41,32 +117,26 @@ class RiskReport:
         }
 
         for key_figure in self.settings.key_figures:
-            if key_figure == "Market value":
-                mv: KeyFigureValue = self.rfg.market_value_for_portfolio_and_date(
-                    self.settings.portfolio_name, self.settings.date_to
-                )
-                result["key_figures"][key_figure] = mv.value
-            elif key_figure == "Return (1D)":
-                ret_1D: KeyFigureValue = self.rfg.return_1D_for_portfolio_and_date(
-                    self.settings.portfolio_name, self.settings.date_to
-                )
-                result["key_figures"][key_figure] = ret_1D.value
-            elif key_figure == "Volatility (3M, ann.)":
-                vol: KeyFigureValue = self.rfg.volatility_3M_ann_for_portfolio_and_date(
-                    self.settings.portfolio_name, self.settings.date_to
-                )
-                result["key_figures"][key_figure] = vol.value
-            else:
+            if not self.registry.get(key_figure).key_figure:
                 raise ValueError(f"Key figure {key_figure} is not supported.")
 
-        # Always add a series with cumulative returns for [date_from, date_to].
-        result["cumulative_returns"] = [
-            (t[0].isoformat(), t[1])
-            for t in self.rfg.return_1D_cumulative_series(
-                self.settings.portfolio_name,
-                self.settings.date_from,
-                self.settings.date_to,
+        # Use a single database session for the whole report.
+        with self.rfg.session():
+            values: dict[str, Any] = self.registry.evaluate(
+                KeyFigureContext(
+                    self.rfg,
+                    self.settings.portfolio_name,
+                    self.settings.date_from,
+                    self.settings.date_to,
+                ),
+                # Always add a series with cumulative returns for [date_from, date_to].
+                [*self.settings.key_figures, CUMULATIVE_RETURNS],
+                executor=self.executor,
             )
-        ]
 
+        for key_figure in self.settings.key_figures:
+            result["key_figures"][key_figure] = values[key_figure]
+        result["cumulative_returns"] = [
+            (t[0].isoformat(), t[1]) for t in values[CUMULATIVE_RETURNS]
+        ]
         return result
@@ -18,10 +18,18 @@ class BaseEntity(ABC):
     to represent an in-memory object which has not yet been persisted
     to the database.
 
+    Entity types declare their attributes in __slots__, which keeps the
+    memory footprint of large collections of entities small. Besides the
+    validating constructor, entity types have a create_trusted classmethod
+    which skips validation. It is meant for the database layer, which creates
+    entities from rows whose types are guaranteed by the schema.
+
     Attributes:
         id_: An identifier for the entity, unique among the set of entities of the same type.
     """
 
+    __slots__ = ("_id",)
+
     @abstractmethod
     def __init__(self, id_: int) -> None:
         self.id_ = id_
@@ -60,11 +68,21 @@ class BaseEntity(ABC):
 class BaseEntityNamed(BaseEntity):
     """Abstract base class (ABC) representing an entity with an id and a name."""
 
+    __slots__ = ("__name",)
+
     @abstractmethod
     def __init__(self, id_: int, name: str) -> None:
         super().__init__(id_)
         self.name = name
 
+    @classmethod
+    def create_trusted(cls, id_: int, name: str) -> "BaseEntityNamed":
+        """Creates an entity without validating the arguments, see BaseEntity."""
+        entity: BaseEntityNamed = cls.__new__(cls)
+        entity._id = id_
+        entity.__name = name
+        return entity
+
     @property
     def name(self) -> str:
         """The name of the instrument."""
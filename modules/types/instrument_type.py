@@ -8,5 +8,7 @@ from .base_entity import BaseEntityNamed
 class InstrumentType(BaseEntityNamed):
     """Type representing an instrument type."""
 
+    __slots__ = ()
+
     def __init__(self, id_: int, name: str) -> None:
         super().__init__(id_, name)
@@ -19,6 +19,8 @@ class Instrument(BaseEntityNamed):
     property. This property can only be set when creating the instrument.
     """
 
+    __slots__ = ()
+
     @abstractmethod
     def __init__(self, instrument_id: int, name: str) -> None:
         super().__init__(instrument_id, name)
@@ -32,6 +34,8 @@ class Instrument(BaseEntityNamed):
 class Equity(Instrument):
     """Class representing an equity investment."""
 
+    __slots__ = ()
+
     def __init__(self, instrument_id, name) -> None:
         super().__init__(instrument_id, name)
 
@@ -50,6 +54,8 @@ class Equity(Instrument):
 class Bond(Instrument):
     """Class representing a bond investment."""
 
+    __slots__ = ()
+
     def __init__(self, instrument_id, name) -> None:
         super().__init__(instrument_id, name)
 
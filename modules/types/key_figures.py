@@ -10,6 +10,8 @@ from datetime import date
 class KeyFigureRefType(BaseEntityNamed):
     """Represents the type of entity a key figure value is for."""
 
+    __slots__ = ()
+
     def __init__(self, id_: int, name: str) -> None:
         super().__init__(id_, name)
 
@@ -17,6 +19,8 @@ class KeyFigureRefType(BaseEntityNamed):
 class KeyFigure(BaseEntityNamed):
     """Represents a key figure."""
 
+    __slots__ = ()
+
     def __init__(self, id_: int, name: str) -> None:
         super().__init__(id_, name)
 
@@ -29,6 +33,14 @@ class KeyFigureValue(BaseEntity):
     the log returns for the price of a particular instrument.
     """
 
+    __slots__ = (
+        "_key_figure_date",
+        "_value",
+        "_key_figure_ref_type",
+        "_reference_entity",
+        "_key_figure",
+    )
+
     def __init__(
         self,
         id_: int,
@@ -45,6 +57,26 @@ class KeyFigureValue(BaseEntity):
         self.reference_entity = reference_entity
         self.key_figure = key_figure
 
+    @classmethod
+    def create_trusted(
+        cls,
+        id_: int,
+        key_figure_date: date,
+        value: float | int,
+        key_figure_ref_type: KeyFigureRefType,
+        reference_entity: BaseEntity,
+        key_figure: KeyFigure,
+    ) -> "KeyFigureValue":
+        """Creates a key figure value without validating the arguments, see BaseEntity."""
+        kfv: KeyFigureValue = cls.__new__(cls)
+        kfv._id = id_
+        kfv._key_figure_date = key_figure_date
+        kfv._value = value
+        kfv._key_figure_ref_type = key_figure_ref_type
+        kfv._reference_entity = reference_entity
+        kfv._key_figure = key_figure
+        return kfv
+
     @property
     def key_figure_date(self) -> date:
         """The date the key figure is for."""
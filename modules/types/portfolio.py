@@ -8,5 +8,7 @@ from .base_entity import BaseEntityNamed
 class Portfolio(BaseEntityNamed):
     """Class representing a portfolio."""
 
+    __slots__ = ()
+
     def __init__(self, id_, name) -> None:
         super().__init__(id_, name)
@@ -14,6 +14,8 @@ class Position(BaseEntity):
     A position is comprised of a quantity in an instrument, on a given date.
     """
 
+    __slots__ = ("_portfolio", "_instrument", "_quantity", "_date_from", "_date_to")
+
     def __init__(self, id_: int) -> None:
         super().__init__(id_)
 
@@ -36,6 +38,27 @@ class Position(BaseEntity):
         pos.quantity = quantity
         return pos
 
+    @classmethod
+    def create_trusted(
+        cls,
+        id_: int,
+        portfolio: Portfolio,
+        instrument: Instrument,
+        date_from: date,
+        date_to: date,
+        quantity: float | int,
+        /,
+    ) -> "Position":
+        """Creates a position without validating the arguments, see BaseEntity."""
+        pos: Position = cls.__new__(cls)
+        pos._id = id_
+        pos._portfolio = portfolio
+        pos._instrument = instrument
+        pos._date_from = date_from
+        pos._date_to = date_to
+        pos._quantity = quantity
+        return pos
+
     @property
     def portfolio(self) -> Portfolio:
         """The portfolio of the position."""
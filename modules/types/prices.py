@@ -10,6 +10,8 @@ from .instruments import Instrument
 class Price(BaseEntity):
     """Type representing a price in the database."""
 
+    __slots__ = ("_price_date", "_instrument", "_price")
+
     def __init__(
         self, id_: int, instrument: Instrument, price_date: date, price: float | int
     ):
@@ -18,6 +20,18 @@ class Price(BaseEntity):
         self.instrument = instrument
         self.price = price
 
+    @classmethod
+    def create_trusted(
+        cls, id_: int, instrument: Instrument, price_date: date, price: float | int
+    ) -> "Price":
+        """Creates a price without validating the arguments, see BaseEntity."""
+        price_: Price = cls.__new__(cls)
+        price_._id = id_
+        price_._instrument = instrument
+        price_._price_date = price_date
+        price_._price = price
+        return price_
+
     @property
     def price_date(self) -> date:
         """The date the price is for."""
@@ -1,12 +1,72 @@
 """Contains various unit tests."""
 
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 from modules.helpers.dateutilities import last_business_day
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from modules.types.position import Position
-from modules.types.instruments import Equity
+from modules.types.instruments import Equity, Bond
 from modules.types.portfolio import Portfolio
-from modules.api.db.dbaccessor import db_accessor_factory, DbEngine
+from modules.types.key_figures import KeyFigureValue
+from modules.api.db.dbaccessor import (
+    db_accessor_factory,
+    configure_connection_pool,
+    DbEngine,
+    SQLiteConnectionPool,
+)
+from modules.api.db.risk_dbaccessor import RiskDbAccessor
+from modules.api.db.migrations import (
+    SCHEMA_MIGRATIONS,
+    apply_schema_migrations,
+    schema_version,
+)
+from modules.api.db.identity_map import IdentityMap
+from modules.api.db.price_store import PriceStore
+from modules.api.db.price_loader import PriceLoader
+from modules.api.db.position_index import PositionIndex
+from modules.risk.market_value_engine import MarketValueEngine, PricePolicy
+from modules.risk.risk_figure_generator import RiskFigureGenerator
+from modules.risk.riskreport import RiskReport, RiskReportSettings
+from modules.risk.key_figure_registry import (
+    KeyFigureNode,
+    CUMULATIVE_RETURNS,
+    default_key_figure_registry,
+)
+from modules.risk.batch_riskreport import BatchRiskReport
+from modules.risk.async_riskreport import AsyncRiskReport
+from modules.risk.report_server import RiskReportServer
+from modules.risk.end_of_day import EndOfDayUpdater, RollingKeyFigureState
+from modules.risk.covariance_engine import CovarianceRiskEngine
+from modules.api.db.async_risk_dbaccessor import AsyncRiskDbAccessor
+from modules.helpers.rolling import RollingStatistics
+from modules.helpers.trading_calendar import TradingCalendar, us_holidays
+from modules.helpers.instrumentation import MetricsCollector, statement_shape
+import asyncio
+import graphlib
+import json
+import math
+import random
+import sqlite3
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+
+class TemporaryDbTestCase(unittest.TestCase):
+    """Base class for unit tests running against a copy of the database."""
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self._tmp_dir.name, "alecta_case_db.db")
+        shutil.copyfile("./db/alecta_case_db.db", self.db_path)
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
 
 
 class DateUtilitiesTestCase(unittest.TestCase):
@@ -19,6 +79,56 @@ class DateUtilitiesTestCase(unittest.TestCase):
         self.assertEqual(date(2024, 6, 14), last_business_day(date(2024, 6, 16)))
         self.assertEqual(date(2024, 6, 14), last_business_day(date(2024, 6, 17)))
         self.assertEqual(date(2024, 6, 17), last_business_day(date(2024, 6, 18)))
+        calendar = TradingCalendar.for_market("SE")
+        self.assertEqual(
+            date(2024, 6, 20), last_business_day(date(2024, 6, 24), calendar)
+        )
+
+
+class TradingCalendarTestCase(unittest.TestCase):
+    """Contains unit tests for the TradingCalendar class."""
+
+    def test_holidays(self):
+        self.assertEqual(
+            {
+                date(2023, 1, 2),
+                date(2023, 1, 16),
+                date(2023, 2, 20),
+                date(2023, 4, 7),
+                date(2023, 5, 29),
+                date(2023, 6, 19),
+                date(2023, 7, 4),
+                date(2023, 9, 4),
+                date(2023, 11, 23),
+                date(2023, 12, 25),
+            },
+            us_holidays(2023),
+        )
+        calendar = TradingCalendar.for_market("SE")
+        for holiday in [date(2024, 3, 29), date(2024, 5, 9), date(2024, 6, 21)]:
+            self.assertFalse(calendar.is_business_day(holiday))
+        self.assertTrue(calendar.is_business_day(date(2024, 6, 20)))
+        self.assertAlmostEqual(251, calendar.days_per_year, delta=2)
+
+    def test_lookups(self):
+        calendar = TradingCalendar.for_market("SE", first_year=2024, last_year=2024)
+        self.assertEqual(
+            [date(2024, 3, 27), date(2024, 3, 28), date(2024, 4, 2)],
+            calendar.business_days(date(2024, 3, 27), date(2024, 4, 2)),
+        )
+        self.assertEqual(
+            date(2024, 3, 28), calendar.previous_business_day(date(2024, 4, 2))
+        )
+        self.assertEqual(
+            date(2024, 4, 2), calendar.next_business_day(date(2024, 3, 28))
+        )
+        self.assertEqual(date(2024, 3, 28), calendar.roll_backward(date(2024, 4, 1)))
+        self.assertEqual(date(2024, 4, 2), calendar.roll_forward(date(2024, 3, 29)))
+        self.assertEqual(date(2024, 3, 27), calendar.shift(date(2024, 4, 2), -2))
+        with self.assertRaises(ValueError):
+            calendar.shift(date(2024, 3, 30), 1)
+        with self.assertRaises(ValueError):
+            calendar.roll_backward(date(2025, 1, 1))
 
 
 class PositionTestCase(unittest.TestCase):
@@ -51,6 +161,22 @@ class PositionTestCase(unittest.TestCase):
         pos_2_mv = pos_2.market_value(78.0)
         self.assertEqual(pos_2_mv, 936)
 
+    def test_create_trusted(self):
+        instrument = Equity.create_trusted(2, "Volvo")
+        portfolio = Portfolio.create_trusted(1, "EQ_SWE")
+        args = (1, portfolio, instrument, date(2023, 12, 31), date(3000, 1, 1), 12)
+        pos_1 = Position.create(*args)
+        pos_2 = Position.create_trusted(*args)
+        self.assertEqual(pos_1, pos_2)
+        self.assertEqual("Volvo", pos_2.instrument.name)
+        self.assertEqual(pos_1.market_value(78.0), pos_2.market_value(78.0))
+        self.assertEqual(str(pos_1), str(pos_2))
+        self.assertFalse(hasattr(pos_2, "__dict__"))
+        with self.assertRaises(TypeError):
+            Position.create(1, portfolio, instrument, "2023-12-31", date(3000, 1, 1), 1)
+        with self.assertRaises(ValueError):
+            Portfolio(1, "")
+
 
 class DbAccessorTestCase(unittest.TestCase):
     """Contains unit tests for the DbAccessor class."""
@@ -61,5 +187,1572 @@ class DbAccessorTestCase(unittest.TestCase):
         db_accessor.close()
 
 
+class SQLiteConnectionPoolTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the SQLiteConnectionPool class."""
+
+    def test_session(self):
+        configure_connection_pool(self.db_path, pool_size=2)
+        db_accessor = db_accessor_factory(DbEngine.SQLITE, self.db_path)
+        with db_accessor:
+            connection = db_accessor.connection
+            with db_accessor:
+                self.assertIs(connection, db_accessor.connection)
+            self.assertTrue(db_accessor.is_open())
+            journal_mode = db_accessor.execute_select_query("pragma journal_mode;")
+            self.assertEqual([("delete",)], journal_mode)
+        self.assertFalse(db_accessor.is_open())
+        with db_accessor:
+            self.assertIs(connection, db_accessor.connection)
+
+    def test_new_database_journal_mode(self):
+        db_path = os.path.join(self._tmp_dir.name, "new.db")
+        db_accessor = db_accessor_factory(DbEngine.SQLITE, db_path)
+        with db_accessor:
+            journal_mode = db_accessor.execute_select_query("pragma journal_mode;")
+            self.assertEqual([("wal",)], journal_mode)
+
+    def test_pool_size(self):
+        pool = SQLiteConnectionPool(self.db_path, pool_size=1, pragmas={})
+        connection = pool.acquire()
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual([], acquired)
+        pool.release(connection)
+        thread.join()
+        self.assertEqual([connection], acquired)
+        pool.release(connection)
+        pool.close()
+
+
+
+class RiskDbAccessorTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the RiskDbAccessor class."""
+
+    def test_schema_migrations(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            self.assertEqual(
+                len(SCHEMA_MIGRATIONS), schema_version(db._db_accessor)
+            )
+            indexes = db._db_accessor.execute_select_query(
+                "select name from sqlite_master where type = 'index';"
+            )
+            self.assertIn(("U_Prices",), indexes)
+            self.assertIn(("I_Position",), indexes)
+
+    def test_failing_schema_migration(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            SCHEMA_MIGRATIONS.append(
+                ('create table "Migrated" ("id" INTEGER);', "select * from Missing;")
+            )
+            try:
+                with self.assertRaises(sqlite3.OperationalError):
+                    apply_schema_migrations(db._db_accessor)
+            finally:
+                SCHEMA_MIGRATIONS.pop()
+            # The failing migration is rolled back, including its schema version.
+            self.assertEqual(
+                len(SCHEMA_MIGRATIONS), schema_version(db._db_accessor)
+            )
+            self.assertEqual(
+                [],
+                db._db_accessor.execute_select_query(
+                    "select name from sqlite_master where name = 'Migrated';"
+                ),
+            )
+
+    def test_get_prices(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            volvo = db.get_instrument_from_name("Volvo")
+            prices = db.get_prices(
+                instrument=volvo, date_from=date(2024, 1, 1), date_to=date(2024, 1, 3)
+            )
+            self.assertEqual(
+                [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)],
+                [p.price_date for p in prices],
+            )
+            self.assertTrue(all(p.instrument == volvo for p in prices))
+            self.assertEqual(765, len(db.get_prices()))
+            prices = db.get_prices(date_from=date(2024, 5, 31))
+            self.assertEqual(5, len(prices))
+            self.assertEqual(
+                ["Nvidia", "Volvo"], [p.instrument.name for p in prices[:2]]
+            )
+
+
+    def test_get_positions(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            eq_us = db.get_portfolio_from_name("EQ_US")
+            positions = db.get_positions(
+                position_date=date(2024, 1, 1), portfolio=eq_us
+            )
+            self.assertEqual([1, 5], [p.id_ for p in positions])
+            self.assertEqual(
+                ["Nvidia", "Tesla"], [p.instrument.name for p in positions]
+            )
+            self.assertEqual([], db.get_positions(position_date=date(2023, 12, 30)))
+            self.assertEqual(5, len(db.get_positions(position_date=date(2023, 12, 31))))
+            position = db.get_position(3)
+            self.assertIsInstance(position.instrument, Bond)
+            self.assertEqual(6500.0, position.quantity)
+            self.assertIsNone(db.get_position(1000))
+
+    def test_upsert_key_figure_values(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            db.delete_key_figure_values()
+            portfolio = db.get_portfolio(1)
+            ref_type = db.get_key_figure_ref_type_from_name("Portfolio")
+            key_figure = db.get_key_figure_from_name("Market value")
+            values = [
+                KeyFigureValue(
+                    0, date(2024, 1, d), 1.0, ref_type, portfolio, key_figure
+                )
+                for d in range(1, 4)
+            ]
+            ids = db.upsert_key_figure_values(values)
+            self.assertEqual(3, len(set(ids)))
+            self.assertEqual(ids, [v.id_ for v in values])
+
+            values = [
+                KeyFigureValue(
+                    0, date(2024, 1, d), 2.0, ref_type, portfolio, key_figure
+                )
+                for d in range(3, 5)
+            ]
+            self.assertEqual(ids[2], db.upsert_key_figure_values(values)[0])
+            stored = {
+                v.key_figure_date.day: v.value for v in db.get_key_figure_values()
+            }
+            self.assertEqual({1: 1.0, 2: 1.0, 3: 2.0, 4: 2.0}, stored)
+
+    def test_iter_key_figure_values(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            db.delete_key_figure_values()
+            key_figure = db.get_key_figure_from_name("Market value")
+            entities = {
+                "Instrument": db.get_instrument(1),
+                "Position": db.get_position(3),
+                "Portfolio": db.get_portfolio(1),
+            }
+            values = [
+                KeyFigureValue(
+                    0,
+                    date(2024, 1, d),
+                    float(d),
+                    db.get_key_figure_ref_type_from_name(ref_type),
+                    entity,
+                    key_figure,
+                )
+                for ref_type, entity in entities.items()
+                for d in range(1, 6)
+            ]
+            db.upsert_key_figure_values(values)
+
+            self.assertEqual(
+                sorted((v.id_, v.reference_entity.id_) for v in values),
+                sorted(
+                    (v.id_, v.reference_entity.id_)
+                    for v in db.iter_key_figure_values(batch_size=2)
+                ),
+            )
+            position_values = list(
+                db.iter_key_figure_values(
+                    reference_entity=entities["Position"],
+                    date_from=date(2024, 1, 2),
+                    date_to=date(2024, 1, 3),
+                    batch_size=1,
+                )
+            )
+            self.assertEqual([2.0, 3.0], sorted(v.value for v in position_values))
+            for v in position_values:
+                self.assertIsInstance(v.reference_entity, Position)
+                self.assertEqual(3, v.reference_entity.id_)
+                self.assertEqual("Position", v.key_figure_ref_type.name)
+            self.assertEqual(
+                [], list(db.iter_key_figure_values(date_from=date(2024, 2, 1)))
+            )
+
+    def test_transaction_rollback(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            count = len(db.get_key_figure_values())
+            with self.assertRaises(RuntimeError):
+                with db._db_accessor.transaction():
+                    db.delete_key_figure_values()
+                    raise RuntimeError
+            self.assertEqual(count, len(db.get_key_figure_values()))
+
+    def test_nested_transaction_rollback(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            count = len(db.get_prices())
+            with db._db_accessor.transaction():
+                db.upsert_prices([(1, "2024-06-01", 1.0)])
+                try:
+                    with db._db_accessor.transaction():
+                        db.delete_key_figure_values()
+                        db.upsert_prices([(1, "2024-06-02", 1.0)])
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+            self.assertEqual(count + 1, len(db.get_prices()))
+            self.assertGreater(len(db.get_key_figure_values()), 0)
+
+    def test_reference_data_identity(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            instrument = db.get_instrument(1)
+            portfolio = db.get_portfolio_from_name("EQ_US")
+        with RiskDbAccessor(self.db_path) as other_db:
+            self.assertIsNot(instrument, other_db.get_instrument(1))
+        with db:
+            self.assertIs(instrument, db.get_instrument(1))
+            self.assertIs(instrument, db.get_instrument_from_name("Nvidia"))
+            self.assertIs(portfolio, db.get_portfolio(portfolio.id_))
+            self.assertIs(portfolio, db.get_positions(portfolio=portfolio)[0].portfolio)
+            db.invalidate_reference_data()
+            self.assertIs(instrument, db.get_instrument(1))
+            self.assertIsNone(db.get_instrument(1000))
+            self.assertEqual("Portfolio", db.get_key_figure_ref_type_from_id(3).name)
+
+
+class PositionIndexTestCase(unittest.TestCase):
+    """Contains unit tests for the PositionIndex class."""
+
+    def test_positions_on(self):
+        rng = random.Random(7)
+        portfolios = [Portfolio(1, "EQ_US"), Portfolio(2, "EQ_SWE")]
+        instruments = [Equity(1, "Nvidia"), Equity(2, "Volvo")]
+        start = date(2024, 1, 1)
+        positions = []
+        for id_ in range(1, 41):
+            date_from = start + timedelta(days=rng.randrange(60))
+            date_to = date_from + timedelta(days=rng.randrange(30))
+            positions.append(
+                Position.create(
+                    id_,
+                    rng.choice(portfolios),
+                    rng.choice(instruments),
+                    date_from,
+                    date_to,
+                    rng.randrange(-5, 10),
+                )
+            )
+        index = PositionIndex(reversed(positions))
+
+        for portfolio in portfolios:
+            held = [p for p in positions if p.portfolio == portfolio]
+            for offset in range(-1, 95):
+                date_ = start + timedelta(days=offset)
+                expected = [p for p in held if p.date_from <= date_ <= p.date_to]
+                self.assertEqual(expected, index.positions_on(portfolio, date_))
+
+            date_from, date_to = date(2024, 1, 20), date(2024, 2, 10)
+            self.assertEqual(
+                [p for p in held if p.date_from <= date_to and p.date_to >= date_from],
+                index.positions_overlapping(portfolio, date_from, date_to),
+            )
+            changes = list(index.iter_changes(portfolio, date_from, date_to))
+            self.assertEqual(
+                sorted(
+                    {p.date_from for p in held if date_from <= p.date_from <= date_to}
+                    | {
+                        p.date_to + timedelta(days=1)
+                        for p in held
+                        if date_from <= p.date_to + timedelta(days=1) <= date_to
+                    }
+                ),
+                [date_ for date_, _ in changes],
+            )
+
+            for range_ in [(date_from, date_to), (start - timedelta(days=1), date_to)]:
+                holdings = list(index.holdings(portfolio, *range_))
+                self.assertEqual(range_[0], holdings[0][0])
+                for date_, quantities in holdings:
+                    expected = {}
+                    for p in held:
+                        if p.date_from <= date_ <= p.date_to:
+                            id_ = p.instrument.id_
+                            expected[id_] = expected.get(id_, 0.0) + p.quantity
+                    self.assertEqual(expected, quantities)
+
+        self.assertEqual([], index.positions_on(Portfolio(3, "FI_US"), start))
+
+
+class HoldingSnapshotTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the holdings materialized in HoldingSnapshot."""
+
+    def assert_consistent(self, db):
+        self.assertEqual([], db.check_holding_snapshot())
+        index = PositionIndex.from_db(db)
+        for portfolio in db.get_portfolios():
+            expected = []
+            for date_, held in index.holdings(
+                portfolio, date(2024, 1, 1), date(2024, 5, 31)
+            ):
+                held = {i: q for i, q in held.items() if q != 0.0}
+                # Positions replacing each other do not change the holdings.
+                if len(expected) == 0 or expected[-1][1] != held:
+                    expected.append((date_, held))
+            self.assertEqual(
+                expected,
+                db.get_holdings(portfolio, date(2024, 1, 1), date(2024, 5, 31)),
+            )
+
+    def test_maintenance(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            self.assert_consistent(db)
+            for statement in [
+                "update Position set date_to = '2024-02-28' where id = 1;",
+                "insert into Position (date_from, date_to, portfolio_id, "
+                "instrument_id, quantity) "
+                "values ('2024-02-29', '3000-01-01', 1, 1, 40);",
+                "insert into Position (date_from, date_to, portfolio_id, "
+                "instrument_id, quantity) "
+                "values ('2024-03-10', '2024-03-20', 1, 5, 2.5);",
+                "update Position set quantity = 55 where id = 6;",
+                "update Position set portfolio_id = 2 where id = 7;",
+                "delete from Position where id = 7;",
+            ]:
+                db._db_accessor.execute_query(statement)
+                self.assert_consistent(db)
+            # The new position continues the old one, so the snapshot is unchanged.
+            self.assertEqual(
+                [(1, 1, "2023-12-31", 55.0), (1, 1, "3000-01-02", 0.0)],
+                db.get_holding_snapshot_rows(db.get_portfolio_from_name("EQ_US"))[:2],
+            )
+
+            db._db_accessor.execute_query(
+                "update HoldingSnapshot set quantity = 1 where portfolio_id = 2;"
+            )
+            self.assertEqual(
+                [(2, 2, "2023-12-31", 75.0, 1.0), (2, 2, "3000-01-02", 0.0, 1.0)],
+                db.check_holding_snapshot(),
+            )
+            db.rebuild_holding_snapshot()
+            self.assert_consistent(db)
+
+    def test_open_ended(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            for statement in [
+                "insert into Position (date_from, date_to, portfolio_id, "
+                "instrument_id, quantity) "
+                "values ('2024-03-01', '9999-12-31', 1, 5, 10);",
+                "update Position set quantity = 20 where date_to = '9999-12-31';",
+                "delete from Position where date_to = '9999-12-31';",
+            ]:
+                db._db_accessor.execute_query(statement)
+                self.assert_consistent(db)
+            db.rebuild_holding_snapshot()
+            self.assert_consistent(db)
+
+    def test_market_values(self):
+        db = RiskDbAccessor(self.db_path)
+        with db:
+            db._db_accessor.execute_query(
+                "update Position set date_to = '2024-03-15' where id = 5;"
+            )
+        rfg = RiskFigureGenerator(db)
+        snapshot_rfg = RiskFigureGenerator(db, holding_snapshot=True)
+        for name in ["EQ_US", "EQ_SWE", "FI_US", "FI_SWE"]:
+            expected = rfg.market_value_for_portfolio_and_date_range(
+                name, date(2024, 3, 1), date(2024, 3, 31)
+            )
+            for v, e in zip(
+                snapshot_rfg.market_value_for_portfolio_and_date_range(
+                    name, date(2024, 3, 1), date(2024, 3, 31)
+                ),
+                expected,
+            ):
+                self.assertEqual(e.key_figure_date, v.key_figure_date)
+                self.assertAlmostEqual(e.value, v.value)
+
+
+class PriceStoreTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the PriceStore class."""
+
+    def test_price(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            prices = db.get_prices()
+            store = PriceStore.from_db(db)
+        self.assertEqual(len(prices), len(store))
+        for price in prices[::50]:
+            self.assertEqual(
+                price.price, store.price(price.instrument.id_, price.price_date)
+            )
+        self.assertIsNone(store.price(prices[0].instrument.id_, date(1900, 1, 1)))
+        self.assertIsNone(store.price(-1, prices[0].price_date))
+
+    def test_snapshot(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            store = PriceStore.from_db(db)
+            instrument_ids = [i.id_ for i in db.get_instruments()]
+        path = os.path.join(self._tmp_dir.name, "prices.snapshot")
+        store.save(path)
+        with PriceStore.open(path) as mapped:
+            self.assertEqual(len(store), len(mapped))
+            expected = store.price_slice(
+                instrument_ids, date(2024, 2, 25), date(2024, 3, 5)
+            )
+            actual = mapped.price_slice(
+                instrument_ids, date(2024, 2, 25), date(2024, 3, 5)
+            )
+            self.assertEqual(len(instrument_ids) * 10, len(actual))
+            for x, y in zip(expected, actual):
+                self.assertTrue(x == y or (math.isnan(x) and math.isnan(y)))
+
+        with open(path, "rb") as file:
+            header = file.read(24)
+        self.assertEqual(len(store), int.from_bytes(header[16:], "little"))
+        with open(path, "r+b") as file:
+            file.truncate(os.path.getsize(path) - 8)
+        with self.assertRaises(ValueError):
+            PriceStore.open(path)
+
+    def test_market_values(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            store = PriceStore.from_db(db)
+            portfolio = db.get_portfolio_from_name("EQ_US")
+            expected = MarketValueEngine(db).market_values(
+                portfolio, date(2024, 1, 1), date(2024, 3, 31)
+            )
+            actual = MarketValueEngine(db, store).market_values(
+                portfolio, date(2024, 1, 1), date(2024, 3, 31)
+            )
+        self.assertEqual(expected, actual)
+
+
+class PriceLoaderTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the PriceLoader class."""
+
+    def _write_prices(self, rows):
+        path = os.path.join(self._tmp_dir.name, "prices.csv")
+        with open(path, "w") as file:
+            file.write("id,instrument_id,date,price\n")
+            file.writelines(",".join(str(x) for x in row) + "\n" for row in rows)
+        return path
+
+    def test_load(self):
+        path = self._write_prices(
+            [
+                (1, 1, "2024-01-01", 1.5),
+                (2, 1, "2024-06-03", 2.5),
+                (3, 1, "2024-06-03", 3.5),
+                (4, 2, "2024-06-03", 4.5),
+            ]
+        )
+        for rebuild_index in [False, True]:
+            with self.subTest(rebuild_index=rebuild_index):
+                shutil.copyfile("./db/alecta_case_db.db", self.db_path)
+                db = RiskDbAccessor(self.db_path)
+                result = PriceLoader(db, chunk_size=2).load(
+                    path, rebuild_index=rebuild_index
+                )
+                self.assertEqual(4, result.rows)
+                self.assertEqual(0, result.rejected)
+                with db:
+                    rows = db.get_price_rows(date_from=date(2024, 6, 3))
+                    self.assertEqual(
+                        [(1, "2024-06-03", 3.5), (2, "2024-06-03", 4.5)],
+                        [row[1:] for row in rows],
+                    )
+                    price = db.get_prices(
+                        instrument=db.get_instrument(1),
+                        date_from=date(2024, 1, 1),
+                        date_to=date(2024, 1, 1),
+                    )[0]
+                    self.assertEqual(1.5, price.price)
+                    self.assertEqual(767, len(db.get_price_rows()))
+
+    def test_change_tracking(self):
+        path = self._write_prices(
+            [
+                (1, 1, "2024-06-04", 1.5),
+                (2, 1, "2024-06-03", 2.5),
+                (3, 2, "2024-06-05", 1),
+            ]
+        )
+        query = "select ref_entity_id, date, version from ChangeLog;"
+        for rebuild_index in [False, True]:
+            with self.subTest(rebuild_index=rebuild_index):
+                shutil.copyfile("./db/alecta_case_db.db", self.db_path)
+                db = RiskDbAccessor(self.db_path)
+                with db:
+                    watermark = db.get_database_watermark()
+                    log = set(db._db_accessor.execute_select_query(query))
+                PriceLoader(db).load(path, rebuild_index=rebuild_index)
+                with db:
+                    self.assertEqual(watermark + 1, db.get_database_watermark())
+                    version = watermark + 1
+                    self.assertEqual(
+                        {(1, "2024-06-03", version), (2, "2024-06-05", version)},
+                        set(db._db_accessor.execute_select_query(query)) - log,
+                    )
+                PriceLoader(db).load(path, rebuild_index=rebuild_index)
+                with db:
+                    self.assertEqual(watermark + 1, db.get_database_watermark())
+
+    def test_invalid_rows(self):
+        path = self._write_prices(
+            [(1, 1, "2024-06-03", 1.5), (2, -1, "2024-06-03", 1.5), (3, 1, "x", 1)]
+        )
+        db = RiskDbAccessor(self.db_path)
+        with self.assertRaises(ValueError):
+            PriceLoader(db).load(path)
+        result = PriceLoader(db, skip_invalid=True).load(path)
+        self.assertEqual((3, 1, 2), (result.rows, result.loaded, result.rejected))
+
+
+class MarketValueEngineTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the MarketValueEngine class."""
+
+    def test_market_values(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            engine = MarketValueEngine(db)
+            for portfolio in db.get_portfolios():
+                dates, market_values = engine.market_values(
+                    portfolio, date(2024, 2, 27), date(2024, 3, 2)
+                )
+                self.assertEqual(5, len(dates))
+                for date_, market_value in zip(dates, market_values):
+                    expected = sum(
+                        pos.market_value(
+                            db.get_prices(
+                                instrument=pos.instrument,
+                                date_from=date_,
+                                date_to=date_,
+                            )[0].price
+                        )
+                        for pos in db.get_positions(
+                            position_date=date_, portfolio=portfolio
+                        )
+                    )
+                    self.assertEqual(expected, market_value)
+
+    def test_position_changes(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            db._db_accessor.execute_query(
+                "update Position set date_to = '2024-02-28' where id = 1;"
+            )
+            db._db_accessor.execute_query(
+                "insert into Position (date_from, date_to, portfolio_id, "
+                "instrument_id, quantity) values ('2024-02-29', '2024-03-01', 1, 1, 20)"
+            )
+            portfolio = db.get_portfolio_from_name("EQ_US")
+            expected = []
+            for offset in range(5):
+                date_ = date(2024, 2, 27) + timedelta(days=offset)
+                expected.append(
+                    sum(
+                        pos.market_value(
+                            db.get_prices(
+                                instrument=pos.instrument,
+                                date_from=date_,
+                                date_to=date_,
+                            )[0].price
+                        )
+                        for pos in db.get_positions(
+                            position_date=date_, portfolio=portfolio
+                        )
+                    )
+                )
+            for cache_positions in [False, True]:
+                engine = MarketValueEngine(db, cache_positions=cache_positions)
+                _, market_values = engine.market_values(
+                    portfolio, date(2024, 2, 27), date(2024, 3, 2)
+                )
+                self.assertEqual(expected, list(market_values))
+            positions = engine.get_positions(
+                portfolio, date(2024, 2, 27), date(2024, 3, 2)
+            )
+            self.assertEqual([1, 5, 6], [pos.id_ for pos in positions])
+
+    def test_missing_price(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            engine = MarketValueEngine(db)
+            portfolio = db.get_portfolio_from_name("EQ_SWE")
+            with self.assertRaises(ValueError):
+                engine.market_values(portfolio, date(2024, 5, 31), date(2024, 6, 1))
+            dates, market_values = engine.market_values(
+                portfolio, date(2023, 12, 29), date(2023, 12, 30)
+            )
+            self.assertEqual([0.0, 0.0], list(market_values))
+
+
+class RiskFigureGeneratorTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the RiskFigureGenerator class."""
+
+    def setUp(self):
+        super().setUp()
+        self.rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+
+    def test_volatility_3M_ann(self):
+        date_ = date(2024, 5, 31)
+        vol = self.rfg.volatility_3M_ann_for_portfolio_and_date("EQ_US", date_)
+        returns = self.rfg.return_1D_for_portfolio_and_date_range(
+            "EQ_US", date_ - timedelta(days=89), date_
+        )
+        expected = statistics.stdev([math.log(1 + r.value) for r in returns])
+        self.assertAlmostEqual(expected * math.sqrt(365), vol.value, places=12)
+
+    def test_volatility_3M_ann_range(self):
+        date_from, date_to = date(2024, 5, 1), date(2024, 5, 31)
+        vols = self.rfg.volatility_3M_ann_for_portfolio_and_date_range(
+            "FI_SWE", date_from, date_to
+        )
+        self.assertEqual(31, len(vols))
+        for vol in vols[::10]:
+            expected = self.rfg.volatility_3M_ann_for_portfolio_and_date(
+                "FI_SWE", vol.key_figure_date
+            )
+            self.assertAlmostEqual(expected.value, vol.value, places=12)
+
+    def test_return_1D_cumulative_series(self):
+        date_from, date_to = date(2024, 1, 1), date(2024, 3, 31)
+        series = self.rfg.return_1D_cumulative_series("EQ_SWE", date_from, date_to)
+        returns = self.rfg.return_1D_for_portfolio_and_date_range(
+            "EQ_SWE", date_from, date_to
+        )
+        self.assertEqual([r.key_figure_date for r in returns], [t[0] for t in series])
+        cumulative_return = 0.0
+        for ret, (_, value) in zip(returns, series):
+            cumulative_return = (1 + cumulative_return) * (1 + ret.value) - 1.0
+            self.assertAlmostEqual(cumulative_return, value, places=12)
+
+    def test_read_through(self):
+        computed = []
+
+        class CountingRiskFigureGenerator(RiskFigureGenerator):
+            def _compute_market_values(self, db, portfolio, date_from, date_to):
+                computed.append((date_from, date_to))
+                return super()._compute_market_values(
+                    db, portfolio, date_from, date_to
+                )
+
+        with RiskDbAccessor(self.db_path) as db:
+            db.delete_key_figure_values()
+        rfg = CountingRiskFigureGenerator(
+            RiskDbAccessor(self.db_path), read_through=True
+        )
+        # Not stored, so that the read-through generator computes the values.
+        expected = RiskFigureGenerator(
+            RiskDbAccessor(self.db_path), key_figure_value_writer=lambda values: None
+        ).market_value_for_portfolio_and_date_range(
+            "EQ_SWE", date(2024, 3, 1), date(2024, 3, 31)
+        )
+        mvs = rfg.market_value_for_portfolio_and_date_range(
+            "EQ_SWE", date(2024, 3, 1), date(2024, 3, 31)
+        )
+        self.assertEqual([v.value for v in expected], [v.value for v in mvs])
+        mvs = rfg.market_value_for_portfolio_and_date_range(
+            "EQ_SWE", date(2024, 3, 10), date(2024, 4, 2)
+        )
+        self.assertEqual(24, len(mvs))
+        rfg.return_1D_for_portfolio_and_date_range(
+            "EQ_SWE", date(2024, 3, 2), date(2024, 3, 31)
+        )
+        self.assertEqual(
+            [
+                (date(2024, 3, 1), date(2024, 3, 31)),
+                (date(2024, 4, 1), date(2024, 4, 2)),
+            ],
+            computed,
+        )
+
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            db._db_accessor.execute_query(
+                "update Prices set price = price * 2 where instrument_id = 2;"
+            )
+        mv = rfg.market_value_for_portfolio_and_date("EQ_SWE", date(2024, 3, 15))
+        self.assertEqual((date(2024, 3, 15), date(2024, 3, 15)), computed[-1])
+        self.assertAlmostEqual(2 * expected[14].value, mv.value)
+
+    def test_first_validation(self):
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            portfolio = db.get_portfolio_from_name("EQ_SWE")
+            key_figure = db.get_key_figure_from_name("Market value")
+            ref_type = db.get_key_figure_ref_type_from_name("Portfolio")
+            date_from, date_to = date(2024, 3, 1), date(2024, 3, 31)
+            stored = db.get_key_figure_values_for_range(
+                key_figure, ref_type, portfolio, date_from, date_to
+            )
+            self.assertEqual(31, len(stored))
+            self.assertIsNone(db.get_key_figure_settings(portfolio))
+
+            # Values stored before the first validation are kept.
+            rfg = RiskFigureGenerator(db)
+            rfg.market_value_for_portfolio_and_date("EQ_SWE", date(2024, 3, 1))
+            self.assertEqual(rfg.settings_key, db.get_key_figure_settings(portfolio))
+            self.assertEqual(
+                [v.value for v in stored],
+                [
+                    v.value
+                    for v in db.get_key_figure_values_for_range(
+                        key_figure, ref_type, portfolio, date_from, date_to
+                    )
+                ],
+            )
+
+            # Values computed with other settings are deleted, even if not reused.
+            rfg = RiskFigureGenerator(db, calendar=TradingCalendar.for_market("SE"))
+            rfg.market_value_for_portfolio_and_date("EQ_SWE", date(2024, 3, 1))
+            self.assertEqual(rfg.settings_key, db.get_key_figure_settings(portfolio))
+            stored = db.get_key_figure_values_for_range(
+                key_figure, ref_type, portfolio, date_from, date_to
+            )
+            self.assertEqual([date(2024, 3, 1)], [v.key_figure_date for v in stored])
+
+    def test_read_through_changed_from(self):
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path), read_through=True)
+        rfg.market_value_for_portfolio_and_date_range(
+            "EQ_SWE", date(2024, 3, 1), date(2024, 3, 31)
+        )
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            portfolio = db.get_portfolio_from_name("EQ_SWE")
+            key_figure = db.get_key_figure_from_name("Market value")
+            ref_type = db.get_key_figure_ref_type_from_name("Portfolio")
+            db._db_accessor.execute_query(
+                "insert into Prices (instrument_id, date, price) "
+                "values (2, '2024-06-01', 1.0);"
+            )
+            self.assertEqual(
+                date(2024, 6, 1), db.get_portfolio_changed_from(portfolio, 0)
+            )
+            self.assertTrue(
+                db.validate_key_figure_values(portfolio, rfg.settings_key)
+            )
+            self.assertFalse(
+                db.validate_key_figure_values(portfolio, rfg.settings_key)
+            )
+            stored = db.get_key_figure_values_for_range(
+                key_figure, ref_type, portfolio, date(2024, 3, 1), date(2024, 3, 31)
+            )
+            self.assertEqual(31, len(stored))
+
+            db._db_accessor.execute_query(
+                "update Prices set price = price * 2 "
+                "where instrument_id = 2 and date = '2024-03-15';"
+            )
+            db.validate_key_figure_values(portfolio, rfg.settings_key)
+            stored = db.get_key_figure_values_for_range(
+                key_figure, ref_type, portfolio, date(2024, 3, 1), date(2024, 3, 31)
+            )
+            self.assertEqual(date(2024, 3, 14), stored[-1].key_figure_date)
+
+    def test_read_through_settings(self):
+        date_from, date_to = date(2024, 5, 1), date(2024, 5, 31)
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path), read_through=True)
+        all_days = rfg.volatility_3M_ann_for_portfolio_and_date_range(
+            "EQ_US", date_from, date_to
+        )
+        calendar = TradingCalendar.for_market("US")
+        rfg = RiskFigureGenerator(
+            RiskDbAccessor(self.db_path), read_through=True, calendar=calendar
+        )
+        business_days = rfg.volatility_3M_ann_for_portfolio_and_date_range(
+            "EQ_US", date_from, date_to
+        )
+        expected = RiskFigureGenerator(
+            RiskDbAccessor(self.db_path), calendar=calendar
+        ).volatility_3M_ann_for_portfolio_and_date_range("EQ_US", date_from, date_to)
+        self.assertEqual(
+            [v.value for v in expected], [v.value for v in business_days]
+        )
+        self.assertNotEqual(all_days[1].value, business_days[0].value)
+
+
+class TradingCalendarRiskFigureTestCase(TemporaryDbTestCase):
+    """Contains unit tests for risk figures computed for the business days of a calendar."""
+
+    def test_business_days(self):
+        calendar = TradingCalendar.for_market("SE")
+        db = RiskDbAccessor(self.db_path)
+        rfg = RiskFigureGenerator(db, calendar=calendar)
+        date_from, date_to = date(2024, 3, 1), date(2024, 5, 31)
+        market_values = rfg.market_value_for_portfolio_and_date_range(
+            "EQ_SWE", date_from, date_to
+        )
+        self.assertEqual(
+            calendar.business_days(date_from, date_to),
+            [v.key_figure_date for v in market_values],
+        )
+        with db:
+            price_store = PriceStore.from_db(db)
+        self.assertEqual(
+            {v.key_figure_date: v.value for v in market_values},
+            {
+                v.key_figure_date: v.value
+                for v in RiskFigureGenerator(
+                    db, calendar=calendar, price_store=price_store
+                ).market_value_for_portfolio_and_date_range(
+                    "EQ_SWE", date_from, date_to
+                )
+            },
+        )
+
+        # The return of the Tuesday after Easter is from the Thursday before.
+        by_date = {v.key_figure_date: v.value for v in market_values}
+        self.assertAlmostEqual(
+            by_date[date(2024, 4, 2)] / by_date[date(2024, 3, 28)] - 1.0,
+            rfg.return_1D_for_portfolio_and_date("EQ_SWE", date(2024, 4, 2)).value,
+        )
+        # Weekends and holidays have the figures of the business day before.
+        self.assertEqual(
+            date(2024, 3, 28),
+            rfg.market_value_for_portfolio_and_date(
+                "EQ_SWE", date(2024, 4, 1)
+            ).key_figure_date,
+        )
+
+        window = rfg.volatility_window
+        self.assertEqual(62, window)
+        returns = rfg.return_1D_for_portfolio_and_date_range(
+            "EQ_SWE", calendar.shift(date_to, 1 - window), date_to
+        )
+        self.assertEqual(window, len(returns))
+        self.assertAlmostEqual(
+            statistics.stdev(math.log(1 + r.value) for r in returns)
+            * math.sqrt(calendar.days_per_year),
+            rfg.volatility_3M_ann_for_portfolio_and_date("EQ_SWE", date_to).value,
+        )
+
+
+class PricePolicyTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the handling of missing prices."""
+
+    def setUp(self):
+        super().setUp()
+        with RiskDbAccessor(self.db_path) as db:
+            # Nvidia (EQ_US) has no prices for 2024-03-30 - 04-01 and 2024-04-10.
+            db._db_accessor.execute_query(
+                "delete from Prices where instrument_id = 1 and (date in "
+                "('2024-03-30', '2024-03-31', '2024-04-01', '2024-04-10'));"
+            )
+            self.prices = {
+                (p.instrument.id_, p.price_date): p.price
+                for p in db.get_prices(date_from=date(2024, 3, 29))
+            }
+            self.price_store = PriceStore.from_db(db)
+
+    def rfg(self, policy, **kwargs):
+        return RiskFigureGenerator(
+            RiskDbAccessor(self.db_path), price_policy=policy, **kwargs
+        )
+
+    def test_strict(self):
+        with self.assertRaises(ValueError):
+            self.rfg(PricePolicy.STRICT).market_value_for_portfolio_and_date(
+                "EQ_US", date(2024, 4, 10)
+            )
+
+    def test_forward_fill(self):
+        date_from, date_to = date(2024, 4, 1), date(2024, 4, 12)
+        for price_store in [None, self.price_store]:
+            with self.subTest(price_store=price_store):
+                rfg = self.rfg(PricePolicy.FORWARD_FILL, price_store=price_store)
+                values = rfg.market_value_for_portfolio_and_date_range(
+                    "EQ_US", date_from, date_to
+                )
+                self.assertEqual(12, len(values))
+                self.assertGreater(values[0].value, 0.0)
+                resolution = rfg.price_resolution_for_portfolio_and_date_range(
+                    "EQ_US", date_from, date_to
+                )
+                self.assertEqual(
+                    [
+                        (date(2024, 4, 1), "Nvidia", date(2024, 3, 29)),
+                        (date(2024, 4, 10), "Nvidia", date(2024, 4, 9)),
+                    ],
+                    [(d, i.name, p) for d, i, p in resolution.filled],
+                )
+
+        expected = self.rfg(PricePolicy.STRICT).market_value_for_portfolio_and_date(
+            "EQ_US", date(2024, 4, 9)
+        ).value
+        # Only the price of Tesla changes from 2024-04-09 to 2024-04-10.
+        tesla = self.prices[(5, date(2024, 4, 10))] - self.prices[(5, date(2024, 4, 9))]
+        with RiskDbAccessor(self.db_path) as db:
+            quantity = db.get_position(5).quantity
+        self.assertAlmostEqual(
+            expected + tesla * quantity,
+            self.rfg(PricePolicy.FORWARD_FILL)
+            .market_value_for_portfolio_and_date("EQ_US", date(2024, 4, 10))
+            .value,
+        )
+        rfg = self.rfg(PricePolicy.FORWARD_FILL, max_staleness=2)
+        with self.assertRaises(ValueError):
+            rfg.market_value_for_portfolio_and_date("EQ_US", date(2024, 4, 1))
+
+    def test_skip(self):
+        rfg = self.rfg(PricePolicy.SKIP)
+        values = rfg.market_value_for_portfolio_and_date_range(
+            "EQ_US", date(2024, 4, 8), date(2024, 4, 12)
+        )
+        self.assertEqual(
+            [date(2024, 4, d) for d in [8, 9, 11, 12]],
+            [v.key_figure_date for v in values],
+        )
+        self.assertAlmostEqual(
+            values[2].value / values[1].value - 1.0,
+            rfg.return_1D_for_portfolio_and_date("EQ_US", date(2024, 4, 11)).value,
+        )
+        with self.assertRaises(ValueError):
+            rfg.market_value_for_portfolio_and_date("EQ_US", date(2024, 4, 10))
+        self.assertEqual(
+            [date(2024, 4, 10)],
+            rfg.price_resolution_for_portfolio_and_date_range(
+                "EQ_US", date(2024, 4, 8), date(2024, 4, 12)
+            ).skipped_dates,
+        )
+
+    def test_read_through(self):
+        date_from, date_to = date(2024, 4, 8), date(2024, 4, 12)
+        self.rfg(
+            PricePolicy.FORWARD_FILL, read_through=True
+        ).market_value_for_portfolio_and_date_range("EQ_US", date_from, date_to)
+        # Values filled with stale prices are not reused by other policies.
+        values = self.rfg(
+            PricePolicy.SKIP, read_through=True
+        ).market_value_for_portfolio_and_date_range("EQ_US", date_from, date_to)
+        self.assertNotIn(date(2024, 4, 10), [v.key_figure_date for v in values])
+        with self.assertRaises(ValueError):
+            self.rfg(
+                PricePolicy.STRICT, read_through=True
+            ).market_value_for_portfolio_and_date("EQ_US", date(2024, 4, 10))
+
+
+class RiskReportTestCase(TemporaryDbTestCase):
+    """Contains unit tests comparing RiskReport with the original implementation."""
+
+    key_figures = ["Market value", "Return (1D)", "Volatility (3M, ann.)"]
+
+    # The key figures of date_to and two cumulative returns of the report of every
+    # portfolio for [2024-01-01, 2024-05-31], as computed by the original
+    # implementation. The figures are not bit-identical: e.g. the volatilities,
+    # now computed with rolling statistics, differ in the last digits.
+    baseline = {
+        "EQ_US": (
+            (5272.860702939999, -0.0017940196783815532, 0.18257839031594889),
+            {
+                "2024-02-20": -0.019016469900000388,
+                "2024-05-31": -0.09088608570000012,
+            },
+        ),
+        "EQ_SWE": (
+            (6720.7401765, -0.014494433767839321, 0.20471088864334747),
+            {
+                "2024-02-20": -0.0827015628000003,
+                "2024-05-31": -0.10390130979999923,
+            },
+        ),
+        "FI_US": (
+            (6481.887788999999, 0.0015703497413179779, 0.01987396262658862),
+            {
+                "2024-02-20": -0.002386329699999745,
+                "2024-05-31": -0.0027864940000000837,
+            },
+        ),
+        "FI_SWE": (
+            (6468.262778900001, -0.0005711770213431278, 0.01928394655825845),
+            {
+                "2024-02-20": 0.008846275999999431,
+                "2024-05-31": -0.004882649399999606,
+            },
+        ),
+    }
+
+    def test_baseline(self):
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        for name, (key_figures, cumulative_returns) in self.baseline.items():
+            report = RiskReport(
+                RiskReportSettings(
+                    name, date(2024, 1, 1), date(2024, 5, 31), self.key_figures
+                ),
+                risk_figure_generator=rfg,
+            ).generate()
+            self.assertEqual(152, len(report["cumulative_returns"]))
+            actual = dict(report["cumulative_returns"])
+            for expected, value in [
+                *zip(key_figures, report["key_figures"].values()),
+                *[(v, actual[d]) for d, v in cumulative_returns.items()],
+            ]:
+                self.assertTrue(
+                    math.isclose(expected, value, rel_tol=1e-12), (name, value)
+                )
+
+
+class KeyFigureRegistryTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the KeyFigureRegistry class and its use by RiskReport."""
+
+    key_figures = ["Market value", "Return (1D)", "Volatility (3M, ann.)"]
+
+    def test_generate(self):
+        settings = RiskReportSettings(
+            "EQ_US", date(2024, 4, 1), date(2024, 4, 30), self.key_figures
+        )
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        sink = MetricsCollector()
+        report = RiskReport(
+            settings, risk_figure_generator=rfg, metrics_sink=sink
+        ).generate()
+
+        date_ = date(2024, 4, 30)
+        self.assertEqual(
+            {
+                "Market value": rfg.market_value_for_portfolio_and_date(
+                    "EQ_US", date_
+                ).value,
+                "Return (1D)": rfg.return_1D_for_portfolio_and_date(
+                    "EQ_US", date_
+                ).value,
+                "Volatility (3M, ann.)": (
+                    rfg.volatility_3M_ann_for_portfolio_and_date("EQ_US", date_).value
+                ),
+            },
+            report["key_figures"],
+        )
+        self.assertEqual(
+            [
+                (d.isoformat(), v)
+                for d, v in rfg.return_1D_cumulative_series(
+                    "EQ_US", settings.date_from, date_
+                )
+            ],
+            report["cumulative_returns"],
+        )
+
+        # Every series is computed once, for the union of the dates needed.
+        timings = sink.to_dict()["timings"]
+        for method in [
+            "market_value_for_portfolio_and_date_range",
+            "return_1D_from_market_values",
+            "volatility_3M_ann_from_returns",
+        ]:
+            self.assertEqual(1, timings[f"RiskFigureGenerator.{method}"]["count"])
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(
+                report,
+                RiskReport(
+                    settings, risk_figure_generator=rfg, executor=executor
+                ).generate(),
+            )
+
+    def test_register(self):
+        registry = default_key_figure_registry()
+        registry.register(
+            KeyFigureNode(
+                "Return (since start)",
+                lambda context, date_from, cumulative: cumulative[-1][1],
+                [CUMULATIVE_RETURNS],
+                series=True,
+            )
+        )
+        self.assertIn("Return (since start)", registry.key_figures)
+        self.assertNotIn(CUMULATIVE_RETURNS, registry.key_figures)
+        with self.assertRaises(ValueError):
+            registry.register(KeyFigureNode("Market value", lambda context: 0.0))
+
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        settings = RiskReportSettings(
+            "EQ_SWE", date(2024, 4, 1), date(2024, 4, 30), ["Return (since start)"]
+        )
+        report = RiskReport(
+            settings, risk_figure_generator=rfg, registry=registry
+        ).generate()
+        self.assertEqual(
+            report["cumulative_returns"][-1][1],
+            report["key_figures"]["Return (since start)"],
+        )
+
+        for key_figure in ["Unknown", CUMULATIVE_RETURNS]:
+            settings.key_figures = [key_figure]
+            with self.assertRaises(ValueError):
+                RiskReport(settings, risk_figure_generator=rfg).generate()
+
+        registry.register(KeyFigureNode("A", lambda context, date_from, b: b, ["B"]))
+        registry.register(KeyFigureNode("B", lambda context, date_from, a: a, ["A"]))
+        settings.key_figures = ["A"]
+        with self.assertRaises(graphlib.CycleError):
+            RiskReport(
+                settings, risk_figure_generator=rfg, registry=registry
+            ).generate()
+
+
+class InstrumentationTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the instrumentation of statements and methods."""
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            "select * from T where id in (?...) and x = ?;",
+            statement_shape("select *\n  from T where id in (?, ?,?) and x = ?;"),
+        )
+
+    def test_diagnostics(self):
+        settings = RiskReportSettings(
+            "EQ_US", date(2024, 4, 1), date(2024, 4, 30), ["Market value"]
+        )
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        sink = MetricsCollector()
+        report = RiskReport(
+            settings, risk_figure_generator=rfg, diagnostics=True, metrics_sink=sink
+        ).generate()
+        self.assertEqual(sink.to_dict(), report.pop("diagnostics"))
+        self.assertEqual(
+            report, RiskReport(settings, risk_figure_generator=rfg).generate()
+        )
+
+        diagnostics = sink.to_dict()
+        self.assertGreater(diagnostics["queries"], 0)
+        self.assertEqual(
+            diagnostics["queries"], sum(s["count"] for s in diagnostics["statements"])
+        )
+        timings = diagnostics["timings"]
+        self.assertEqual(1, timings["RiskReport.generate"]["count"])
+        for method in [
+            "market_value_for_portfolio_and_date_range",
+            "iter_return_1D_cumulative_from_market_values",
+        ]:
+            self.assertEqual(1, timings[f"RiskFigureGenerator.{method}"]["count"])
+        self.assertIsNone(rfg.metrics)
+        self.assertIsNone(rfg.session().metrics)
+
+
+class AsyncRiskReportTestCase(TemporaryDbTestCase, unittest.IsolatedAsyncioTestCase):
+    """Contains unit tests for the AsyncRiskReport class."""
+
+    async def test_generate(self):
+        key_figures = ["Market value", "Return (1D)", "Volatility (3M, ann.)"]
+        settings = [
+            RiskReportSettings(name, date(2024, 4, 1), date(2024, 4, 30), key_figures)
+            for name in ["EQ_US", "EQ_SWE", "FI_US", "FI_SWE"]
+        ]
+        db = AsyncRiskDbAccessor(RiskDbAccessor(self.db_path), max_workers=2)
+        async with AsyncRiskReport(db, max_pending=2) as service:
+            portfolio = await db.get_portfolio_from_name("EQ_US")
+            self.assertEqual(2, len(await db.get_positions(portfolio=portfolio)))
+
+            reports = await asyncio.gather(
+                *[service.generate(s) for s in settings for _ in range(5)]
+            )
+            self.assertEqual(0, service.in_flight)
+            self.assertGreater(service.coalesced_count, 0)
+            # The reports share the reference data of the accessor, nothing else.
+            self.assertTrue(db.risk_db_accessor.identity_map.is_loaded(Portfolio))
+            self.assertIsNone(db.risk_db_accessor.metrics)
+
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        for i, s in enumerate(settings):
+            expected = RiskReport(s, risk_figure_generator=rfg).generate()
+            for report in reports[5 * i : 5 * i + 5]:
+                self.assertEqual(expected, report)
+
+
+class RiskReportServerTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the RiskReportServer class."""
+
+    def get(self, path):
+        url = f"http://127.0.0.1:{self.server.port}{path}"
+        with urllib.request.urlopen(url) as response:
+            return json.loads(response.read())
+
+    def test_server(self):
+        self.server = RiskReportServer(
+            port=0,
+            risk_db_accessor=RiskDbAccessor(self.db_path),
+            watermark_check_interval=0.0,
+        )
+        self.server.warm_up()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            while self.server.port == 0:
+                time.sleep(0.01)
+            path = "/report?portfolio=EQ_US&date_from=2024-04-01&date_to=2024-04-30"
+            report = self.get(path)
+            self.assertEqual(report, self.get(path))
+            expected = RiskReport(
+                RiskReportSettings(
+                    "EQ_US",
+                    date(2024, 4, 1),
+                    date(2024, 4, 30),
+                    RiskReportServer.DEFAULT_KEY_FIGURES,
+                ),
+                risk_figure_generator=RiskFigureGenerator(RiskDbAccessor(self.db_path)),
+            ).generate()
+            self.assertEqual(json.loads(json.dumps(expected)), report)
+            self.assertEqual(1, self.get("/metrics")["cache"]["hits"])
+
+            # A changed price invalidates the cached report.
+            with RiskDbAccessor(self.db_path) as db:
+                db._db_accessor.execute_query(
+                    "update Prices set price = price * 2 where instrument_id in (1, 5);"
+                )
+            changed = self.get(path)
+            self.assertNotEqual(report, changed)
+            self.assertAlmostEqual(
+                2 * report["key_figures"]["Market value"],
+                changed["key_figures"]["Market value"],
+            )
+            metrics = self.get("/metrics")
+            self.assertEqual(1, metrics["cache"]["invalidations"])
+            self.assertEqual(2, metrics["latencies"]["generate"]["count"])
+
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get("/report?portfolio=EQ_US")
+            self.assertEqual(400, context.exception.code)
+        finally:
+            self.server.shutdown()
+            thread.join()
+
+    def test_report_generators(self):
+        db = RiskDbAccessor(self.db_path)
+        server = RiskReportServer(risk_db_accessor=db)
+        server.warm_up()
+        rfg = server._create_risk_figure_generator()
+        other = server._create_risk_figure_generator()
+        self.assertIsNot(rfg.session(), other.session())
+        self.assertIs(db.identity_map, rfg.session().identity_map)
+        self.assertIs(db.identity_map, other.session().identity_map)
+        self.assertIsNotNone(rfg.price_store)
+        self.assertIs(rfg.price_store, other.price_store)
+        self.assertIsNotNone(rfg.position_index)
+        self.assertIs(rfg.position_index, other.position_index)
+
+
+class EndOfDayUpdaterTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the EndOfDayUpdater class."""
+
+    def test_advance(self):
+        db = RiskDbAccessor(self.db_path)
+        updater = EndOfDayUpdater(db)
+        self.assertEqual(3, len(updater.initialize("EQ_US", date(2024, 4, 1))))
+        values = updater.advance("EQ_US", date(2024, 4, 30))
+        self.assertEqual(3 * 29, len(values))
+        self.assertEqual([], updater.advance("EQ_US", date(2024, 4, 30)))
+
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        date_from, date_to = date(2024, 4, 1), date(2024, 4, 30)
+        expected = {
+            (v.key_figure.name, v.key_figure_date): v.value
+            for v in [
+                *rfg.market_value_for_portfolio_and_date_range(
+                    "EQ_US", date_from, date_to
+                ),
+                *rfg.return_1D_for_portfolio_and_date_range(
+                    "EQ_US", date_from, date_to
+                ),
+                *rfg.volatility_3M_ann_for_portfolio_and_date_range(
+                    "EQ_US", date_from, date_to
+                ),
+            ]
+        }
+        for v in values:
+            self.assertAlmostEqual(
+                expected[(v.key_figure.name, v.key_figure_date)], v.value, places=9
+            )
+
+        state = updater.get_state("EQ_US")
+        self.assertEqual(date_to, state.date_)
+        self.assertAlmostEqual(
+            rfg.return_1D_cumulative_series("EQ_US", date(2024, 4, 1), date_to)[-1][1],
+            state.cumulative_return,
+        )
+        self.assertEqual(
+            state.to_row(), RollingKeyFigureState.from_row(state.to_row()).to_row()
+        )
+
+    def test_advance_all(self):
+        updater = EndOfDayUpdater(RiskDbAccessor(self.db_path))
+        with self.assertRaises(ValueError):
+            updater.advance("EQ_US", date(2024, 5, 1))
+        updater.initialize("EQ_US", date(2024, 5, 1))
+        updated = updater.advance_all(date(2024, 5, 2))
+        self.assertEqual(3, len(updated["EQ_US"]))
+        self.assertEqual(3, len(updated["FI_SWE"]))
+        for name in ["EQ_US", "EQ_SWE", "FI_US", "FI_SWE"]:
+            self.assertEqual(date(2024, 5, 2), updater.get_state(name).date_)
+
+    def test_advance_calendar(self):
+        calendar = TradingCalendar.for_market("SE")
+        # 2024-04-01 is Easter Monday and 2024-04-06/07 a weekend.
+        dates = [date(2024, 4, 2), date(2024, 4, 3), date(2024, 4, 4), date(2024, 4, 5)]
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path), calendar=calendar)
+        expected = {
+            (v.key_figure.name, v.key_figure_date): v.value
+            for v in [
+                *rfg.return_1D_for_portfolio_and_date_range(
+                    "EQ_SWE", dates[0], dates[-1]
+                ),
+                *rfg.volatility_3M_ann_for_portfolio_and_date_range(
+                    "EQ_SWE", dates[0], dates[-1]
+                ),
+            ]
+        }
+        self.assertEqual(8, len(expected))
+
+        # A state initialized with another calendar is rebuilt before advancing.
+        for initialize_calendar in [calendar, None]:
+            with self.subTest(initialize_calendar=initialize_calendar):
+                shutil.copyfile("./db/alecta_case_db.db", self.db_path)
+                EndOfDayUpdater(
+                    RiskDbAccessor(self.db_path), calendar=initialize_calendar
+                ).initialize("EQ_SWE", date(2024, 3, 31))
+                updater = EndOfDayUpdater(
+                    RiskDbAccessor(self.db_path), calendar=calendar
+                )
+                values = updater.advance("EQ_SWE", date(2024, 4, 7))
+                self.assertEqual(dates, sorted({v.key_figure_date for v in values}))
+                state = updater.get_state("EQ_SWE")
+                self.assertEqual(date(2024, 4, 5), state.date_)
+                self.assertEqual(rfg.settings_key, state.settings)
+                for v in values:
+                    if v.key_figure.name != "Market value":
+                        self.assertAlmostEqual(
+                            expected[(v.key_figure.name, v.key_figure_date)],
+                            v.value,
+                            places=9,
+                        )
+
+
+class CovarianceRiskEngineTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the CovarianceRiskEngine class."""
+
+    def test_compute(self):
+        db = RiskDbAccessor(self.db_path)
+        date_ = date(2024, 5, 31)
+        result = CovarianceRiskEngine(db).compute(date_, store=False)
+        self.assertEqual([], result.excluded_instruments)
+        self.assertEqual([], result.skipped_portfolios)
+
+        with db:
+            nvidia, volvo = db.get_instrument(1), db.get_instrument(2)
+            eq_swe = db.get_portfolio_from_name("EQ_SWE")
+            prices = {
+                i.id_: [
+                    row[3]
+                    for row in db.get_price_rows(
+                        instrument=i, date_from=date(2024, 3, 2), date_to=date_
+                    )
+                ]
+                for i in [nvidia, volvo]
+            }
+        log_returns = {
+            id_: [math.log(b / a) for a, b in zip(p, p[1:])]
+            for id_, p in prices.items()
+        }
+        self.assertEqual(90, len(log_returns[1]))
+        self.assertAlmostEqual(
+            statistics.stdev(log_returns[2]) * math.sqrt(365),
+            result.volatilities[volvo.id_],
+        )
+        self.assertAlmostEqual(
+            statistics.covariance(log_returns[1], log_returns[2]) * 365,
+            result.covariance_of(nvidia, volvo),
+        )
+        self.assertEqual(
+            result.covariance_of(nvidia, volvo), result.covariance_of(volvo, nvidia)
+        )
+
+        # A portfolio holding a single instrument has the risk of the instrument.
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        volatility = result.portfolio_volatilities[eq_swe.id_]
+        self.assertAlmostEqual(result.volatilities[volvo.id_], volatility)
+        self.assertAlmostEqual(
+            result.marginal_risks[eq_swe.id_][volvo.id_], volatility
+        )
+        self.assertAlmostEqual(
+            rfg.volatility_3M_ann_for_portfolio_and_date("EQ_SWE", date_).value,
+            volatility,
+        )
+        for id_, components in result.component_risks.items():
+            self.assertAlmostEqual(
+                result.portfolio_volatilities[id_], math.fsum(components.values())
+            )
+
+        summary = result.summary()
+        self.assertEqual(volatility, summary["portfolio_volatilities"]["EQ_SWE"])
+        self.assertEqual(
+            result.volatilities[volvo.id_], summary["volatilities"]["Volvo"]
+        )
+        self.assertEqual(
+            ["EQ_SWE", "EQ_US", "FI_SWE", "FI_US"],
+            sorted(summary["component_risks"]),
+        )
+
+    def test_store(self):
+        db = RiskDbAccessor(self.db_path)
+        date_ = date(2024, 5, 31)
+        # Stored figures computed with other settings are deleted.
+        RiskFigureGenerator(
+            db, calendar=TradingCalendar.for_market("US")
+        ).market_value_for_portfolio_and_date("EQ_US", date(2024, 5, 1))
+        engine = CovarianceRiskEngine(db)
+        result = engine.compute(date_)
+        with db:
+            instrument_type = db.get_key_figure_ref_type_from_name("Instrument")
+            volatilities = {
+                v.reference_entity.id_: v.value
+                for v in db.iter_key_figure_values(
+                    key_figure_ref_type=instrument_type, date_from=date_
+                )
+            }
+            components = {}
+            for v in db.iter_key_figure_values(
+                key_figure=db.get_key_figure_from_name("Component risk (3M, ann.)")
+            ):
+                id_ = v.reference_entity.portfolio.id_
+                components[id_] = components.get(id_, 0.0) + v.value
+            portfolio_volatility = db.get_key_figure_from_name(
+                "Volatility (3M, ann., covariance)"
+            )
+            eq_us = db.get_portfolio_from_name("EQ_US")
+            stored = list(
+                db.iter_key_figure_values(
+                    key_figure=portfolio_volatility, reference_entity=eq_us
+                )
+            )
+            market_values = list(
+                db.iter_key_figure_values(
+                    key_figure=db.get_key_figure_from_name("Market value"),
+                    reference_entity=eq_us,
+                    date_from=date(2024, 5, 1),
+                    date_to=date(2024, 5, 1),
+                )
+            )
+            self.assertEqual(engine.settings_key, db.get_key_figure_settings(eq_us))
+        self.assertEqual(result.volatilities, volatilities)
+        self.assertEqual(1, len(stored))
+        self.assertAlmostEqual(
+            result.portfolio_volatilities[eq_us.id_], stored[0].value
+        )
+        self.assertEqual([], market_values)
+        for id_, volatility in result.portfolio_volatilities.items():
+            self.assertAlmostEqual(volatility, components[id_])
+
+
+class BatchRiskReportTestCase(TemporaryDbTestCase):
+    """Contains unit tests for the BatchRiskReport class."""
+
+    def test_generate(self):
+        key_figures = ["Market value", "Return (1D)", "Volatility (3M, ann.)"]
+        batch = BatchRiskReport.for_all_portfolios(
+            date(2024, 4, 1),
+            date(2024, 4, 30),
+            key_figures,
+            max_workers=2,
+            db_path=self.db_path,
+        )
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            db.delete_key_figure_values()
+        result = batch.generate()
+        self.assertEqual({"EQ_US", "EQ_SWE", "FI_US", "FI_SWE"}, set(result.reports))
+        self.assertEqual(set(result.reports), set(result.timings))
+        self.assertGreater(result.throughput, 0.0)
+        with RiskDbAccessor(self.db_path) as db:
+            self.assertGreater(len(db.get_key_figure_values()), 0)
+
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        expected = RiskReport(
+            RiskReportSettings(
+                "FI_US", date(2024, 4, 1), date(2024, 4, 30), key_figures
+            ),
+            risk_figure_generator=rfg,
+        ).generate()
+        self.assertEqual(expected, result.reports["FI_US"])
+
+    def test_generate_read_through(self):
+        key_figures = ["Market value", "Return (1D)"]
+        batch = BatchRiskReport.for_all_portfolios(
+            date(2024, 4, 1),
+            date(2024, 4, 30),
+            key_figures,
+            max_workers=2,
+            read_through=True,
+            db_path=self.db_path,
+        )
+        batch.generate()
+        db: RiskDbAccessor
+        with RiskDbAccessor(self.db_path) as db:
+            db._db_accessor.execute_query(
+                "update Prices set price = price * 2 where instrument_id = 2;"
+            )
+        result = batch.generate()
+        rfg = RiskFigureGenerator(RiskDbAccessor(self.db_path))
+        for name in ["EQ_US", "EQ_SWE", "FI_US", "FI_SWE"]:
+            # Stored values were validated by the calling process.
+            self.assertFalse(rfg.validate_key_figure_values(name))
+
+        expected = RiskReport(
+            RiskReportSettings(
+                "EQ_SWE", date(2024, 4, 1), date(2024, 4, 30), key_figures
+            ),
+            risk_figure_generator=rfg,
+        ).generate()
+        self.assertEqual(expected, result.reports["EQ_SWE"])
+
+
+class RollingStatisticsTestCase(unittest.TestCase):
+    """Contains unit tests for the RollingStatistics class."""
+
+    def test_sliding_window(self):
+        rng = random.Random(1)
+        values = [rng.gauss(0.0, 0.01) for _ in range(500)]
+        stats = RollingStatistics()
+        for i, value in enumerate(values):
+            stats.add(value)
+            if i >= 90:
+                stats.remove(values[i - 90])
+            if i >= 89:
+                window = values[i - 89 : i + 1]
+                self.assertAlmostEqual(statistics.stdev(window), stats.stdev(), 15)
+                self.assertAlmostEqual(statistics.mean(window), stats.mean, 15)
+
+
+class IdentityMapTestCase(unittest.TestCase):
+    """Contains unit tests for the IdentityMap class."""
+
+    def test_ttl(self):
+        now = [0.0]
+        loads = []
+
+        def loader():
+            loads.append(now[0])
+            return [Portfolio(1, "EQ_US"), Portfolio(2, f"EQ_SWE_{len(loads)}")]
+
+        identity_map = IdentityMap(ttl=10.0, clock=lambda: now[0])
+        identity_map.load(Portfolio, loader)
+        portfolio = identity_map.get(Portfolio, 2)
+        now[0] = 5.0
+        identity_map.load(Portfolio, loader)
+        self.assertEqual(1, len(loads))
+        now[0] = 10.0
+        identity_map.load(Portfolio, loader)
+        self.assertEqual(2, len(loads))
+        self.assertIs(portfolio, identity_map.get(Portfolio, 2))
+        self.assertEqual("EQ_SWE_2", portfolio.name)
+        self.assertIs(portfolio, identity_map.get_from_name(Portfolio, "EQ_SWE_2"))
+        self.assertIsNone(identity_map.get_from_name(Portfolio, "EQ_SWE_1"))
+
+
 if __name__ == "__main__":
     unittest.main()